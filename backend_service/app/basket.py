@@ -0,0 +1,253 @@
+from collections import Counter
+from typing import Iterable
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.dispatch import Signal
+from django.utils import timezone
+
+from app import order_totals
+from app.models import MAX_ITEM_QUANTITY, Order, OrderItem, ProductInfo
+
+
+# Остатки товаров изменены запросом UPDATE, который минует сигналы моделей
+stock_changed = Signal()
+
+
+class OutOfStock(Exception):
+    """Товаров заказа не хватает на складе"""
+
+    def __init__(self, product_info_ids: list[int]):
+        super().__init__(product_info_ids)
+        self.product_info_ids = product_info_ids
+
+
+def add_items(order_id: int, quantities: dict[int, int]) -> set[int]:
+    """
+    Добавляет в заказ товары {id ProductInfo: количество} одним запросом
+    INSERT ... ON CONFLICT: количество уже лежащих в заказе товаров увеличивается.
+    Позиции, у которых сумма превысила бы MAX_ITEM_QUANTITY, не изменяются;
+    возвращаются id их товаров, откатить остальные изменения должен вызывающий код.
+    """
+
+    if not quantities:
+        return set()
+    # Условие ON CONFLICT проверяет только сложение с позицией в заказе, новую строку
+    # со сложенным количеством повторов из запроса нужно проверить до вставки
+    exceeded = {product_info_id for product_info_id, quantity in quantities.items() if quantity > MAX_ITEM_QUANTITY}
+    if exceeded:
+        return exceeded
+    table = connection.ops.quote_name(OrderItem._meta.db_table)
+    # Запрос минует pre_save, поэтому auto_now проставляется здесь
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = ", ".join(["(%s, %s, %s, %s)"] * len(quantities))
+    params = [value for product_info_id, quantity in quantities.items() for value in (
+        order_id, product_info_id, quantity, now
+    )]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (order_id, product_info_id, quantity, updated_at) VALUES {rows} "
+            f"ON CONFLICT (order_id, product_info_id) DO UPDATE SET "
+            f"quantity = {table}.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at "
+            f"WHERE {table}.quantity + EXCLUDED.quantity <= %s "
+            f"RETURNING product_info_id",
+            [*params, MAX_ITEM_QUANTITY]
+        )
+        saved = {product_info_id for product_info_id, in cursor.fetchall()}
+    order_totals.refresh([order_id])
+    return quantities.keys() - saved
+
+
+def _own_lines(user_id: int, ids: Iterable[int]) -> dict[int, int]:
+    """
+    Позиции корзины пользователя среди ids: {id позиции: id заказа}. Строки
+    блокируются до конца транзакции, чтобы их не изменил параллельный запрос.
+    """
+
+    return dict(OrderItem.objects.select_for_update(of=("self",)).filter(
+        id__in=list(ids), order__user_id=user_id, order__state="basket"
+    ).values_list("id", "order_id"))
+
+
+def update_items(user_id: int, quantities: dict[int, int]) -> tuple[list[int], list[int]]:
+    """
+    Задает количество позициям корзины {id позиции: количество} одним UPDATE ... CASE.
+    Возвращает id измененных позиций и id позиций, которых нет в корзине пользователя.
+    Вызывается в транзакции.
+    """
+
+    own = _own_lines(user_id, quantities)
+    now = timezone.now()
+    # bulk_update минует pre_save, поэтому auto_now проставляется здесь
+    OrderItem.objects.bulk_update(
+        [OrderItem(id=line_id, quantity=quantities[line_id], updated_at=now) for line_id in own],
+        ["quantity", "updated_at"]
+    )
+    order_totals.refresh(own.values())
+    return sorted(own), sorted(quantities.keys() - own.keys())
+
+
+def delete_items(user_id: int, ids: Iterable[int]) -> tuple[list[int], list[int]]:
+    """
+    Удаляет позиции корзины одним DELETE. Возвращает id удаленных позиций
+    и id позиций, которых нет в корзине пользователя. Вызывается в транзакции.
+    """
+
+    ids = set(ids)
+    own = _own_lines(user_id, ids)
+    OrderItem.objects.filter(id__in=list(own)).delete()
+    order_totals.refresh(own.values())
+    return sorted(own), sorted(ids - own.keys())
+
+
+def _order_quantities(order_id: int) -> dict[int, int]:
+    """Количество товаров заказа {id ProductInfo: количество} в порядке id товаров"""
+
+    return dict(OrderItem.objects.filter(order_id=order_id).order_by("product_info_id").values_list(
+        "product_info_id", "quantity"
+    ))
+
+
+def _lock_stock(product_info_ids: Iterable[int]) -> dict[int, int]:
+    """
+    Блокирует строки товаров до конца транзакции и возвращает их остатки.
+    Блокировки берутся в порядке id, поэтому параллельные заказы с общими
+    товарами ждут друг друга, а не взаимоблокируются.
+    """
+
+    return dict(ProductInfo.objects.select_for_update().filter(id__in=list(product_info_ids)).order_by(
+        "id"
+    ).values_list("id", "quantity"))
+
+
+def _per_item(quantities: dict[int, int]) -> Case:
+    return Case(
+        *(When(id=product_info_id, then=Value(quantity)) for product_info_id, quantity in quantities.items()),
+        output_field=IntegerField()
+    )
+
+
+def _send_stock_changed(product_info_ids: Iterable[int]) -> None:
+    """
+    Отправляет stock_changed после фиксации транзакции: обновление каталога,
+    статистики категорий и кэша не удлиняет блокировки строк товаров
+    """
+
+    product_info_ids = list(product_info_ids)
+    transaction.on_commit(lambda: stock_changed.send(sender=ProductInfo, product_info_ids=product_info_ids))
+
+
+def reserve_stock(quantities: dict[int, int]) -> None:
+    """
+    Списывает со склада товары заказа {id ProductInfo: количество} одним
+    UPDATE ... SET quantity = quantity - n WHERE quantity >= n. Если товара
+    не хватает, вызывает OutOfStock; откатить транзакцию должен вызывающий код.
+    """
+
+    stock = _lock_stock(quantities)
+    short = [
+        product_info_id for product_info_id, quantity in quantities.items()
+        if stock.get(product_info_id, 0) < quantity
+    ]
+    if short:
+        raise OutOfStock(short)
+    requested = _per_item(quantities)
+    # Условие в WHERE защищает остаток и там, где СУБД не поддерживает блокировку строк
+    reserved = ProductInfo.objects.filter(id__in=list(quantities), quantity__gte=requested).update(
+        quantity=F("quantity") - requested, updated_at=timezone.now()
+    )
+    if reserved < len(quantities):
+        raise OutOfStock(list(quantities))
+
+
+def release_stock(quantities: dict[int, int]) -> None:
+    """Возвращает на склад товары заказа {id ProductInfo: количество} одним UPDATE"""
+
+    _lock_stock(quantities)
+    returned = _per_item(quantities)
+    ProductInfo.objects.filter(id__in=list(quantities)).update(
+        quantity=F("quantity") + returned, updated_at=timezone.now()
+    )
+
+
+def checkout(user_id: int, basket_id: int, contact_id: int) -> bool:
+    """
+    Оформляет корзину пользователя: списывает товары со склада и переводит
+    заказ в статус new в одной транзакции. Возвращает False, если корзины нет;
+    при нехватке товара вызывает OutOfStock, изменения откатываются.
+    """
+
+    with transaction.atomic():
+        # Блокировка корзины: повторное оформление той же корзины ждет и не находит ее
+        if not Order.objects.select_for_update().filter(
+            id=basket_id, user_id=user_id, state="basket"
+        ).values_list("id", flat=True):
+            return False
+        quantities = _order_quantities(basket_id)
+        if quantities:
+            reserve_stock(quantities)
+        # update минует auto_now
+        Order.objects.filter(id=basket_id).update(state="new", contact_id=contact_id, updated_at=timezone.now())
+        if quantities:
+            _send_stock_changed(quantities)
+    return True
+
+
+def change_quantities(order_id: int, quantities: dict[int, int]) -> None:
+    """
+    Задает количество позициям заказа {id позиции: количество}. Резерв
+    оформленного заказа меняется на разницу количеств в той же транзакции:
+    добавленное списывается со склада (OutOfStock, если не хватает),
+    убранное возвращается. У корзины и отмененного заказа резерва нет.
+    """
+
+    with transaction.atomic():
+        # Блокировка заказа упорядочивает изменение позиций с оформлением и отменой
+        state = Order.objects.select_for_update().filter(id=order_id).values_list("state", flat=True).first()
+        lines = {
+            line_id: (product_info_id, quantity)
+            for line_id, product_info_id, quantity in OrderItem.objects.select_for_update().filter(
+                order_id=order_id, id__in=list(quantities)
+            ).values_list("id", "product_info_id", "quantity")
+        }
+        if state not in (None, "basket", "canceled"):
+            delta = Counter()
+            for line_id, (product_info_id, quantity) in lines.items():
+                delta[product_info_id] += quantities[line_id] - quantity
+            # Все строки товаров блокируются сразу в порядке id
+            _lock_stock(delta)
+            taken = {product_info_id: change for product_info_id, change in delta.items() if change > 0}
+            returned = {product_info_id: -change for product_info_id, change in delta.items() if change < 0}
+            if taken:
+                reserve_stock(taken)
+            if returned:
+                release_stock(returned)
+            if taken or returned:
+                _send_stock_changed([*taken, *returned])
+
+        now = timezone.now()
+        # bulk_update минует pre_save, поэтому auto_now проставляется здесь
+        OrderItem.objects.bulk_update(
+            [OrderItem(id=line_id, quantity=quantities[line_id], updated_at=now) for line_id in lines],
+            ["quantity", "updated_at"]
+        )
+        order_totals.refresh([order_id])
+
+
+def cancel(order_id: int) -> bool:
+    """
+    Отменяет заказ и возвращает его товары на склад. Условный UPDATE статуса
+    не дает вернуть товары дважды; False - заказ уже отменен или это корзина.
+    """
+
+    with transaction.atomic():
+        canceled = Order.objects.filter(id=order_id).exclude(state__in=("basket", "canceled")).update(
+            state="canceled", updated_at=timezone.now()
+        )
+        if not canceled:
+            return False
+        quantities = _order_quantities(order_id)
+        if quantities:
+            release_stock(quantities)
+            _send_stock_changed(quantities)
+    return True
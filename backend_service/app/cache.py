@@ -0,0 +1,184 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from app.models import CacheVersion, Shop
+
+
+PREFIX = "catalog"
+# Магазины, категории и все, что от них зависит
+GLOBAL_VERSION = f"{PREFIX}:version"
+# Товары всех магазинов
+PRODUCTS_VERSION = f"{PREFIX}:version:products"
+CACHE_VIEWS = ("products", "categories", "shops")
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def shop_version(shop_id: int) -> str:
+    """Ключ версии товаров магазина"""
+
+    return f"{PREFIX}:version:shop:{shop_id}"
+
+
+def _incr(keys: tuple[str, ...]) -> None:
+    # По одной строке в отдельном запросе: строки версий не блокируются надолго и не взаимоблокируются
+    for key in sorted(keys):
+        if not CacheVersion.objects.filter(key=key).update(version=F("version") + 1):
+            # Версии еще нет: начальное значение по времени не совпадает с прежними версиями
+            CacheVersion.objects.bulk_create([CacheVersion(key=key, version=time.time_ns())], ignore_conflicts=True)
+
+
+def _bump(*keys: str) -> None:
+    """
+    Увеличивает версии после фиксации транзакции: ответ, прочитанный другим
+    запросом до фиксации, остается под старой версией, а строки версий
+    не блокируются на время долгой транзакции (импорта).
+    """
+
+    transaction.on_commit(lambda: _incr(keys))
+
+
+def bump_global() -> None:
+    """Сбрасывает все закэшированные ответы каталога"""
+
+    _bump(GLOBAL_VERSION)
+
+
+def bump_shop(shop_id: int | None = None) -> None:
+    """Сбрасывает ответы со списком товаров магазина (или всех магазинов, если он неизвестен)"""
+
+    if shop_id is None:
+        _bump(PRODUCTS_VERSION)
+    else:
+        _bump(PRODUCTS_VERSION, shop_version(shop_id))
+
+
+def get_versions(keys: list[str]) -> list[int]:
+    """Текущие версии; отсутствующие создаются с начальным значением по времени"""
+
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list("key", "version"))
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(key=key, version=time.time_ns()) for key in missing], ignore_conflicts=True
+        )
+        versions.update(CacheVersion.objects.filter(key__in=missing).values_list("key", "version"))
+    return [versions[key] for key in keys]
+
+
+def shop_ids(name: str, global_version: int) -> list[int]:
+    """
+    id магазинов с названием name. Хранятся в кэше под глобальной версией,
+    которая меняется при любом изменении магазинов.
+    """
+
+    cache = get_cache()
+    key = f"{PREFIX}:shop-ids:{global_version}:{hashlib.md5(name.encode()).hexdigest()}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(Shop.objects.filter(name=name).order_by("id").values_list("id", flat=True))
+        cache.set(key, ids, settings.CATALOG_CACHE_TIMEOUT)
+    return ids
+
+
+def normalized_query(request: Request, exclude: tuple[str, ...] = ()) -> str:
+    """Строка запроса с отсортированными параметрами, без пустых значений и параметров exclude"""
+
+    params = []
+    for key, values in sorted(request.query_params.lists()):
+        if key not in exclude:
+            params.extend((key, value) for value in sorted(values) if value != "")
+    return urlencode(params)
+
+
+def get_or_set(name: str, query: str, versions: list[int], default):
+    """
+    Значение, закэшированное под строкой запроса query и версиями versions;
+    при промахе вычисляется функцией default
+    """
+
+    cache = get_cache()
+    key = f"{PREFIX}:{name}:{hashlib.md5(query.encode()).hexdigest()}:" + ":".join(str(version) for version in versions)
+    value = cache.get(key)
+    if value is None:
+        value = default()
+        cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def record(view: str, result: str) -> None:
+    """Увеличивает счетчик попаданий (hits) или промахов (misses) кэша"""
+
+    cache = get_cache()
+    key = f"{PREFIX}:stats:{view}:{result}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    """Число попаданий и промахов кэша по представлениям"""
+
+    keys = [f"{PREFIX}:stats:{view}:{result}" for view in CACHE_VIEWS for result in ("hits", "misses")]
+    values = get_cache().get_many(keys)
+    return {
+        view: {result: values.get(f"{PREFIX}:stats:{view}:{result}", 0) for result in ("hits", "misses")}
+        for view in CACHE_VIEWS
+    }
+
+
+def reset_stats() -> None:
+    get_cache().delete_many(
+        [f"{PREFIX}:stats:{view}:{result}" for view in CACHE_VIEWS for result in ("hits", "misses")]
+    )
+
+
+class CachedListMixin:
+    """
+    Кэширование ответа GET списка. Ключ - адрес, нормализованная строка запроса
+    и версии, от которых зависит ответ (get_cache_versions). Изменение данных
+    увеличивает версию, поэтому устаревшие ответы больше не читаются и
+    удаляются кэшем по истечении CATALOG_CACHE_TIMEOUT. Ответ не зависит от
+    пользователя: проверка прав выполняется до обращения к кэшу.
+    """
+
+    cache_name = None
+
+    def get_cache_versions(self, request: Request) -> list[str]:
+        return [GLOBAL_VERSION]
+
+    def get(self, request: Request, *args, **kwargs):
+        versions = get_versions(self.get_cache_versions(request))
+        # Версии доступны представлению для кэширования частей ответа
+        self.cache_versions = versions
+        address = f"{request.build_absolute_uri(request.path)}?{normalized_query(request)}"
+        key = f"{PREFIX}:response:{self.cache_name}:{hashlib.md5(address.encode()).hexdigest()}:" + ":".join(
+            str(version) for version in versions
+        )
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            record(self.cache_name, "hits")
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        record(self.cache_name, "misses")
+        response["X-Cache"] = "MISS"
+        return response
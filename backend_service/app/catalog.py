@@ -0,0 +1,151 @@
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+from django.db.models import F, Prefetch, QuerySet, Window
+from django.db.models.functions import RowNumber
+
+from app.fast_serializers import FastSerializer
+from app.models import CatalogEntry, ProductInfo, ProductParameter, Shop
+from app.serializers import ProductInfoSerializer, ShopSerializer
+
+
+CATALOG_BATCH_SIZE = 500
+ENTRY_FIELDS = [
+    "shop", "product", "shop_name", "shop_state", "product_name", "price", "quantity", "document", "shop_document"
+]
+PRODUCT_INFO_SERIALIZER = FastSerializer(ProductInfoSerializer)
+
+
+def product_info_queryset():
+    """
+    ProductInfo с товаром, магазином и параметрами: фиксированное число
+    запросов независимо от количества строк
+    """
+
+    return ProductInfo.objects.select_related("product", "shop").prefetch_related(
+        # Порядок параметров по id: без него сортировка ProductParameter добавила бы соединение с товаром
+        Prefetch("product_parameters", queryset=ProductParameter.objects.order_by("id"))
+    )
+
+
+def _entry(document: dict) -> CatalogEntry:
+    """Строка каталога по карточке товара в формате ProductInfoSerializer"""
+
+    document = dict(document)
+    shop_document = document["shop"]
+    document["shop"] = None
+    return CatalogEntry(
+        product_info_id=document["id"],
+        shop_id=shop_document["id"],
+        product_id=document["product"]["id"],
+        shop_name=shop_document["name"],
+        shop_state=shop_document["state"],
+        product_name=document["product"]["name"],
+        price=Decimal(document["price"]),
+        quantity=document["quantity"],
+        document=document,
+        shop_document=shop_document
+    )
+
+
+def render(queryset: QuerySet) -> list[CatalogEntry]:
+    """Строки каталога для ProductInfo выборки (быстрая сериализация из .values())"""
+
+    return [_entry(document) for document in PRODUCT_INFO_SERIALIZER.serialize(queryset)]
+
+
+def best_offers(product_ids: Iterable[int] | None = None) -> QuerySet:
+    """
+    id лучших предложений: самое дешевое (при равной цене - первое по id) предложение
+    открытого магазина с ненулевым остатком для каждого товара. Выбирается в базе
+    оконной функцией по индексу catalog_offer_price_idx.
+    """
+
+    offers = CatalogEntry.objects.filter(shop_state=True, quantity__gt=0)
+    if product_ids is not None:
+        offers = offers.filter(product_id__in=product_ids)
+    return offers.annotate(
+        offer_rank=Window(RowNumber(), partition_by=F("product"), order_by=[F("price").asc(), F("pk").asc()])
+    ).filter(offer_rank=1).values("pk")
+
+
+def refresh_best(product_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает отметку лучшего предложения у указанных товаров.
+    Изменяются только строки, отметка которых действительно поменялась.
+    """
+
+    ids = sorted(set(product_ids))
+    for start in range(0, len(ids), CATALOG_BATCH_SIZE):
+        batch = ids[start:start + CATALOG_BATCH_SIZE]
+        best = best_offers(batch)
+        CatalogEntry.objects.filter(product_id__in=batch, best=True).exclude(pk__in=best).update(best=False)
+        CatalogEntry.objects.filter(pk__in=best, best=False).update(best=True)
+
+
+def refresh(product_info_ids: Iterable[int]) -> None:
+    """Пересобирает строки каталога указанных ProductInfo и лучшие предложения их товаров"""
+
+    ids = list(product_info_ids)
+    product_ids = set()
+    for start in range(0, len(ids), CATALOG_BATCH_SIZE):
+        entries = render(ProductInfo.objects.filter(id__in=ids[start:start + CATALOG_BATCH_SIZE]).order_by("id"))
+        CatalogEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["product_info"],
+            update_fields=ENTRY_FIELDS
+        )
+        product_ids.update(entry.product_id for entry in entries)
+    refresh_best(product_ids)
+
+
+def refresh_shop(shop: Shop) -> None:
+    """Переносит изменения магазина во все его строки каталога одним запросом"""
+
+    entries = CatalogEntry.objects.filter(shop=shop)
+    # Лучшие предложения зависят только от статуса магазина
+    state_changed = entries.exclude(shop_state=shop.state).exists()
+    entries.update(shop_name=shop.name, shop_state=shop.state, shop_document=ShopSerializer(shop).data)
+    if state_changed:
+        refresh_best(entries.values_list("product_id", flat=True))
+
+
+def rebuild() -> None:
+    """Пересобирает каталог целиком"""
+
+    CatalogEntry.objects.all().delete()
+    last_id = 0
+    while True:
+        entries = render(ProductInfo.objects.filter(id__gt=last_id).order_by("id")[:CATALOG_BATCH_SIZE])
+        if not entries:
+            break
+        CatalogEntry.objects.bulk_create(entries)
+        last_id = entries[-1].pk
+    CatalogEntry.objects.filter(pk__in=best_offers()).update(best=True)
+
+
+def inconsistent_entries() -> Iterator[int]:
+    """
+    id ProductInfo, строка каталога которых не совпадает с нормализованными таблицами.
+    Ожидаемые строки строятся обычным ProductInfoSerializer, поэтому проверяется
+    и быстрая сериализация. Отметка лучшего предложения сверяется с best_offers.
+    """
+
+    fields = [CatalogEntry._meta.get_field(field).attname for field in ENTRY_FIELDS]
+    last_id = 0
+    while True:
+        product_infos = list(product_info_queryset().filter(id__gt=last_id).order_by("id")[:CATALOG_BATCH_SIZE])
+        if not product_infos:
+            break
+        stored = CatalogEntry.objects.in_bulk([product_info.id for product_info in product_infos])
+        best = set(best_offers({product_info.product_id for product_info in product_infos}).values_list(
+            "pk", flat=True
+        ))
+        for expected in map(_entry, ProductInfoSerializer(product_infos, many=True).data):
+            entry = stored.get(expected.pk)
+            if entry is None or entry.best != (expected.pk in best) or any(
+                getattr(entry, field) != getattr(expected, field) for field in fields
+            ):
+                yield expected.pk
+        last_id = product_infos[-1].id
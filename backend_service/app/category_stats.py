@@ -0,0 +1,97 @@
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+from django.db.models import Count, F, Max, Min
+
+from app.models import Category, CategoryStats, Product, ProductInfo
+
+
+STATS_BATCH_SIZE = 500
+STATS_FIELDS = ["product_count", "shop_count", "price_min", "price_max"]
+
+
+def compute(category_ids: Iterable[int]) -> dict[int, dict]:
+    """
+    Агрегаты категорий по предложениям открытых магазинов в наличии одним запросом:
+    {id категории: значения STATS_FIELDS}. Категории без предложений в результат не входят.
+    """
+
+    rows = ProductInfo.objects.filter(
+        product__categories__in=list(category_ids), shop__state=True, quantity__gt=0
+    ).values(category=F("product__categories")).annotate(
+        product_count=Count("product", distinct=True),
+        shop_count=Count("shop", distinct=True),
+        price_min=Min("price"),
+        price_max=Max("price")
+    ).order_by()
+    return {row.pop("category"): row for row in rows}
+
+
+def refresh(category_ids: Iterable[int | None]) -> None:
+    """
+    Пересчитывает статистику указанных категорий. Минимальную и максимальную цену
+    нельзя поддерживать приращениями (удаление крайней цены требует пересчета),
+    поэтому агрегаты затронутых категорий считаются заново.
+    """
+
+    ids = sorted({category_id for category_id in category_ids if category_id is not None})
+    for start in range(0, len(ids), STATS_BATCH_SIZE):
+        batch = ids[start:start + STATS_BATCH_SIZE]
+        values = compute(batch)
+        CategoryStats.objects.bulk_create(
+            [
+                CategoryStats(category_id=category_id, **values.get(category_id, {}))
+                # Удаленные категории пропускаются
+                for category_id in Category.objects.filter(id__in=batch).values_list("id", flat=True)
+            ],
+            update_conflicts=True,
+            unique_fields=["category"],
+            update_fields=STATS_FIELDS
+        )
+
+
+def stats_key(product_id: int, shop_id: int, quantity: int, price: Decimal) -> tuple:
+    """Значения полей предложения, от которых зависит статистика его категории"""
+
+    return product_id, shop_id, quantity > 0, price
+
+
+def refresh_products(product_ids: Iterable[int]) -> None:
+    """Пересчитывает статистику категорий указанных товаров"""
+
+    refresh(Product.objects.filter(id__in=list(product_ids)).values_list("categories_id", flat=True))
+
+
+def shop_categories(shop_id: int) -> set[int]:
+    """Категории товаров магазина и категории, к которым магазин привязан импортом"""
+
+    return set(
+        ProductInfo.objects.filter(shop_id=shop_id).values_list("product__categories", flat=True).distinct()
+    ) | set(Category.shops.through.objects.filter(shop_id=shop_id).values_list("category_id", flat=True))
+
+
+def refresh_shop(shop_id: int) -> None:
+    """Пересчитывает статистику категорий магазина (после импорта и изменения статуса)"""
+
+    refresh(shop_categories(shop_id))
+
+
+def rebuild() -> None:
+    """Пересчитывает статистику всех категорий"""
+
+    refresh(Category.objects.values_list("id", flat=True))
+
+
+def inconsistent_stats() -> Iterator[int]:
+    """id категорий, статистика которых не совпадает с товарами"""
+
+    ids = list(Category.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), STATS_BATCH_SIZE):
+        batch = ids[start:start + STATS_BATCH_SIZE]
+        values = compute(batch)
+        stored = CategoryStats.objects.in_bulk(batch)
+        for category_id in batch:
+            expected = CategoryStats(category_id=category_id, **values.get(category_id, {}))
+            stats = stored.get(category_id)
+            if stats is None or any(getattr(stats, field) != getattr(expected, field) for field in STATS_FIELDS):
+                yield category_id
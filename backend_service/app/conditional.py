@@ -0,0 +1,89 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.request import Request
+
+from app.cache import normalized_query
+from app.models import ProductInfo, Shop
+
+
+def catalog_watermark(shop: str | None = None) -> tuple[list, datetime | None]:
+    """
+    Отметка изменений каталога: id, время изменения и время последнего изменения
+    товаров каждого открытого магазина (или магазинов с названием shop).
+    Время товаров берется из индекса (shop, updated_at), по одной строке на магазин.
+    """
+
+    shops = Shop.objects.filter(state=True)
+    if shop:
+        shops = shops.filter(name=shop)
+    rows = list(shops.annotate(
+        products_updated_at=Subquery(
+            ProductInfo.objects.filter(shop=OuterRef("pk")).order_by("-updated_at").values("updated_at")[:1]
+        )
+    ).order_by("id").values_list("id", "updated_at", "products_updated_at"))
+    times = [time for _, *shop_times in rows for time in shop_times if time is not None]
+    return rows, max(times, default=None)
+
+
+def orders_watermark(orders) -> tuple[list, datetime | None]:
+    """
+    Отметка изменений заказов пользователя: время изменения заказов, их позиций,
+    цен товаров в них и контактов доставки, а также число позиций (удаленные позиции).
+    """
+
+    state = orders.order_by().aggregate(
+        orders=Count("id", distinct=True),
+        items=Count("order_items"),
+        orders_updated_at=Max("updated_at"),
+        items_updated_at=Max("order_items__updated_at"),
+        products_updated_at=Max("order_items__product_info__updated_at"),
+        contacts_updated_at=Max("contact__updated_at")
+    )
+    times = [time for key, time in state.items() if key.endswith("_updated_at") and time is not None]
+    return sorted(state.items()), max(times, default=None)
+
+
+def conditional_get(get):
+    """
+    Условный GET для метода get представления: ETag и Last-Modified
+    вычисляются по отметке изменений (метод get_watermark представления),
+    а не по телу ответа. Если заголовки If-None-Match или If-Modified-Since
+    запроса совпадают, возвращается 304 без выборки данных и сериализации.
+    """
+
+    @wraps(get)
+    def wrapper(self, request: Request, *args, **kwargs):
+        state, last_modified = self.get_watermark(request)
+        # Разные страницы и фильтры - разные ответы, поэтому в ETag входит строка запроса
+        etag = quote_etag(hashlib.md5(
+            f"{request.path}?{normalized_query(request)}|{state!r}".encode()
+        ).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = get(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """Условный GET (conditional_get) для обобщенных представлений"""
+
+    def get_watermark(self, request: Request) -> tuple[object, datetime | None]:
+        raise NotImplementedError
+
+    @conditional_get
+    def get(self, request: Request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
@@ -0,0 +1,79 @@
+import csv
+import io
+from itertools import islice
+from typing import Iterator
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from app import fast_json
+from app.fast_serializers import FastSerializer
+from app.formats import CSV_COLUMNS
+from app.models import Parameter
+from app.serializers import ProductInfoUpdateDestroySerializer
+
+
+EXPORT_CHUNK_SIZE = 1000
+# Карточка в том же формате, что и в списке товаров партнера
+PRODUCT_INFO_SERIALIZER = FastSerializer(ProductInfoUpdateDestroySerializer)
+
+
+def _chunks(queryset: QuerySet, *extra: str) -> Iterator[list[tuple[dict, dict]]]:
+    """
+    Пары (строка .values(), карточка товара) пачками по EXPORT_CHUNK_SIZE.
+    Строки читаются курсором на стороне сервера (PostgreSQL), параметры
+    загружаются одним запросом на пачку, поэтому память не зависит от числа товаров.
+    """
+
+    # В транзакции курсор PostgreSQL объявляется без WITH HOLD и отдает строки
+    # сразу, а не после выполнения всего запроса
+    with transaction.atomic():
+        rows = PRODUCT_INFO_SERIALIZER.values(queryset.order_by("id"), *extra).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE
+        )
+        while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+            yield list(zip(chunk, PRODUCT_INFO_SERIALIZER.render(chunk)))
+
+
+def export_ndjson(queryset: QuerySet) -> Iterator[bytes]:
+    """Одна строка - одна карточка товара"""
+
+    for chunk in _chunks(queryset):
+        yield b"".join(fast_json.dumps(item) + b"\n" for _, item in chunk)
+
+
+def export_csv(queryset: QuerySet, parameters: dict[int, str]) -> Iterator[str]:
+    """
+    CSV в формате импорта (см. formats.parse_csv): выгруженный файл можно загрузить обратно.
+    parameters - id и названия параметров для колонок; заголовок отдается до выборки товаров.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([*CSV_COLUMNS, *parameters.values()])
+    yield buffer.getvalue()
+
+    for chunk in _chunks(queryset, "product__categories__name"):
+        buffer.seek(0)
+        buffer.truncate()
+        for row, item in chunk:
+            values = {parameter["parameter"]: parameter["value"] for parameter in item["product_parameters"]}
+            writer.writerow([
+                item["shop"]["name"], row["product__categories__name"], item["product"]["name"],
+                item["product"]["categories"], item["price"], item["price_rrc"], item["quantity"],
+                *(values.get(parameter_id, "") for parameter_id in parameters)
+            ])
+        yield buffer.getvalue()
+
+
+def export_parameters(user) -> dict[int, str]:
+    """
+    Параметры товаров магазина партнера для колонок CSV. Берутся из фасетов,
+    чтобы не просматривать все параметры товаров до начала выгрузки.
+    """
+
+    return dict(
+        Parameter.objects.filter(facets__shop__user=user, facets__count__gt=0).distinct().order_by(
+            "id"
+        ).values_list("id", "name")
+    )
@@ -0,0 +1,104 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, Count, F, Q, QuerySet, Sum, Value, When
+
+from app.models import ParameterFacet, ProductParameter
+
+
+FACET_BATCH_SIZE = 500
+# Сколько самых частых значений каждого параметра выводится в фасетах
+FACET_VALUES_LIMIT = 50
+
+
+def parameter_values(product_info_ids) -> Counter:
+    """Количество товаров по (магазин, параметр, значение) среди указанных ProductInfo"""
+
+    return Counter(
+        ProductParameter.objects.filter(product_info_id__in=list(product_info_ids)).values_list(
+            "product_info__shop_id", "parameter_id", "value"
+        )
+    )
+
+
+def apply_delta(delta: Counter) -> None:
+    """
+    Применяет изменения количества товаров {(магазин, параметр, значение): изменение}
+    к фасетам. Счетчики меняются через F(), поэтому одновременные изменения не теряются.
+    """
+
+    delta = {key: change for key, change in delta.items() if change}
+    if not delta:
+        return
+
+    ParameterFacet.objects.bulk_create(
+        [
+            ParameterFacet(shop_id=shop_id, parameter_id=parameter_id, value=value)
+            for (shop_id, parameter_id, value), change in delta.items() if change > 0
+        ],
+        ignore_conflicts=True,
+        batch_size=FACET_BATCH_SIZE
+    )
+    keys = list(delta)
+    for start in range(0, len(keys), FACET_BATCH_SIZE):
+        batch = keys[start:start + FACET_BATCH_SIZE]
+        conditions = [Q(shop_id=shop_id, parameter_id=parameter_id, value=value) for shop_id, parameter_id, value in batch]
+        ParameterFacet.objects.filter(reduce(or_, conditions)).update(count=F("count") + Case(
+            *(When(condition, then=Value(delta[key])) for condition, key in zip(conditions, batch)),
+            default=Value(0)
+        ))
+    ParameterFacet.objects.filter(count__lte=0).delete()
+
+
+def refresh_shop(shop_id: int) -> None:
+    """Пересчитывает фасеты магазина по его товарам"""
+
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    counts = ProductParameter.objects.filter(product_info__shop_id=shop_id).values(
+        "parameter_id", "value"
+    ).annotate(count=Count("id")).order_by()
+    ParameterFacet.objects.bulk_create(
+        [ParameterFacet(shop_id=shop_id, **row) for row in counts],
+        batch_size=FACET_BATCH_SIZE
+    )
+
+
+def get_facets(
+    queryset: QuerySet,
+    shop: str | None = None,
+    narrowed: bool = False,
+    parameters: str = "product_parameters"
+) -> dict[str, list[dict]]:
+    """
+    Фасеты каталога: {параметр: [{"value": значение, "count": количество}, ...]}.
+
+    Если выборка ограничена только магазином, количества берутся из ParameterFacet.
+    Иначе они считаются только по отобранным товарам, а не по всему каталогу;
+    parameters - путь от модели выборки к ProductParameter.
+    """
+
+    if narrowed:
+        # Группировка в том же запросе, что и фильтры: поиск и фильтры ссылаются на таблицу выборки
+        rows = queryset.order_by().values_list(
+            f"{parameters}__parameter__name", f"{parameters}__value"
+        ).annotate(count=Count("pk")).order_by(
+            f"{parameters}__parameter__name", "-count", f"{parameters}__value"
+        )
+    else:
+        facets = ParameterFacet.objects.filter(shop__state=True)
+        if shop:
+            facets = facets.filter(shop__name=shop)
+        rows = facets.values_list("parameter__name", "value").annotate(count=Sum("count")).order_by(
+            "parameter__name", "-count", "value"
+        )
+
+    result = {}
+    for name, value, count in rows:
+        if name is None:
+            # Товары без параметров
+            continue
+        values = result.setdefault(name, [])
+        if len(values) < FACET_VALUES_LIMIT:
+            values.append({"value": value, "count": count})
+    return result
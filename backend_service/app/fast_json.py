@@ -0,0 +1,64 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Ошибка разбора в обоих вариантах (orjson.JSONDecodeError наследует ее)
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(data, encoder: type[json.JSONEncoder] = DjangoJSONEncoder) -> bytes:
+    """
+    JSON в UTF-8 без пробелов. Через orjson, если он установлен, иначе через json.
+    Даты, время и Decimal преобразуются методом default энкодера, поэтому
+    результат совпадает с энкодером по формату значений.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=encoder().default,
+            # Ключи-числа как в json, даты через энкодер (формат "Z" и миллисекунды Django)
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+    return json.dumps(data, cls=encoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _reject_constant(name: str):
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def loads(data: bytes | str):
+    """
+    Разбор JSON через orjson, если он установлен, иначе через json.
+    NaN и Infinity не принимаются в обоих вариантах.
+    """
+
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data, parse_constant=_reject_constant)
+
+
+class JsonResponse(HttpResponse):
+    """
+    Замена django.http.JsonResponse с тем же интерфейсом: тело кодируется
+    функцией dumps. С json_dumps_params используется json.dumps, как в Django.
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe: bool = True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        if json_dumps_params:
+            content = json.dumps(data, cls=encoder, **json_dumps_params)
+        else:
+            content = dumps(data, encoder)
+        super().__init__(content=content, **kwargs)
@@ -0,0 +1,146 @@
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+
+# Поля сериализатора, которые возвращают значение из БД без изменений,
+# если колонка модели того же типа
+PASS_THROUGH = {
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.IntegerField: (models.IntegerField, models.AutoField),
+    serializers.BooleanField: (models.BooleanField,),
+}
+
+
+def _model_field(model, path: list[str]):
+    """Поле модели по пути source_attrs или None (аннотация, свойство)"""
+
+    field = None
+    for name in path:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+    return field
+
+
+class FastSerializer:
+    """
+    Быстрая сериализация только для чтения: тот же результат, что у
+    ModelSerializer, но строится из .values() без создания моделей.
+
+    Поля сериализатора разбираются один раз: для каждого вычисляется колонка
+    для .values() и функция преобразования (to_representation поля DRF или
+    ничего, если значение из БД уже в нужном виде). Вложенные сериализаторы
+    превращаются в колонки через связь (product__name), вложенные списки
+    (many=True) загружаются одним запросом на страницу.
+
+    fields ограничивает поля верхнего уровня, а связи вне expand выводятся
+    в виде id (список id для many=True). По умолчанию выводятся все поля
+    и все связи раскрыты.
+    """
+
+    def __init__(self, serializer_class, prefix: str = "", fields=None, expand=None):
+        serializer = serializer_class()
+        model = serializer.Meta.model
+        self.prefix = prefix
+        self.pk_column = f"{prefix}pk"
+        # (ключ, колонка, преобразование) и (ключ, FastSerializer) в порядке полей
+        self.fields = []
+        # (ключ, FastSerializer или None для списка id, поле внешнего ключа у вложенной модели, ее модель)
+        self.lists = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            path = field.source_attrs
+            collapsed = expand is not None and name not in expand
+            if isinstance(field, serializers.ListSerializer):
+                relation = model._meta.get_field(path[0])
+                if collapsed:
+                    self.fields.append((name, None, None))
+                    self.lists.append((name, None, relation.field.name, relation.related_model))
+                    continue
+                child = FastSerializer(type(field.child))
+                if child.lists:
+                    raise TypeError(f"Вложенные списки внутри {serializer_class.__name__}.{name} не поддерживаются")
+                self.fields.append((name, None, None))
+                self.lists.append((name, child, relation.field.name, relation.related_model))
+            elif isinstance(field, serializers.BaseSerializer) and collapsed:
+                # .values() по внешнему ключу возвращает id
+                self.fields.append((name, f"{prefix}{'__'.join(path)}", None))
+            elif isinstance(field, serializers.BaseSerializer):
+                nested = FastSerializer(type(field), f"{prefix}{'__'.join(path)}__")
+                if nested.lists:
+                    raise TypeError(f"Вложенные списки внутри {serializer_class.__name__}.{name} не поддерживаются")
+                self.fields.append((name, nested, None))
+            elif isinstance(field, PrimaryKeyRelatedField):
+                # .values() по внешнему ключу возвращает id, как и PrimaryKeyRelatedField
+                self.fields.append((name, f"{prefix}{'__'.join(path)}", None))
+            elif isinstance(field, (serializers.ManyRelatedField, serializers.SerializerMethodField)):
+                raise TypeError(f"Поле {serializer_class.__name__}.{name} не поддерживается быстрой сериализацией")
+            else:
+                model_field = _model_field(model, path)
+                convert = field.to_representation
+                if isinstance(model_field, PASS_THROUGH.get(type(field), ())):
+                    convert = None
+                self.fields.append((name, f"{prefix}{'__'.join(path)}", convert))
+
+    @property
+    def columns(self) -> list[str]:
+        """Колонки для .values(), включая колонки вложенных сериализаторов"""
+
+        columns = [self.pk_column]
+        for _, column, _ in self.fields:
+            if isinstance(column, FastSerializer):
+                columns.extend(column.columns)
+            elif column is not None:
+                columns.append(column)
+        return list(dict.fromkeys(columns))
+
+    def values(self, queryset: QuerySet, *extra: str) -> QuerySet:
+        """Выборка строк для render; extra - дополнительные колонки (например, поля порядка)"""
+
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, *extra]))
+
+    def render(self, rows: list[dict]) -> list[dict]:
+        """Список словарей в формате исходного сериализатора"""
+
+        items = [self._item(row) for row in rows]
+        for name, child, foreign_key, model in self.lists:
+            ids = [row[self.pk_column] for row in rows]
+            children = {pk: [] for pk in ids}
+            queryset = model.objects.filter(**{f"{foreign_key}__in": ids}).order_by(foreign_key, "pk")
+            if child is None:
+                for parent, pk in queryset.values_list(foreign_key, "pk"):
+                    children[parent].append(pk)
+                for item, pk in zip(items, ids):
+                    item[name] = children[pk]
+                continue
+            parent = itemgetter(foreign_key)
+            for child_row in child.values(queryset, foreign_key):
+                children[parent(child_row)].append(child_row)
+            for item, pk in zip(items, ids):
+                item[name] = child.render(children[pk])
+        return items
+
+    def serialize(self, queryset: QuerySet) -> list[dict]:
+        return self.render(list(self.values(queryset)))
+
+    def _item(self, row: dict) -> dict:
+        item = {}
+        for name, column, convert in self.fields:
+            if column is None:
+                # Вложенный список заполняется в render
+                item[name] = None
+            elif isinstance(column, FastSerializer):
+                item[name] = None if row[column.pk_column] is None else column._item(row)
+            else:
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+        return item
@@ -1,5 +1,13 @@
+import re
+
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from app.models import ProductInfo
+from app.models import CatalogEntry, ProductInfo, ProductParameter
+from app.search import get_search_backend
+
+
+# Фильтр по параметру: param[Цвет]=черный, несколько значений - повтором ключа
+PARAMETER_FILTER = re.compile(r"param\[(.+)\]")
 
 
 class ProductInfoFilter(filters.FilterSet):
@@ -8,11 +16,82 @@ class ProductInfoFilter(filters.FilterSet):
     shop = filters.CharFilter(field_name="shop__name")
     product = filters.CharFilter(field_name="product__name")
     price = filters.RangeFilter(field_name="price")
+    q = filters.CharFilter(method="search")
 
     class Meta:
         model = ProductInfo
         fields = [
             "shop",
             "product",
-            "price"
-        ]
\ No newline at end of file
+            "price",
+            "q"
+        ]
+
+    def search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию товара, категории и значениям параметров"""
+
+        return get_search_backend().search(queryset, value)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Значения одного параметра объединяются через ИЛИ, разные параметры - через И
+        for name, values in self.parameter_filters(self.data).items():
+            queryset = queryset.filter(Exists(ProductParameter.objects.filter(
+                product_info=OuterRef("pk"), parameter__name=name, value__in=values
+            )))
+        return queryset
+
+    @staticmethod
+    def parameter_filters(data) -> dict[str, list[str]]:
+        """Фильтры по параметрам из запроса: {параметр: [значения]}"""
+
+        parameters = {}
+        for key in data:
+            match = PARAMETER_FILTER.fullmatch(key)
+            values = data.getlist(key) if hasattr(data, "getlist") else [data[key]]
+            values = [value for value in values if value]
+            if match and values:
+                parameters[match[1]] = values
+        return parameters
+
+    @classmethod
+    def narrows_shop_catalog(cls, data) -> bool:
+        """Сужает ли запрос выборку сильнее, чем до каталога магазина"""
+
+        return any(data.get(name) for name in ("product", "price_min", "price_max", "q")) or bool(
+            cls.parameter_filters(data)
+        )
+
+
+class CatalogEntryFilter(ProductInfoFilter):
+    """Те же фильтры по строкам каталога для чтения"""
+
+    shop = filters.CharFilter(field_name="shop_name")
+    product = filters.CharFilter(field_name="product_name")
+    best = filters.BooleanFilter(method="best_offers")
+
+    class Meta:
+        model = CatalogEntry
+        fields = [
+            "shop",
+            "product",
+            "price",
+            "q",
+            "best"
+        ]
+
+    def best_offers(self, queryset, name, value):
+        """Только лучшее (самое дешевое) предложение каждого товара"""
+
+        return queryset.filter(best=True) if value else queryset
+
+    @staticmethod
+    def best_requested(data) -> bool:
+        """Запрошены ли только лучшие предложения (значения как у BooleanWidget)"""
+
+        return str(data.get("best", "")).lower() in ("true", "1")
+
+    @classmethod
+    def narrows_shop_catalog(cls, data) -> bool:
+        return super().narrows_shop_catalog(data) or cls.best_requested(data)
+
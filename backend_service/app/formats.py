@@ -0,0 +1,169 @@
+import csv
+import io
+import os
+from typing import IO, Callable, Iterator
+
+from app import fast_json
+from app.importer import PriceListParser, PriceListError
+
+
+# Колонки CSV, которые не являются параметрами товара
+CSV_COLUMNS = ("shop", "category_name", "name", "category", "price", "price_rrc", "quantity")
+
+PARSERS = {}
+CONTENT_TYPES = {}
+EXTENSIONS = {}
+
+
+def register(name: str, content_types: tuple = (), extensions: tuple = ()) -> Callable:
+    """Регистрирует разборщик формата прайс-листа"""
+
+    def decorator(parser: Callable) -> Callable:
+        PARSERS[name] = parser
+        CONTENT_TYPES.update(dict.fromkeys(content_types, name))
+        EXTENSIONS.update(dict.fromkeys(extensions, name))
+        return parser
+
+    return decorator
+
+
+def detect_format(content_type: str | None = None, filename: str | None = None) -> str | None:
+    """Определяет формат по расширению файла, а затем по типу содержимого"""
+
+    if filename:
+        name = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+        if name:
+            return name
+    if content_type:
+        return CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+def get_parser(name: str) -> Callable[[IO], Iterator[tuple[str, object]]]:
+    """
+    Возвращает разборщик формата. Разборщик принимает бинарный файл и отдает
+    разделы прайс-листа: ("shop", название), ("categories", итератор категорий),
+    ("items", итератор товаров).
+    """
+
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise PriceListError(f"Неподдерживаемый формат файла: {name}")
+
+
+def _text(file: IO) -> io.TextIOWrapper:
+    return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+
+@register("json", content_types=("application/json",), extensions=(".json",))
+def parse_json(file: IO) -> Iterator[tuple[str, object]]:
+    return iter(PriceListParser(file))
+
+
+@register(
+    "ndjson",
+    content_types=("application/x-ndjson", "application/ndjson", "application/jsonl"),
+    extensions=(".ndjson", ".jsonl")
+)
+def parse_ndjson(file: IO) -> Iterator[tuple[str, object]]:
+    """
+    Первая строка - заголовок {"shop": ..., "categories": [...]},
+    каждая следующая строка - один товар.
+    """
+
+    lines = _ndjson_lines(file)
+    header = next(lines, {})
+    if not isinstance(header, dict) or "shop" not in header:
+        raise PriceListError("Первая строка файла должна содержать магазин")
+    yield "shop", header["shop"]
+    if "categories" in header:
+        yield "categories", header["categories"]
+    yield "items", lines
+
+
+def _ndjson_lines(file: IO) -> Iterator:
+    for line in _text(file):
+        if line.strip():
+            try:
+                yield fast_json.loads(line)
+            except fast_json.JSONDecodeError:
+                raise PriceListError("Неверный формат файла")
+
+
+@register(
+    "yaml",
+    content_types=("application/yaml", "application/x-yaml", "text/yaml", "text/x-yaml"),
+    extensions=(".yaml", ".yml")
+)
+def parse_yaml(file: IO) -> Iterator[tuple[str, object]]:
+    """
+    YAML той же структуры, что и JSON. В отличие от остальных форматов документ
+    загружается в память целиком (PyYAML строит объекты только для всего
+    документа), поэтому большие прайс-листы лучше загружать в JSON, NDJSON или CSV.
+    """
+
+    try:
+        import yaml
+    except ImportError:
+        raise PriceListError("Для импорта YAML необходимо установить PyYAML")
+
+    try:
+        data = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError:
+        raise PriceListError("Неверный формат файла")
+    if not isinstance(data, dict):
+        raise PriceListError("Неверный формат файла")
+    # Документ уже в памяти, поэтому порядок разделов в файле не важен
+    for key in ("shop", "categories", "items"):
+        if key in data:
+            yield key, data[key]
+
+
+@register("csv", content_types=("text/csv", "application/csv"), extensions=(".csv",))
+def parse_csv(file: IO) -> Iterator[tuple[str, object]]:
+    """
+    Одна строка - один товар. Обязательные колонки: shop, name, category, price,
+    price_rrc, quantity; необязательная category_name задает название категории.
+    Все прочие колонки - параметры товара, пустая ячейка означает отсутствие параметра.
+
+    Файл читается дважды: сначала собираются магазин и категории, затем товары.
+    """
+
+    text = _text(file)
+    reader = csv.DictReader(text)
+    missing = {"shop", "name", "category", "price", "price_rrc", "quantity"} - set(reader.fieldnames or ())
+    if missing:
+        raise PriceListError(f"В файле отсутствуют колонки: {', '.join(sorted(missing))}")
+
+    shop, categories = None, {}
+    try:
+        for row in reader:
+            shop = shop or row["shop"]
+            if row.get("category_name"):
+                categories.setdefault(row["category_name"], None)
+    except csv.Error:
+        raise PriceListError("Неверный формат файла")
+    if shop is None:
+        raise PriceListError("Отсутствуют товары")
+    yield "shop", shop
+    yield "categories", [{"name": name} for name in categories]
+
+    text.seek(0)
+    yield "items", _csv_items(csv.DictReader(text))
+
+
+def _csv_items(reader: csv.DictReader) -> Iterator[dict]:
+    parameters = [name for name in reader.fieldnames if name not in CSV_COLUMNS]
+    try:
+        for row in reader:
+            yield {
+                "name": row["name"],
+                "category": row["category"],
+                "price": row["price"],
+                "price_rrc": row["price_rrc"],
+                "quantity": row["quantity"],
+                "parameters": [{name: row[name]} for name in parameters if row[name]],
+            }
+    except csv.Error:
+        raise PriceListError("Неверный формат файла")
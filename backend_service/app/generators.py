@@ -0,0 +1,101 @@
+import csv
+import json
+import random
+from typing import IO, Iterator
+
+
+# Значения параметров подбираются из небольших словарей, как в реальных прайс-листах
+COLORS = ["черный", "белый", "серый", "синий", "красный", "золотой", "зеленый", "фиолетовый"]
+PARAMETER_VALUES = 20
+
+
+def parameter_names(count: int) -> list[str]:
+    """Названия параметров синтетического прайс-листа"""
+
+    return ["Цвет", *(f"Параметр {i}" for i in range(1, count))][:count]
+
+
+def generate_items(
+    items: int,
+    categories: dict[int, str],
+    parameters: int = 10,
+    parameters_per_item: int = 3,
+    seed: int = 0
+) -> Iterator[dict]:
+    """
+    Синтетические товары прайс-листа в формате элемента items.
+
+    categories - id и названия категорий в БД, товары распределяются по ним
+    равномерно. У каждого товара parameters_per_item разных параметров из
+    parameters возможных. При одинаковом seed результат одинаковый.
+    """
+
+    rng = random.Random(seed)
+    category_ids = list(categories)
+    names = parameter_names(parameters)
+    per_item = min(parameters_per_item, parameters)
+
+    for i in range(items):
+        price = rng.randrange(100, 200000)
+        item_parameters = []
+        for j in sorted(rng.sample(range(parameters), per_item)):
+            if j == 0:
+                value = rng.choice(COLORS)
+            else:
+                value = rng.randrange(PARAMETER_VALUES) * 8
+            item_parameters.append({names[j]: value})
+        yield {
+            "name": f"Товар {i}",
+            "category": category_ids[i % len(category_ids)],
+            "price": price,
+            "price_rrc": price + price * rng.randrange(0, 30) // 100,
+            "quantity": rng.randrange(0, 100),
+            "parameters": item_parameters
+        }
+
+
+def write_price_list(
+    file: IO,
+    items: int,
+    categories: dict[int, str],
+    parameters: int = 10,
+    parameters_per_item: int = 3,
+    format: str = "json",
+    shop: str = "Бенчмарк",
+    seed: int = 0
+) -> None:
+    """
+    Записывает синтетический прайс-лист в текстовый файл, не держа его в памяти
+    целиком. Поддерживаются форматы json, ndjson и csv.
+    """
+
+    rows = generate_items(items, categories, parameters, parameters_per_item, seed)
+    header = [{"name": name} for name in categories.values()]
+
+    if format == "json":
+        file.write(json.dumps({"shop": shop, "categories": header}, ensure_ascii=False)[:-1])
+        file.write(', "items": [')
+        for i, item in enumerate(rows):
+            if i:
+                file.write(",")
+            file.write(json.dumps(item, ensure_ascii=False))
+        file.write("]}")
+    elif format == "ndjson":
+        file.write(json.dumps({"shop": shop, "categories": header}, ensure_ascii=False))
+        for item in rows:
+            file.write("\n")
+            file.write(json.dumps(item, ensure_ascii=False))
+    elif format == "csv":
+        names = parameter_names(parameters)
+        writer = csv.writer(file)
+        writer.writerow(["shop", "category_name", "name", "category", "price", "price_rrc", "quantity", *names])
+        for item in rows:
+            values = {}
+            for parameter in item["parameters"]:
+                values.update(parameter)
+            writer.writerow([
+                shop, categories[item["category"]], item["name"], item["category"],
+                item["price"], item["price_rrc"], item["quantity"], *(values.get(name, "") for name in names)
+            ])
+    else:
+        raise ValueError(f"Неподдерживаемый формат: {format}")
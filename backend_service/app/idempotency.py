@@ -0,0 +1,253 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from app.fast_json import JsonResponse
+from app.models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PREFIX = "idempotency"
+PURGE_BATCH_SIZE = 10000
+
+
+def fingerprint(request: Request) -> str:
+    """
+    Отпечаток метода, пути и тела запроса. Файлы multipart-запроса
+    учитываются по содержимому, не загружаясь в память целиком.
+    """
+
+    digest = hashlib.sha256(f"{request.method} {request.get_full_path()}\n".encode())
+    if request.content_type.startswith("multipart/"):
+        for name, value in sorted(request.data.items()):
+            digest.update(f"{name}={value}\n".encode())
+        for name, file in sorted(request.FILES.items()):
+            digest.update(f"{name}:{file.name}\n".encode())
+            for chunk in file.chunks():
+                digest.update(chunk)
+            file.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+class DatabaseStore:
+    """
+    Ключи в таблице IdempotencyKey. Поиск ключа - одно чтение по уникальному
+    индексу (user, key); просроченные и лишние ключи удаляет purge.
+    """
+
+    def begin(self, user_id: int, key: str, request_fingerprint: str) -> IdempotencyKey | None:
+        """
+        Занимает ключ на время выполнения запроса. Возвращает None, если ключ
+        занят этим запросом, иначе запись предыдущего запроса с этим ключом.
+        """
+
+        now = timezone.now()
+        lease = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if record is None:
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        user_id=user_id, key=key, fingerprint=request_fingerprint, expires_at=lease
+                    )
+                return None
+            except IntegrityError:
+                # Параллельный запрос с тем же ключом занял его раньше
+                return IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+
+        if record.expires_at <= now:
+            # Просроченный ключ или брошенный запрос: ключ занимается заново условным UPDATE
+            if IdempotencyKey.objects.filter(pk=record.pk, expires_at=record.expires_at).update(
+                fingerprint=request_fingerprint, status_code=None, content=b"", content_type="",
+                created_at=now, expires_at=lease
+            ):
+                return None
+            return IdempotencyKey.objects.filter(pk=record.pk).first()
+        return record
+
+    def finish(self, record: IdempotencyKey) -> None:
+        """Сохраняет ответ запроса, занявшего ключ"""
+
+        IdempotencyKey.objects.filter(user_id=record.user_id, key=record.key).update(
+            status_code=record.status_code,
+            content=record.content,
+            content_type=record.content_type,
+            expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+        )
+
+    def release(self, user_id: int, key: str) -> None:
+        """Освобождает ключ запроса, ответ которого не сохраняется"""
+
+        IdempotencyKey.objects.filter(user_id=user_id, key=key, status_code__isnull=True).delete()
+
+    def purge(self) -> int:
+        """
+        Удаляет просроченные ключи и самые старые ключи сверх
+        IDEMPOTENCY_MAX_KEYS. Возвращает число удаленных ключей.
+        """
+
+        deleted = 0
+        while True:
+            ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list(
+                "id", flat=True
+            )[:PURGE_BATCH_SIZE])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        excess = IdempotencyKey.objects.count() - settings.IDEMPOTENCY_MAX_KEYS
+        while excess > 0:
+            ids = list(IdempotencyKey.objects.order_by("expires_at").values_list(
+                "id", flat=True
+            )[:min(excess, PURGE_BATCH_SIZE)])
+            count = IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+            deleted += count
+            excess -= count
+            if not count:
+                break
+        return deleted
+
+
+class CacheStore:
+    """
+    Ключи в кэше IDEMPOTENCY_CACHE: число записей ограничено настройками
+    кэша (MAX_ENTRIES), срок хранения - таймаутом записи.
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.IDEMPOTENCY_CACHE]
+
+    @staticmethod
+    def _key(user_id: int, key: str) -> str:
+        # Ключ клиента может содержать символы, недопустимые в ключах memcached
+        return f"{PREFIX}:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+    def begin(self, user_id: int, key: str, request_fingerprint: str) -> IdempotencyKey | None:
+        cache = self._cache()
+        claim = {"fingerprint": request_fingerprint, "status_code": None}
+        # add атомарен: из параллельных запросов ключ занимает один
+        if cache.add(self._key(user_id, key), claim, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return None
+        data = cache.get(self._key(user_id, key))
+        # Запись истекла между add и get
+        if data is None and cache.add(self._key(user_id, key), claim, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return None
+        return IdempotencyKey(user_id=user_id, key=key, **(data or claim))
+
+    def finish(self, record: IdempotencyKey) -> None:
+        self._cache().set(self._key(record.user_id, record.key), {
+            "fingerprint": record.fingerprint,
+            "status_code": record.status_code,
+            "content": bytes(record.content),
+            "content_type": record.content_type
+        }, settings.IDEMPOTENCY_TTL)
+
+    def release(self, user_id: int, key: str) -> None:
+        self._cache().delete(self._key(user_id, key))
+
+    def purge(self) -> int:
+        # Записи кэша истекают и вытесняются самим кэшем
+        return 0
+
+
+def get_store():
+    """Хранилище ключей по настройке IDEMPOTENCY_STORE: таблица (db) или кэш (cache)"""
+
+    if settings.IDEMPOTENCY_STORE == "cache":
+        return CacheStore()
+    return DatabaseStore()
+
+
+def idempotent(handler):
+    """
+    Идемпотентность изменяющего метода представления по заголовку Idempotency-Key.
+
+    Первый запрос с ключом выполняется, и его ответ хранится IDEMPOTENCY_TTL.
+    Повтор с тем же ключом и тем же запросом получает сохраненный ответ без
+    выполнения (заголовок Idempotent-Replayed), с другим запросом - 422,
+    а пока первый запрос выполняется - 409. Ответы 5xx и исключения не
+    сохраняются: ключ освобождается для повтора. Ключи разных пользователей
+    не пересекаются.
+    """
+
+    @wraps(handler)
+    def wrapper(self, request: Request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        # Без ключа и во вложенном вызове (partial_update -> update) запрос выполняется как обычно
+        if key is None or getattr(request, "_idempotency_key", None) is not None:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {"Errors": f"Заголовок {HEADER} должен содержать от 1 до {MAX_KEY_LENGTH} символов"}, status=400
+            )
+        request._idempotency_key = key
+
+        store = get_store()
+        request_fingerprint = fingerprint(request)
+        record = store.begin(request.user.id, key, request_fingerprint)
+        if record is not None:
+            if record.fingerprint != request_fingerprint:
+                return JsonResponse({"Errors": f"Ключ {HEADER} уже использован для другого запроса"}, status=422)
+            if record.status_code is None:
+                return JsonResponse({"Errors": "Запрос с этим ключом еще выполняется"}, status=409)
+            response = HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+            response[REPLAYED_HEADER] = "true"
+            return response
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            store.release(request.user.id, key)
+            raise
+        if response.status_code >= 500:
+            store.release(request.user.id, key)
+            return response
+
+        if isinstance(response, Response):
+            # Тело ответа DRF появляется после отрисовки; повторная обработка в dispatch его не меняет
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+        store.finish(IdempotencyKey(
+            user_id=request.user.id, key=key, fingerprint=request_fingerprint,
+            status_code=response.status_code, content=response.content,
+            content_type=response.get("Content-Type", "")
+        ))
+        return response
+
+    return wrapper
+
+
+class IdempotentMixin:
+    """
+    Idempotency-Key (idempotent) для изменяющих действий обобщенных
+    представлений и наборов представлений на их основе
+    """
+
+    @idempotent
+    def create(self, request: Request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
+    def update(self, request: Request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @idempotent
+    def partial_update(self, request: Request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+
+    @idempotent
+    def destroy(self, request: Request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
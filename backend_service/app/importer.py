@@ -0,0 +1,426 @@
+import codecs
+import json
+import re
+from collections import Counter
+from decimal import Decimal
+from typing import IO, Iterable, Iterator
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from app import cache, catalog, category_stats, facets, order_totals
+from app.loaders import get_loader
+from app.search import get_search_backend
+from app.models import (
+    Shop,
+    Category,
+    Product,
+    ProductInfo,
+    Parameter,
+    ProductParameter,
+)
+
+
+READ_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+CENTS = Decimal("0.01")
+SEEN_TABLE = "import_seen_product_info"
+SEEN_BATCH_SIZE = 500
+
+
+class PriceListError(Exception):
+    """Ошибка в содержимом прайс-листа"""
+
+
+class PriceListParser:
+    """
+    Потоковый разбор JSON-файла прайс-листа.
+
+    Файл читается блоками по READ_SIZE байт. Скалярные ключи верхнего уровня
+    возвращаются как (ключ, значение), а массивы - как (ключ, итератор), который
+    разбирает элементы по одному, не загружая массив в память целиком.
+    """
+
+    def __init__(self, file: IO, read_size: int = READ_SIZE):
+        self._file = file
+        self._read_size = read_size
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Дочитывает следующий блок файла в буфер"""
+
+        if self._eof:
+            return False
+        chunk = self._file.read(self._read_size)
+        if not chunk:
+            self._eof = True
+        try:
+            text = chunk if isinstance(chunk, str) else self._decoder.decode(chunk, final=self._eof)
+        except UnicodeDecodeError:
+            raise PriceListError("Файл должен быть в кодировке UTF-8")
+        # Уже разобранная часть буфера больше не нужна
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Пропускает пробельные символы и возвращает следующий символ"""
+
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise PriceListError("Неверный формат файла")
+        self._pos += 1
+
+    def _value(self):
+        """Разбирает одно JSON-значение, дочитывая файл при необходимости"""
+
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise PriceListError("Неверный формат файла")
+                continue
+            except RecursionError:
+                raise PriceListError("Слишком глубокая вложенность в файле")
+            # Число на границе буфера могло быть прочитано не полностью
+            cut = end == len(self._buffer) or self._buffer[end] in NUMBER_CHARS
+            if cut and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _items(self) -> Iterator:
+        """Итератор по элементам массива верхнего уровня"""
+
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            char = self._peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise PriceListError("Неверный формат файла")
+
+    def __iter__(self) -> Iterator[tuple[str, object]]:
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            self._end()
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise PriceListError("Неверный формат файла")
+            self._expect(":")
+            if self._peek() == "[":
+                items = self._items()
+                yield key, items
+                # Дочитываем массив, если потребитель его не исчерпал
+                for _ in items:
+                    pass
+            else:
+                yield key, self._value()
+            char = self._peek()
+            self._pos += 1
+            if char == "}":
+                self._end()
+                return
+            if char != ",":
+                raise PriceListError("Неверный формат файла")
+
+    def _end(self) -> None:
+        """После объекта верхнего уровня допускаются только пробельные символы"""
+
+        if self._peek():
+            raise PriceListError("Неверный формат файла")
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа магазина.
+
+    Товары накапливаются порциями по chunk_size штук и записываются в БД
+    пакетно, поэтому потребление памяти не зависит от размера файла.
+    Категории, товары и параметры каждой порции сопоставляются с БД
+    множествами: один запрос на выборку и один на создание недостающих.
+
+    Повторный импорт работает как дельта: ProductInfo и ProductParameter
+    обновляются через upsert, строки, совпадающие с сохраненными ценами,
+    количеством и параметрами, пропускаются,
+    а товары магазина, которых нет в новом файле, снимаются с продажи
+    (quantity = 0) одним запросом. Вызывать нужно внутри transaction.atomic().
+    """
+
+    def __init__(self, user, chunk_size: int | None = None, progress=None):
+        self.user = user
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        # Вызывается со статистикой после записи каждой порции
+        self.progress = progress
+        self.loader = get_loader()
+        self.search = get_search_backend()
+        self.shop = None
+        self.stats = {"items": 0, "inserted": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        self._parameters = {}
+        # Изменения фасетов копятся за весь импорт и применяются в конце
+        self._facet_delta = Counter()
+
+    def run(self, sections) -> dict:
+        """Импортирует разделы прайс-листа и возвращает статистику"""
+
+        seen = set()
+        for key, value in sections:
+            seen.add(key)
+            if key == "shop":
+                self._import_shop(value)
+            elif key == "categories":
+                self._import_categories(value)
+            elif key == "items":
+                self._import_items(value)
+
+        if "categories" not in seen:
+            raise PriceListError("Отсутствуют категории")
+        if "items" not in seen:
+            raise PriceListError("Отсутствуют товары")
+        facets.apply_delta(self._facet_delta)
+        category_stats.refresh_shop(self.shop.id)
+        cache.bump_shop(self.shop.id)
+        return self.stats
+
+    def _import_shop(self, name) -> None:
+        if not isinstance(name, str) or not name:
+            raise PriceListError("Неверное название магазина")
+        try:
+            self.shop, _ = Shop.objects.get_or_create(name=name, user_id=self.user.id)
+        except IntegrityError:
+            raise PriceListError("У пользователя уже есть магазин")
+
+    def _import_categories(self, categories) -> None:
+        if self.shop is None:
+            raise PriceListError("Магазин должен быть указан перед категориями")
+        try:
+            names = list(dict.fromkeys(data["name"] for data in categories))
+        except KeyError as e:
+            raise PriceListError(f"У категории отсутствует поле {e}")
+        except TypeError:
+            raise PriceListError("Неверный формат категорий")
+
+        # Существующие категории одним запросом, недостающие - одним пакетом
+        existing = {}
+        for category_id, name in Category.objects.filter(name__in=names).order_by("id").values_list("id", "name"):
+            existing.setdefault(name, category_id)
+        missing = [Category(name=name) for name in names if name not in existing]
+        Category.objects.bulk_create(missing)
+
+        category_ids = [*existing.values(), *(category.id for category in missing)]
+        linked = set(Category.shops.through.objects.filter(
+            shop_id=self.shop.id, category_id__in=category_ids
+        ).values_list("category_id", flat=True))
+        Category.shops.through.objects.bulk_create(
+            [
+                Category.shops.through(category_id=category_id, shop_id=self.shop.id)
+                for category_id in category_ids if category_id not in linked
+            ],
+            ignore_conflicts=True
+        )
+        # Список категорий закэширован вместе с магазинами, поэтому сбрасывается весь кэш каталога
+        if missing or len(linked) < len(category_ids):
+            cache.bump_global()
+
+    def _import_items(self, items) -> None:
+        if self.shop is None:
+            raise PriceListError("Магазин должен быть указан перед товарами")
+        if isinstance(items, (str, dict)) or not isinstance(items, Iterable):
+            raise PriceListError("Неверный формат товаров")
+
+        # id всех товаров из файла собираются во временной таблице,
+        # чтобы снять с продажи отсутствующие одним запросом
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEEN_TABLE}")
+            cursor.execute(f"CREATE TEMPORARY TABLE {SEEN_TABLE} (id bigint PRIMARY KEY)")
+
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+
+        # Отсутствующие в файле товары не удаляются: на них ссылаются позиции заказов
+        removed = ProductInfo.objects.filter(shop=self.shop).exclude(
+            id__in=RawSQL(f"SELECT id FROM {SEEN_TABLE}", [])
+        ).exclude(quantity=0)
+        removed_ids = list(removed.values_list("id", flat=True))
+        self.stats["removed"] = removed.update(quantity=0, updated_at=timezone.now())
+        catalog.refresh(removed_ids)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {SEEN_TABLE}")
+
+    def _flush(self, items: list) -> None:
+        """Записывает порцию товаров в БД"""
+
+        try:
+            rows = [self._parse_item(item) for item in items]
+        except KeyError as e:
+            raise PriceListError(f"У товара отсутствует поле {e}")
+        except (AttributeError, TypeError, ValueError, ArithmeticError):
+            raise PriceListError("Неверный формат товара")
+
+        products = self._resolve_products({row["product"] for row in rows})
+        parameters = self._resolve_parameters({name for row in rows for name, _ in row["parameters"]})
+
+        # При повторе товара в порции побеждает последняя строка
+        rows = {products[row["product"]]: row for row in rows}
+        # Строки сравниваются с сохраненными значениями, а не с прошлым файлом:
+        # изменения вне импорта (правка партнера, резерв при заказе) тоже учитываются
+        existing = {
+            product_id: (product_info_id, (price, price_rrc, quantity))
+            for product_info_id, product_id, price, price_rrc, quantity in ProductInfo.objects.filter(
+                shop=self.shop, product_id__in=rows
+            ).values_list("id", "product_id", "price", "price_rrc", "quantity")
+        }
+        stored_parameters = {product_info_id: set() for product_info_id, _ in existing.values()}
+        for product_info_id, parameter_id, value in ProductParameter.objects.filter(
+            product_info_id__in=list(stored_parameters)
+        ).values_list("product_info_id", "parameter_id", "value"):
+            stored_parameters[product_info_id].add((parameter_id, value))
+
+        seen_ids = []
+        changed = {}
+        for product_id, row in rows.items():
+            product_info_id, values = existing.get(product_id, (None, None))
+            if (
+                values == (row["price"], row["price_rrc"], row["quantity"])
+                and stored_parameters[product_info_id] == {(parameters[name], value) for name, value in row["parameters"]}
+            ):
+                seen_ids.append(product_info_id)
+                self.stats["unchanged"] += 1
+            else:
+                changed[product_id] = row
+                self.stats["updated" if product_info_id else "inserted"] += 1
+
+        # Старые значения параметров обновляемых товаров вычитаются из фасетов
+        self._facet_delta.subtract(
+            (self.shop.id, parameter_id, value)
+            for product_id in changed if product_id in existing
+            for parameter_id, value in stored_parameters[existing[product_id][0]]
+        )
+
+        product_infos = self.loader.upsert_product_infos([
+            ProductInfo(
+                product_id=product_id,
+                shop=self.shop,
+                price=row["price"],
+                price_rrc=row["price_rrc"],
+                quantity=row["quantity"]
+            )
+            for product_id, row in changed.items()
+        ])
+        seen_ids.extend(product_info.id for product_info in product_infos)
+
+        product_parameters = self.loader.upsert_product_parameters([
+            ProductParameter(product_info=product_info, parameter_id=parameters[name], value=value)
+            for product_info in product_infos
+            for name, value in changed[product_info.product_id]["parameters"]
+        ])
+        # Параметры, пропавшие из обновленных товаров, удаляются
+        updated_ids = [product_info.id for product_info in product_infos if product_info.product_id in existing]
+        if updated_ids:
+            ProductParameter.objects.filter(product_info_id__in=updated_ids).exclude(
+                id__in=[product_parameter.id for product_parameter in product_parameters]
+            ).delete()
+        self.search.reindex(product_info.id for product_info in product_infos)
+        catalog.refresh(product_info.id for product_info in product_infos)
+        # Суммы пересчитываются только у незавершенных заказов с товарами, цена которых изменилась;
+        # новые товары еще не в заказах
+        order_totals.refresh_products(
+            existing[product_id][0] for product_id, row in changed.items()
+            if product_id in existing and existing[product_id][1][0] != row["price"]
+        )
+        self._facet_delta.update(
+            (self.shop.id, product_parameter.parameter_id, product_parameter.value)
+            for product_parameter in product_parameters
+        )
+
+        with connection.cursor() as cursor:
+            for start in range(0, len(seen_ids), SEEN_BATCH_SIZE):
+                batch = seen_ids[start:start + SEEN_BATCH_SIZE]
+                cursor.execute(
+                    f"INSERT INTO {SEEN_TABLE} (id) VALUES {', '.join(['(%s)'] * len(batch))}",
+                    batch
+                )
+        self.stats["items"] += len(items)
+        if self.progress is not None:
+            self.progress(self.stats)
+
+    @staticmethod
+    def _parse_item(item: dict) -> dict:
+        """Приводит товар из файла к виду, удобному для пакетной обработки"""
+
+        row = {
+            "product": (item["name"], int(item["category"])),
+            "price": Decimal(str(item["price"])).quantize(CENTS),
+            "price_rrc": Decimal(str(item["price_rrc"])).quantize(CENTS),
+            "quantity": int(item["quantity"]),
+        }
+        parameters = item.get("parameters")
+        if parameters is None:
+            raise PriceListError("Отсутствуют параметры")
+        if isinstance(parameters, dict):
+            parameters = [parameters]
+        # При повторе параметра у товара побеждает последнее значение
+        row["parameters"] = sorted({
+            name: str(value) for parameter in parameters for name, value in parameter.items()
+        }.items())
+        return row
+
+    def _resolve_products(self, keys: set) -> dict:
+        """Возвращает id товаров по парам (название, категория), создавая недостающие"""
+
+        products = {}
+        existing = Product.objects.filter(
+            name__in={name for name, _ in keys},
+            categories_id__in={category_id for _, category_id in keys}
+        ).order_by("id").values_list("id", "name", "categories_id")
+        for product_id, name, category_id in existing:
+            products.setdefault((name, category_id), product_id)
+
+        missing = [Product(name=name, categories_id=category_id) for name, category_id in keys - products.keys()]
+        Product.objects.bulk_create(missing)
+        products.update({(product.name, product.categories_id): product.id for product in missing})
+        return products
+
+    def _resolve_parameters(self, names: set) -> dict:
+        """Возвращает id параметров по названиям, создавая недостающие"""
+
+        # Параметров немного, поэтому они кэшируются на весь импорт
+        unknown = names - self._parameters.keys()
+        if unknown:
+            for parameter_id, name in Parameter.objects.filter(name__in=unknown).order_by("id").values_list("id", "name"):
+                self._parameters.setdefault(name, parameter_id)
+            missing = [Parameter(name=name) for name in unknown - self._parameters.keys()]
+            Parameter.objects.bulk_create(missing)
+            self._parameters.update({parameter.name: parameter.id for parameter in missing})
+        return self._parameters
@@ -0,0 +1,170 @@
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app.formats import get_parser
+from app.importer import PriceListImporter, PriceListError
+from app.models import ImportJob
+
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH_SIZE = 20
+PROGRESS_INTERVAL = 1.0
+
+
+def enqueue_import(user, file, format: str) -> ImportJob:
+    """Сохраняет загруженный файл и ставит импорт в очередь"""
+
+    return ImportJob.objects.create(user=user, file=file, format=format)
+
+
+def claim_next_job() -> ImportJob | None:
+    """
+    Забирает из очереди самую старую задачу магазина, у которого сейчас нет
+    выполняющегося импорта.
+
+    Захват - условный UPDATE, поэтому одну задачу не заберут два воркера,
+    а ограничение unique_running_import_per_user не даст запустить второй
+    импорт того же магазина, пока не завершится первый. Перед захватом
+    зависшие задачи помечаются ошибочными, чтобы упавший воркер не
+    блокировал очередь магазина.
+    """
+
+    fail_stale_jobs()
+    candidates = {}
+    queued = ImportJob.objects.filter(state="queued").exclude(
+        user__import_jobs__state="running"
+    ).order_by("created_at").values_list("id", "user_id")[:CLAIM_BATCH_SIZE]
+    for job_id, user_id in queued:
+        candidates.setdefault(user_id, job_id)
+
+    for job_id in candidates.values():
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                claimed = ImportJob.objects.filter(pk=job_id, state="queued").update(
+                    state="running", started_at=now, heartbeat_at=now
+                )
+        except IntegrityError:
+            # Другой воркер уже запустил импорт этого магазина
+            continue
+        if claimed:
+            return ImportJob.objects.select_related("user").get(pk=job_id)
+    return None
+
+
+class ProgressWriter:
+    """
+    Записывает прогресс и отметку воркера (heartbeat_at) через отдельное
+    соединение с БД: импорт идет в одной транзакции, и изменения в ней
+    не видны до ее завершения.
+    """
+
+    def __init__(self, job: ImportJob):
+        self.job = job
+        self.connection = None
+        self.written_at = 0.0
+        # SQLite не допускает второй пишущей транзакции, там прогресс становится
+        # виден только по завершении задачи, а отметка воркера - время запуска
+        if connection.vendor != "sqlite":
+            self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+
+    def __call__(self, stats: dict) -> None:
+        if self.connection is None or time.monotonic() - self.written_at < PROGRESS_INTERVAL:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {ImportJob._meta.db_table} SET stats = %s, heartbeat_at = %s WHERE id = %s",
+                [json.dumps(stats), timezone.now(), self.job.pk.hex]
+            )
+        self.written_at = time.monotonic()
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+
+
+class StaleJobError(Exception):
+    """Задачу пометили зависшей, пока воркер выполнял импорт"""
+
+
+def finish_job(job: ImportJob, state: str, stats: dict, errors: list) -> bool:
+    """
+    Сохраняет результат задачи, если она еще выполняется. Задачу, которую уже
+    пометили зависшей, результат опоздавшего воркера не меняет: после этого
+    мог начаться следующий импорт магазина.
+    """
+
+    return bool(ImportJob.objects.filter(pk=job.pk, state="running").update(
+        state=state, stats=stats, errors=errors, finished_at=timezone.now(), file=""
+    ))
+
+
+def run_job(job: ImportJob) -> None:
+    """Выполняет импорт и сохраняет его результат в задаче"""
+
+    progress = ProgressWriter(job)
+    errors = []
+    try:
+        with job.file.open("rb") as file, transaction.atomic():
+            sections = get_parser(job.format)(file)
+            stats = PriceListImporter(job.user, progress=progress).run(sections)
+            # Результат фиксируется в транзакции импорта: импорт зависшей задачи откатывается
+            if not finish_job(job, "done", stats, errors):
+                raise StaleJobError
+    except StaleJobError:
+        logger.warning("Задача %s помечена зависшей до завершения импорта, результат отброшен", job.pk)
+    except PriceListError as e:
+        errors.append(str(e))
+    except Exception:
+        logger.exception("Импорт %s завершился с ошибкой", job.pk)
+        errors.append("Внутренняя ошибка импорта")
+    finally:
+        progress.close()
+        # Загруженный файл нужен только на время импорта
+        job.file.delete(save=False)
+
+    if errors and not finish_job(job, "failed", job.stats, errors):
+        logger.warning("Задача %s помечена зависшей до завершения импорта, ошибки отброшены", job.pk)
+
+
+def fail_stale_jobs() -> int:
+    """
+    Помечает ошибочными задачи, воркер которых не обновлял отметку дольше
+    IMPORT_JOB_TIMEOUT (завершился, не дойдя до конца, или завис)
+    """
+
+    stale_before = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+    stale = dict(ImportJob.objects.filter(state="running").filter(
+        Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True, started_at__lt=stale_before)
+    ).values_list("pk", "file"))
+    if not stale:
+        return 0
+    count = ImportJob.objects.filter(pk__in=stale, state="running").update(
+        state="failed", errors=["Превышено время выполнения импорта"], finished_at=timezone.now(), file=""
+    )
+    # Файлы задач упавших воркеров больше никто не удалит
+    storage = ImportJob._meta.get_field("file").storage
+    for name in filter(None, stale.values()):
+        storage.delete(name)
+    return count
+
+
+def work(poll_interval: float, once: bool = False) -> None:
+    """Цикл воркера: берет задачи из очереди, пока она не опустеет (once) или бесконечно"""
+
+    while True:
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,125 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from app.models import ProductInfo, ProductParameter
+
+
+PRODUCT_INFO_FIELDS = ["price", "price_rrc", "quantity", "updated_at"]
+
+
+class BulkCreateLoader:
+    """Запись строк импорта через bulk_create с upsert (любая СУБД)"""
+
+    def upsert_product_infos(self, product_infos: list[ProductInfo]) -> list[ProductInfo]:
+        """Вставляет или обновляет ProductInfo по (product, shop) и проставляет им id"""
+
+        return ProductInfo.objects.bulk_create(
+            product_infos,
+            update_conflicts=True,
+            unique_fields=["product", "shop"],
+            update_fields=PRODUCT_INFO_FIELDS
+        )
+
+    def upsert_product_parameters(self, product_parameters: list[ProductParameter]) -> list[ProductParameter]:
+        """Вставляет или обновляет ProductParameter по (product_info, parameter) и проставляет им id"""
+
+        return ProductParameter.objects.bulk_create(
+            product_parameters,
+            update_conflicts=True,
+            unique_fields=["product_info", "parameter"],
+            update_fields=["value"]
+        )
+
+
+class PostgresCopyLoader:
+    """
+    Запись строк импорта в PostgreSQL: строки загружаются командой COPY
+    во временную таблицу, а затем сливаются в основную одним
+    INSERT ... ON CONFLICT DO UPDATE.
+    """
+
+    def upsert_product_infos(self, product_infos: list[ProductInfo]) -> list[ProductInfo]:
+        if not product_infos:
+            return product_infos
+        table = ProductInfo._meta.db_table
+        columns = ["product_id", "shop_id", *PRODUCT_INFO_FIELDS]
+        # COPY минует pre_save, поэтому auto_now проставляется здесь, как это делает bulk_create
+        now = timezone.now()
+        for obj in product_infos:
+            obj.updated_at = now
+        self._stage(
+            "import_stage_product_info",
+            "product_id bigint, shop_id bigint, price numeric(10, 2), price_rrc numeric(10, 2), "
+            "quantity integer, updated_at timestamp with time zone",
+            columns,
+            ([getattr(obj, column) for column in columns] for obj in product_infos)
+        )
+        ids = self._merge(table, "import_stage_product_info", columns, ["product_id", "shop_id"], PRODUCT_INFO_FIELDS)
+        for obj in product_infos:
+            obj.id = ids[(obj.product_id, obj.shop_id)]
+        return product_infos
+
+    def upsert_product_parameters(self, product_parameters: list[ProductParameter]) -> list[ProductParameter]:
+        if not product_parameters:
+            return product_parameters
+        table = ProductParameter._meta.db_table
+        columns = ["product_info_id", "parameter_id", "value"]
+        self._stage(
+            "import_stage_product_parameter",
+            "product_info_id bigint, parameter_id bigint, value varchar(40)",
+            columns,
+            ([obj.product_info.id, obj.parameter_id, obj.value] for obj in product_parameters)
+        )
+        ids = self._merge(
+            table, "import_stage_product_parameter", columns, ["product_info_id", "parameter_id"], ["value"]
+        )
+        for obj in product_parameters:
+            obj.id = ids[(obj.product_info.id, obj.parameter_id)]
+        return product_parameters
+
+    @staticmethod
+    def _stage(stage: str, definition: str, columns: list[str], rows) -> None:
+        """Загружает строки во временную таблицу командой COPY"""
+
+        buffer = io.StringIO()
+        # Строки в кавычках, чтобы пустое значение не превратилось в NULL
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        sql = f"COPY {stage} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage} ({definition}) ON COMMIT DROP")
+            cursor.execute(f"TRUNCATE {stage}")
+            raw = cursor.cursor
+            if hasattr(raw, "copy_expert"):
+                # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    @staticmethod
+    def _merge(table: str, stage: str, columns: list[str], unique: list[str], update: list[str]) -> dict:
+        """Переносит строки из временной таблицы в основную и возвращает их id по уникальному ключу"""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"SELECT {', '.join(columns)} FROM {stage} "
+                f"ON CONFLICT ({', '.join(unique)}) DO UPDATE SET "
+                f"{', '.join(f'{column} = EXCLUDED.{column}' for column in update)} "
+                f"RETURNING id, {', '.join(unique)}"
+            )
+            return {tuple(key): pk for pk, *key in cursor.fetchall()}
+
+
+def get_loader():
+    """COPY для PostgreSQL (если не отключен настройкой IMPORT_USE_COPY), иначе bulk_create"""
+
+    if connection.vendor == "postgresql" and settings.IMPORT_USE_COPY:
+        return PostgresCopyLoader()
+    return BulkCreateLoader()
@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app import catalog
+from app.models import Category, Contact, Order, OrderItem, Product, ProductInfo, Shop, User
+from app.views import OrderView
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельное оформление заказов с общими товарами: пропускная способность "
+        "и проверка, что товаров не продано больше остатка"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--products", type=int, default=5, help="Число общих товаров")
+        parser.add_argument("--stock", type=int, default=1000, help="Остаток каждого общего товара")
+        parser.add_argument("--items", type=int, default=3, help="Число товаров в корзине")
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        # Потоки работают в своих соединениях, поэтому данные сохраняются и удаляются после замера
+        rng = random.Random(0)
+        owner, hot, baskets = self._create_orders(options, rng)
+        try:
+            view = OrderView.as_view()
+            factory = APIRequestFactory()
+
+            def place(basket: tuple[User, int, int]) -> tuple[int | str, float]:
+                user, basket_id, contact_id = basket
+                request = factory.post(
+                    "/api/v1/orders/", {"basket_id": basket_id, "contact_id": contact_id}, format="json"
+                )
+                force_authenticate(request, user)
+                started = time.perf_counter()
+                try:
+                    status = view(request).status_code
+                except Exception as error:
+                    status = type(error).__name__
+                finally:
+                    connections.close_all()
+                return status, (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["threads"]) as executor:
+                results = list(executor.map(place, baskets))
+            elapsed = time.perf_counter() - started
+
+            statuses = Counter(status for status, _ in results)
+            timings = [timing for _, timing in results]
+            self.stdout.write(
+                f"Заказов: {len(baskets)}, потоков: {options['threads']}, общих товаров: {len(hot)}, "
+                f"остаток: {options['stock']}"
+            )
+            self.stdout.write(
+                f"{len(baskets) / elapsed:.0f} заказов/с, медиана {statistics.median(timings):.1f} мс, "
+                f"p95 {statistics.quantiles(timings, n=20)[-1]:.1f} мс"
+            )
+            self.stdout.write("Ответы: " + ", ".join(f"{status}: {count}" for status, count in sorted(
+                statuses.items(), key=lambda item: str(item[0])
+            )))
+
+            stock = dict(ProductInfo.objects.filter(id__in=hot).values_list("id", "quantity"))
+            sold = dict(OrderItem.objects.filter(
+                product_info_id__in=hot, order__state="new"
+            ).values_list("product_info_id").annotate(total=Sum("quantity")).order_by())
+            oversold = [
+                product_info_id for product_info_id in hot
+                if stock[product_info_id] < 0 or options["stock"] - stock[product_info_id] != sold.get(product_info_id, 0)
+            ]
+            self.stdout.write(
+                f"Продано: {sum(sold.values())}, осталось: {sum(stock.values())}, "
+                f"расхождений с остатком: {len(oversold)}"
+            )
+        finally:
+            owner.delete()
+            User.objects.filter(username__startswith="bench-buyer").delete()
+            Category.objects.filter(name="Бенчмарк заказов").delete()
+
+    @staticmethod
+    def _create_orders(options: dict, rng: random.Random) -> tuple[User, list[int], list[tuple[User, int, int]]]:
+        owner = User.objects.create_user(username="bench-shop", email="bench-shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк заказов", user=owner)
+        category = Category.objects.create(name="Бенчмарк заказов")
+        products = Product.objects.bulk_create([
+            Product(name=f"Товар {i}", categories=category) for i in range(options["products"])
+        ])
+        hot = [product_info.id for product_info in ProductInfo.objects.bulk_create([
+            ProductInfo(
+                product=product, shop=shop, price=Decimal("100.00"), price_rrc=Decimal("0"),
+                quantity=options["stock"]
+            )
+            for product in products
+        ])]
+        catalog.refresh(hot)
+
+        users = User.objects.bulk_create([
+            User(username=f"bench-buyer{i}", email=f"bench-buyer{i}@example.com", is_active=True)
+            for i in range(options["orders"])
+        ])
+        contacts = Contact.objects.bulk_create([
+            Contact(user=user, city="Москва", street="Тверская", house="1", phone="+79990000000") for user in users
+        ])
+        orders = Order.objects.bulk_create([Order(user=user, state="basket") for user in users])
+        # Товары в корзинах перемешаны: блокировки берутся по id независимо от порядка позиций
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info_id=product_info_id, quantity=rng.randint(1, 3))
+            for order in orders
+            for product_info_id in rng.sample(hot, min(options["items"], len(hot)))
+        ])
+        return owner, hot, [(user, order.id, contact.id) for user, order, contact in zip(users, orders, contacts)]
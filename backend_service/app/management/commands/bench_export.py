@@ -0,0 +1,95 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app import facets
+from app.models import Category, Parameter, Product, ProductInfo, ProductParameter, Shop, User
+from app.views import PartnerProductInfoViewSet
+
+
+class Command(BaseCommand):
+    help = "Время до первого байта, скорость и пиковая память потоковой выгрузки товаров партнера"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+        parser.add_argument("--formats", nargs="+", default=["ndjson", "csv"])
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        # Параметры действия (рендереры форматов) передаются так же, как это делает роутер
+        view = PartnerProductInfoViewSet.as_view({"get": "export"}, **PartnerProductInfoViewSet.export.kwargs)
+        factory = APIRequestFactory()
+
+        self.stdout.write(
+            f"{'товаров':>10} {'формат':>7} {'первый байт, мс':>16} {'всего, с':>9} {'строк/с':>9} "
+            f"{'размер, МБ':>11} {'память, МБ':>11}"
+        )
+        for size in options["sizes"]:
+            # Все изменения откатываются после замера
+            with transaction.atomic():
+                user = self._create_shop(size, options["batch_size"])
+                for export_format in options["formats"]:
+                    def export():
+                        request = factory.get("/api/v1/products/partner/export/", {"format": export_format})
+                        force_authenticate(request, user)
+                        return view(request).streaming_content
+
+                    first_byte, total, length = self._consume(export)
+                    tracemalloc.start()
+                    self._consume(export)
+                    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f"{size:>10} {export_format:>7} {first_byte * 1000:>16.1f} {total:>9.2f} "
+                        f"{size / total:>9.0f} {length / 2 ** 20:>11.1f} {peak:>11.1f}"
+                    )
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def _consume(export) -> tuple[float, float, int]:
+        """
+        Время от запроса до первого непустого блока и до конца выгрузки, с,
+        и размер выгрузки, байт
+        """
+
+        started = time.perf_counter()
+        first_byte = None
+        length = 0
+        for chunk in export():
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - started
+            length += len(chunk)
+        return first_byte, time.perf_counter() - started, length
+
+    @staticmethod
+    def _create_shop(rows: int, batch_size: int) -> User:
+        user = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк", user=user)
+        category = Category.objects.create(name="Смартфоны")
+        parameters = Parameter.objects.bulk_create([Parameter(name="Цвет"), Parameter(name="Память")])
+
+        for start in range(0, rows, batch_size):
+            products = Product.objects.bulk_create([
+                Product(name=f"Товар {i}", categories=category) for i in range(start, min(start + batch_size, rows))
+            ])
+            product_infos = ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    product=product, shop=shop, price=Decimal("100.00"), price_rrc=Decimal("120.00"), quantity=5
+                )
+                for product in products
+            ])
+            ProductParameter.objects.bulk_create([
+                ProductParameter(product_info=product_info, parameter=parameter, value=f"{parameter.name} {i % 20}")
+                for i, product_info in enumerate(product_infos)
+                for parameter in parameters
+            ])
+        # Колонки параметров CSV берутся из фасетов
+        facets.refresh_shop(shop.id)
+        return user
@@ -0,0 +1,165 @@
+import json
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app.formats import get_parser
+from app.generators import write_price_list
+from app.importer import PriceListImporter
+from app.models import Category, User
+
+
+# Первый импорт создает все строки, повторный того же файла проходит без изменений
+RUNS = ("initial", "repeat")
+
+class QueryCounter:
+    """Считает запросы к БД, не сохраняя их текст"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер импорта синтетических прайс-листов: время, число запросов, пиковая память "
+        "и строк/с. Результат сохраняется в JSON для сравнения между коммитами."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--parameters", type=int, default=10, help="Число разных параметров")
+        parser.add_argument("--parameters-per-item", type=int, default=3)
+        parser.add_argument("--format", choices=["json", "ndjson", "csv"], default="json")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Файл для результатов, по умолчанию bench_import-<коммит>.json")
+        parser.add_argument("--compare", help="Файл с результатами предыдущего замера")
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        commit = self._commit()
+        results = []
+        self.stdout.write(
+            f"{'товаров':>10} {'импорт':>10} {'время, с':>10} {'запросов':>10} {'память, МБ':>12} {'строк/с':>10}"
+        )
+        for size in options["sizes"]:
+            for result in self._measure(size, options):
+                results.append(result)
+                self.stdout.write(
+                    f"{result['items']:>10} {result['run']:>10} {result['seconds']:>10.2f} "
+                    f"{result['queries']:>10} {result['peak_memory_mb']:>12.1f} {result['rows_per_second']:>10.0f}"
+                )
+
+        report = {
+            "commit": commit,
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "options": {
+                key: options[key] for key in
+                ("categories", "parameters", "parameters_per_item", "format", "chunk_size", "seed")
+            },
+            "results": results
+        }
+        output = options["output"] or f"bench_import-{commit or timezone.now().strftime('%Y%m%d%H%M%S')}.json"
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Результаты сохранены в {output}")
+
+        if options["compare"]:
+            self._compare(options["compare"], results)
+
+    def _measure(self, size: int, options: dict) -> list[dict]:
+        """
+        Импортирует файл дважды: первый импорт создает все строки, повторный
+        проверяет дельту без изменений. Память замеряется отдельным прогоном,
+        так как tracemalloc замедляет импорт. Все изменения откатываются.
+        """
+
+        results = []
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="") as file, transaction.atomic():
+            user, categories = self._prepare(options["categories"])
+            write_price_list(
+                file, size, categories, options["parameters"], options["parameters_per_item"],
+                format=options["format"], seed=options["seed"]
+            )
+            file.flush()
+
+            peaks = {}
+            with transaction.atomic():
+                for run in RUNS:
+                    tracemalloc.start()
+                    try:
+                        self._import(user, file.name, options)
+                        peaks[run] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    finally:
+                        tracemalloc.stop()
+                transaction.set_rollback(True)
+
+            for run in RUNS:
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    stats = self._import(user, file.name, options)
+                    seconds = time.perf_counter() - started
+                results.append({
+                    "items": size,
+                    "run": run,
+                    "seconds": round(seconds, 3),
+                    "queries": counter.count,
+                    "peak_memory_mb": round(peaks[run], 2),
+                    "rows_per_second": round(size / seconds, 1),
+                    "stats": stats
+                })
+            transaction.set_rollback(True)
+        return results
+
+    @staticmethod
+    def _prepare(count: int) -> tuple[User, dict[int, str]]:
+        user = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        categories = Category.objects.bulk_create([Category(name=f"Категория {i}") for i in range(count)])
+        return user, {category.id: category.name for category in categories}
+
+    @staticmethod
+    def _import(user, path: str, options: dict) -> dict:
+        importer = PriceListImporter(user, chunk_size=options["chunk_size"])
+        with open(path, "rb") as file:
+            return dict(importer.run(get_parser(options["format"])(file)))
+
+    @staticmethod
+    def _commit() -> str | None:
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip() or None
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _compare(self, path: str, results: list[dict]) -> None:
+        """Выводит изменение времени, запросов и памяти относительно прошлого замера"""
+
+        with open(path, encoding="utf-8") as file:
+            previous = {(result["items"], result["run"]): result for result in json.load(file)["results"]}
+        self.stdout.write(f"Сравнение с {path}:")
+        for result in results:
+            old = previous.get((result["items"], result["run"]))
+            if old is None:
+                continue
+            changes = []
+            for key in ("seconds", "queries", "peak_memory_mb"):
+                if old[key]:
+                    changes.append(f"{key} {(result[key] - old[key]) / old[key]:+.1%}")
+            self.stdout.write(f"{result['items']:>10} {result['run']:>10} {', '.join(changes)}")
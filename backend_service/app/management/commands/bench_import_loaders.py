@@ -0,0 +1,71 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from app.loaders import BulkCreateLoader, PostgresCopyLoader
+from app.models import Category, Parameter, Product, ProductInfo, ProductParameter, Shop, User
+
+
+class Command(BaseCommand):
+    help = "Скорость записи строк импорта (строк/с): bulk_create против COPY в PostgreSQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        loaders = {"bulk_create": BulkCreateLoader}
+        if connection.vendor == "postgresql":
+            loaders["copy"] = PostgresCopyLoader
+        else:
+            self.stdout.write("COPY доступен только в PostgreSQL, замеряется только bulk_create")
+
+        self.stdout.write(f"{'строк':>10} {'загрузчик':>12} {'ProductInfo/с':>15} {'ProductParameter/с':>20}")
+        for size in options["sizes"]:
+            for name, loader_class in loaders.items():
+                # Каждый замер выполняется на чистых данных и откатывается
+                with transaction.atomic():
+                    infos, parameters = self._measure(loader_class(), size, options["batch_size"])
+                    transaction.set_rollback(True)
+                self.stdout.write(f"{size:>10} {name:>12} {infos:>15.0f} {parameters:>20.0f}")
+
+    @staticmethod
+    def _measure(loader, size: int, batch_size: int) -> tuple[float, float]:
+        user = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк", user=user)
+        category = Category.objects.create(name="Бенчмарк")
+        color, model = Parameter.objects.bulk_create([Parameter(name="Цвет"), Parameter(name="Модель")])
+        product_ids = []
+        for start in range(0, size, batch_size):
+            products = Product.objects.bulk_create(
+                [Product(name=f"Товар {i}", categories=category) for i in range(start, min(start + batch_size, size))]
+            )
+            product_ids.extend(product.id for product in products)
+
+        info_time = parameter_time = 0.0
+        for start in range(0, size, batch_size):
+            product_infos = [
+                ProductInfo(
+                    product_id=product_id, shop=shop, price=Decimal("1000.00"), price_rrc=Decimal("1200.00"),
+                    quantity=10
+                )
+                for product_id in product_ids[start:start + batch_size]
+            ]
+            started = time.perf_counter()
+            loader.upsert_product_infos(product_infos)
+            info_time += time.perf_counter() - started
+
+            product_parameters = [
+                ProductParameter(product_info=product_info, parameter=parameter, value=f"{parameter.name} {i}")
+                for i, product_info in enumerate(product_infos)
+                for parameter in (color, model)
+            ]
+            started = time.perf_counter()
+            loader.upsert_product_parameters(product_parameters)
+            parameter_time += time.perf_counter() - started
+
+        return size / info_time, 2 * size / parameter_time
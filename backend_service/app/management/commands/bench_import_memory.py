@@ -0,0 +1,87 @@
+import json
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from app.generators import write_price_list
+from app.importer import PriceListParser, PriceListImporter
+from app.models import Category, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Пиковое потребление памяти при импорте прайс-листов разного размера. "
+        "Завершается ошибкой, если память разбора или импорта растет с размером файла"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument(
+            "--max-growth", type=float, default=1.5,
+            help="Во сколько раз пик памяти на самом большом файле может превышать пик на самом маленьком"
+        )
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        # Разбор без записи показывает память самого потокового чтения: у импорта
+        # к ней добавляется постоянная доля на порцию товаров и работу с БД
+        self.stdout.write(
+            f"{'товаров':>10} {'json.load, МБ':>15} {'разбор, МБ':>12} {'импорт, МБ':>12} {'время, с':>10}"
+        )
+        peaks = []
+        for size in sorted(options["sizes"]):
+            with tempfile.TemporaryFile("w+b") as file:
+                # Все изменения откатываются после замера
+                with transaction.atomic():
+                    user = User.objects.create_user(
+                        username="bench", email="bench@example.com", type="shop", is_active=True
+                    )
+                    categories = {
+                        category.id: category.name for category in
+                        Category.objects.bulk_create([Category(name=f"Категория {i}") for i in range(10)])
+                    }
+                    text = open(file.fileno(), "w", encoding="utf-8", closefd=False)
+                    write_price_list(text, size, categories)
+                    text.flush()
+
+                    file.seek(0)
+                    load_peak = self._peak(lambda: json.load(file))
+
+                    file.seek(0)
+                    # Разборщик сам дочитывает массивы, которые не исчерпал потребитель
+                    parse_peak = self._peak(lambda: [None for _ in PriceListParser(file)])
+
+                    file.seek(0)
+                    importer = PriceListImporter(user, chunk_size=options["chunk_size"])
+                    started = time.perf_counter()
+                    stream_peak = self._peak(lambda: importer.run(PriceListParser(file)))
+                    elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+
+            peaks.append((parse_peak, stream_peak))
+            self.stdout.write(
+                f"{size:>10} {load_peak:>15.1f} {parse_peak:>12.1f} {stream_peak:>12.1f} {elapsed:>10.2f}"
+            )
+
+        (parse_first, stream_first), (parse_last, stream_last) = peaks[0], peaks[-1]
+        growth = max(parse_last / parse_first, stream_last / stream_first)
+        if growth > options["max_growth"]:
+            raise CommandError(f"Пик памяти вырос в {growth:.1f} раза (допустимо {options['max_growth']})")
+        self.stdout.write(f"Рост пика памяти: {growth:.2f} раза")
+
+    @staticmethod
+    def _peak(func) -> float:
+        """Пиковый объем памяти Python-объектов при выполнении func, МБ"""
+
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,93 @@
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from app import fast_json
+from app.generators import COLORS, write_price_list
+from app.parsers import FastJSONParser
+from app.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = "Скорость кодирования и разбора JSON: стандартные JSONRenderer/JSONParser и orjson"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000, help="Товаров в ответе каталога")
+        parser.add_argument("--items", type=int, default=10000, help="Товаров в теле импорта")
+        parser.add_argument("--repeat", type=int, default=20, help="Число замеров")
+
+    def handle(self, *args, **options):
+        if fast_json.orjson is None:
+            self.stdout.write("orjson не установлен: быстрый вариант совпадает со стандартным json")
+
+        payloads = [
+            (f"каталог, {options['products']} товаров", self._products(options["products"])),
+            (f"импорт, {options['items']} товаров", self._price_list(options["items"])),
+        ]
+        self.stdout.write(
+            f"{'данные':>24} {'операция':>10} {'размер, КБ':>11} {'json, мс':>9} {'orjson, мс':>11} {'ускорение':>10}"
+        )
+        for name, data in payloads:
+            body = JSONRenderer().render(data)
+            cases = [
+                ("кодирование", lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data)),
+                (
+                    "разбор",
+                    lambda: JSONParser().parse(io.BytesIO(body)),
+                    lambda: FastJSONParser().parse(io.BytesIO(body))
+                ),
+            ]
+            for operation, standard, fast in cases:
+                standard_time = self._measure(standard, options["repeat"])
+                fast_time = self._measure(fast, options["repeat"])
+                self.stdout.write(
+                    f"{name:>24} {operation:>10} {len(body) / 1024:>11.0f} {standard_time * 1000:>9.1f} "
+                    f"{fast_time * 1000:>11.1f} {standard_time / fast_time:>9.1f}x"
+                )
+
+    @staticmethod
+    def _measure(function, repeat: int) -> float:
+        """Медиана времени выполнения, с"""
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
+
+    @staticmethod
+    def _products(count: int) -> dict:
+        """Страница списка товаров в формате ProductInfoSerializer"""
+
+        return {
+            "next": "http://testserver/api/v1/products/?cursor=WzEsIDJd",
+            "previous": None,
+            "results": [
+                {
+                    "id": i,
+                    "product": {"id": i, "name": f"Смартфон {i}", "categories": i % 8},
+                    "shop": {"id": 1, "name": "Бенчмарк", "url": None, "user": 1, "state": True},
+                    "price": f"{100 + i}.00",
+                    "price_rrc": f"{120 + i}.00",
+                    "quantity": i % 100,
+                    "product_parameters": [
+                        {"id": i * 2, "parameter": "Цвет", "value": COLORS[i % len(COLORS)]},
+                        {"id": i * 2 + 1, "parameter": "Память", "value": str(64 * (i % 4 + 1))},
+                    ],
+                }
+                for i in range(count)
+            ],
+        }
+
+    @staticmethod
+    def _price_list(items: int) -> dict:
+        """Тело импорта в формате JSON-прайс-листа"""
+
+        file = io.StringIO()
+        write_price_list(file, items, {1: "Смартфоны", 2: "Ноутбуки", 3: "Планшеты"})
+        return fast_json.loads(file.getvalue())
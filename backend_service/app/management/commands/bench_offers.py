@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app import catalog
+from app.cache import get_cache
+from app.models import CatalogEntry, Category, Product, ProductInfo, Shop, User
+from app.pagination import KeysetPagination
+from app.views import ProductInfoListView, ProductOffersView
+
+
+class Command(BaseCommand):
+    help = "Время ответа предложений товара и списка лучших предложений, время пересчета лучших предложений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--shops", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=50, help="Число замеров каждого запроса")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        factory = APIRequestFactory()
+        offers_view = ProductOffersView.as_view()
+        list_view = ProductInfoListView.as_view()
+
+        # Все изменения откатываются после замера
+        with transaction.atomic():
+            started = time.perf_counter()
+            user, product_ids = self._create_catalog(options["products"], options["shops"], options["batch_size"], rng)
+            self.stdout.write(
+                f"Товаров: {options['products']}, магазинов: {options['shops']}, "
+                f"подготовка {time.perf_counter() - started:.0f} с"
+            )
+
+            CatalogEntry.objects.update(best=False)
+            started = time.perf_counter()
+            catalog.refresh_best(product_ids)
+            self.stdout.write(f"Пересчет лучших предложений всех товаров: {time.perf_counter() - started:.1f} с")
+
+            def offers(params: dict):
+                product_id = rng.choice(product_ids)
+                return offers_view, f"/api/v1/products/{product_id}/offers", params, {"product_id": product_id}
+
+            def best(params: dict):
+                return list_view, "/api/v1/products/", {"best": "true", **params}, {}
+
+            # Курсор сотой страницы списка лучших предложений
+            last = CatalogEntry.objects.filter(best=True).order_by(*ProductInfoListView.ordering).values_list(
+                *ProductInfoListView.ordering
+            )[100 * 20 - 1]
+            cases = [
+                ("предложения товара", offers, {}),
+                ("лучшие, стр. 1", best, {"limit": 20}),
+                ("лучшие, стр. 100", best, {"limit": 20, "cursor": KeysetPagination.make_cursor(list(last))}),
+            ]
+            self.stdout.write(f"{'запрос':>20} {'кэш':>6} {'медиана, мс':>12} {'p95, мс':>9}")
+            for name, target, params in cases:
+                for cached in (False, True):
+                    timings = self._measure(target, params, user, factory, options["repeat"], cached)
+                    self.stdout.write(
+                        f"{name:>20} {'да' if cached else 'нет':>6} {statistics.median(timings):>12.2f} "
+                        f"{statistics.quantiles(timings, n=20)[-1]:>9.2f}"
+                    )
+
+            # Изменение цены: строка каталога, лучшее предложение товара и сброс кэша
+            timings = []
+            for product_info in ProductInfo.objects.filter(product_id__in=rng.sample(product_ids, options["repeat"])):
+                product_info.price = Decimal(rng.randrange(100, 100000))
+                started = time.perf_counter()
+                product_info.save()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"Изменение цены: медиана {statistics.median(timings):.2f} мс, "
+                f"p95 {statistics.quantiles(timings, n=20)[-1]:.2f} мс"
+            )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(target, params: dict, user: User, factory, repeat: int, cached: bool) -> list[float]:
+        """Время ответа представления, мс; без кэша кэш очищается перед каждым запросом"""
+
+        timings = []
+        for _ in range(repeat):
+            view, path, query, kwargs = target(params)
+            if cached:
+                # Ответ заранее попадает в кэш
+                request = factory.get(path, query)
+                force_authenticate(request, user)
+                view(request, **kwargs)
+            else:
+                get_cache().clear()
+            request = factory.get(path, query)
+            force_authenticate(request, user)
+            started = time.perf_counter()
+            response = view(request, **kwargs)
+            response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.data
+        return timings
+
+    @staticmethod
+    def _create_catalog(products: int, shops: int, batch_size: int, rng: random.Random) -> tuple[User, list[int]]:
+        owners = User.objects.bulk_create([
+            User(username=f"bench{i}", email=f"bench{i}@example.com", type="shop", is_active=True)
+            for i in range(shops)
+        ])
+        shop_list = Shop.objects.bulk_create([
+            Shop(name=f"Бенчмарк {i}", user=owner) for i, owner in enumerate(owners)
+        ])
+        category = Category.objects.create(name="Бенчмарк")
+        product_ids = []
+        for start in range(0, products, batch_size):
+            batch = Product.objects.bulk_create([
+                Product(name=f"Товар {i:08d}", categories=category)
+                for i in range(start, min(start + batch_size, products))
+            ])
+            product_ids += [product.id for product in batch]
+            ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    product=product, shop=shop, price=Decimal(rng.randrange(100, 100000)),
+                    price_rrc=Decimal("0"), quantity=rng.randrange(0, 10)
+                )
+                for product in batch
+                for shop in shop_list
+            ], batch_size=batch_size)
+
+        catalog.rebuild()
+
+        # Статистика для планировщика, иначе он не знает о новых строках и может не выбрать индекс
+        with connection.cursor() as cursor:
+            for model in (Product, ProductInfo, Shop, CatalogEntry):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+        return owners[0], product_ids
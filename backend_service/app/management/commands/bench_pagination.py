@@ -0,0 +1,101 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app import catalog
+from app.models import CatalogEntry, Category, Product, ProductInfo, Shop, User
+from app.pagination import KeysetPagination
+from app.views import ProductInfoListView
+
+
+class OffsetProductInfoListView(ProductInfoListView):
+    """Каталог с постраничным выводом через OFFSET для сравнения"""
+
+    pagination_class = LimitOffsetPagination
+
+
+class Command(BaseCommand):
+    help = "Время ответа каталога товаров на разной глубине страниц: курсор против OFFSET"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5, help="Число замеров каждой страницы")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        page_size = options["page_size"]
+        rows = max(options["pages"]) * page_size
+        factory = APIRequestFactory()
+        keyset_view = ProductInfoListView.as_view()
+        offset_view = OffsetProductInfoListView.as_view()
+
+        # Все изменения откатываются после замера
+        with transaction.atomic():
+            user = self._create_catalog(rows, options["batch_size"])
+            entries = CatalogEntry.objects.order_by(*ProductInfoListView.ordering)
+            self.stdout.write(f"Товаров в каталоге: {rows}")
+            self.stdout.write(f"{'страница':>10} {'курсор, мс':>12} {'OFFSET, мс':>12}")
+
+            for page in options["pages"]:
+                offset = (page - 1) * page_size
+                params = {"limit": page_size}
+                if offset:
+                    # Курсор предыдущей страницы указывает на ее последнюю строку
+                    last = entries.values_list(*ProductInfoListView.ordering)[offset - 1]
+                    params["cursor"] = KeysetPagination.make_cursor(list(last))
+
+                keyset = self._measure(keyset_view, factory, user, params, options["repeat"])
+                offset_time = self._measure(
+                    offset_view, factory, user, {"limit": page_size, "offset": offset}, options["repeat"]
+                )
+                self.stdout.write(f"{page:>10} {keyset:>12.2f} {offset_time:>12.2f}")
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(view, factory, user, params: dict, repeat: int) -> float:
+        """Медианное время ответа представления, мс"""
+
+        timings = []
+        for _ in range(repeat):
+            request = factory.get("/api/v1/products/", params)
+            force_authenticate(request, user)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.data
+        return statistics.median(timings)
+
+    @staticmethod
+    def _create_catalog(rows: int, batch_size: int) -> User:
+        user = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк", user=user)
+        category = Category.objects.create(name="Бенчмарк")
+        for start in range(0, rows, batch_size):
+            products = Product.objects.bulk_create([
+                Product(name=f"Товар {i:08d}", categories=category)
+                for i in range(start, min(start + batch_size, rows))
+            ])
+            ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    product=product, shop=shop, price=Decimal("1000.00"), price_rrc=Decimal("1200.00"), quantity=10
+                )
+                for product in products
+            ])
+
+        catalog.rebuild()
+
+        # Статистика для планировщика, иначе он не знает о новых строках и может не выбрать индекс
+        with connection.cursor() as cursor:
+            for model in (Product, ProductInfo, Shop, CatalogEntry):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+        return user
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app import catalog
+from app.generators import COLORS
+from app.models import CatalogEntry, Category, Parameter, Product, ProductInfo, ProductParameter, Shop, User
+from app.search import get_search_backend
+from app.views import ProductInfoListView
+
+
+# Вид товара и его категория
+KINDS = [
+    ("Смартфон", "Смартфоны"), ("Ноутбук", "Ноутбуки"), ("Планшет", "Планшеты"), ("Наушники", "Наушники"),
+    ("Чехол", "Чехлы"), ("Телевизор", "Телевизоры"), ("Монитор", "Мониторы"), ("Клавиатура", "Клавиатуры"),
+]
+BRANDS = ["Apple", "Samsung", "Xiaomi", "Huawei", "Sony", "LG", "Lenovo", "Asus", "Honor", "Realme"]
+QUERIES = ["смартфон", "черный смартфон", "samsung 256", "ноутбук серый", "мониторы", "honor чехол 64"]
+
+
+class Command(BaseCommand):
+    help = "Время ответа поиска по каталогу товаров (первая страница, по релевантности)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--queries", nargs="+", default=QUERIES)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5, help="Число замеров каждого запроса")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = ProductInfoListView.as_view()
+
+        # Все изменения откатываются после замера
+        with transaction.atomic():
+            started = time.perf_counter()
+            user = self._create_catalog(options["rows"], options["batch_size"])
+            self.stdout.write(f"Каталог из {options['rows']} товаров создан за {time.perf_counter() - started:.1f} с")
+
+            started = time.perf_counter()
+            get_search_backend().rebuild()
+            self.stdout.write(f"Индекс построен за {time.perf_counter() - started:.1f} с ({connection.vendor})")
+
+            self.stdout.write(f"{'запрос':>20} {'найдено':>10} {'медиана, мс':>12} {'макс, мс':>10}")
+            for query in options["queries"]:
+                found = get_search_backend().search(ProductInfo.objects.all(), query).count()
+                timings = []
+                for _ in range(options["repeat"]):
+                    request = factory.get("/api/v1/products/", {"q": query, "limit": options["page_size"]})
+                    force_authenticate(request, user)
+                    started = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.data
+                self.stdout.write(
+                    f"{query:>20} {found:>10} {statistics.median(timings):>12.1f} {max(timings):>10.1f}"
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _create_catalog(rows: int, batch_size: int) -> User:
+        rng = random.Random(0)
+        user = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк", user=user)
+        categories = Category.objects.bulk_create([Category(name=category) for _, category in KINDS])
+        color, memory = Parameter.objects.bulk_create([Parameter(name="Цвет"), Parameter(name="Память")])
+
+        for start in range(0, rows, batch_size):
+            kinds = [rng.randrange(len(KINDS)) for _ in range(start, min(start + batch_size, rows))]
+            products = Product.objects.bulk_create([
+                Product(name=f"{KINDS[kind][0]} {rng.choice(BRANDS)} {start + i}", categories=categories[kind])
+                for i, kind in enumerate(kinds)
+            ])
+            product_infos = ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    product=product, shop=shop, price=Decimal(rng.randrange(1000, 200000)),
+                    price_rrc=Decimal(rng.randrange(1000, 200000)), quantity=rng.randrange(100)
+                )
+                for product in products
+            ])
+            ProductParameter.objects.bulk_create([
+                ProductParameter(product_info=product_info, parameter=parameter, value=value)
+                for product_info in product_infos
+                for parameter, value in ((color, rng.choice(COLORS)), (memory, str(rng.choice((64, 128, 256)))))
+            ])
+
+        catalog.rebuild()
+
+        # Статистика для планировщика, иначе он не знает о новых строках и может не выбрать индекс
+        with connection.cursor() as cursor:
+            for model in (Product, ProductInfo, ProductParameter, Shop, CatalogEntry):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+        return user
@@ -0,0 +1,97 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from django.test.utils import override_settings
+
+from app import catalog
+from app.fast_serializers import FastSerializer
+from app.models import (
+    Category, Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter, Shop, User
+)
+from app.serializers import OrderSerializer, ProductInfoSerializer
+
+
+class Command(BaseCommand):
+    help = "Скорость сериализации списков: сериализаторы DRF и быстрая сериализация из .values()"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+        parser.add_argument("--items", type=int, default=5, help="Позиций в каждом заказе")
+        parser.add_argument("--repeat", type=int, default=5, help="Число замеров каждого размера")
+
+    # При DEBUG=True Django копит текст всех запросов, что искажает замер
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        rows = max(options["sizes"])
+        # Все изменения откатываются после замера
+        with transaction.atomic():
+            user = self._create_data(rows, options["items"])
+            product_infos = catalog.product_info_queryset().order_by("id")
+            orders = Order.objects.filter(user=user).prefetch_related("order_items").select_related(
+                "contact"
+            ).annotate(
+                total_sum=Sum(F("order_items__quantity") * F("order_items__product_info__price"))
+            ).order_by("id")
+            cases = [
+                ("ProductInfo", ProductInfoSerializer, product_infos),
+                ("Order", OrderSerializer, orders),
+            ]
+
+            self.stdout.write(
+                f"{'сериализатор':>12} {'строк':>7} {'DRF, стр/с':>12} {'быстрая, стр/с':>15} {'ускорение':>10}"
+            )
+            for name, serializer_class, queryset in cases:
+                fast_serializer = FastSerializer(serializer_class)
+                for size in options["sizes"]:
+                    drf = self._measure(
+                        lambda: serializer_class(queryset[:size], many=True).data, options["repeat"]
+                    )
+                    fast = self._measure(lambda: fast_serializer.serialize(queryset[:size]), options["repeat"])
+                    self.stdout.write(
+                        f"{name:>12} {size:>7} {size / drf:>12.0f} {size / fast:>15.0f} {drf / fast:>9.1f}x"
+                    )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(serialize, repeat: int) -> float:
+        """Медиана времени сериализации, включая запросы к БД, с"""
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
+
+    @staticmethod
+    def _create_data(rows: int, items: int) -> User:
+        owner = User.objects.create_user(username="bench", email="bench@example.com", type="shop", is_active=True)
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        shop = Shop.objects.create(name="Бенчмарк", user=owner)
+        category = Category.objects.create(name="Смартфоны")
+        parameters = Parameter.objects.bulk_create([Parameter(name="Цвет"), Parameter(name="Память")])
+
+        products = Product.objects.bulk_create(
+            [Product(name=f"Товар {i}", categories=category) for i in range(rows)]
+        )
+        product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, price=Decimal("100.00"), price_rrc=Decimal("120.00"), quantity=5)
+            for product in products
+        ])
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info=product_info, parameter=parameter, value=f"{parameter.name} {i}")
+            for i, product_info in enumerate(product_infos)
+            for parameter in parameters
+        ])
+
+        orders = Order.objects.bulk_create([Order(user=user, state="new") for _ in range(rows)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info=product_infos[(i + j) % rows], quantity=j + 1)
+            for i, order in enumerate(orders)
+            for j in range(items)
+        ])
+        return user
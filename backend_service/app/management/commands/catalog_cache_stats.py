@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Число попаданий и промахов кэша ответов каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Обнулить счетчики после вывода")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'список':>12} {'попадания':>10} {'промахи':>10} {'доля, %':>8}")
+        for view, stats in get_stats().items():
+            total = stats["hits"] + stats["misses"]
+            ratio = stats["hits"] / total * 100 if total else 0
+            self.stdout.write(f"{view:>12} {stats['hits']:>10} {stats['misses']:>10} {ratio:>8.1f}")
+        if options["reset"]:
+            reset_stats()
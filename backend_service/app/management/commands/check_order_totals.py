@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.order_totals import inconsistent_totals, refresh
+
+
+class Command(BaseCommand):
+    help = "Проверяет суммы и число позиций заказов по позициям и ценам товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true", help="Пересчитать заказы с расхождениями"
+        )
+
+    def handle(self, *args, **options):
+        ids = list(inconsistent_totals())
+        if not ids:
+            self.stdout.write("Суммы заказов совпадают с позициями")
+            return
+        if not options["fix"]:
+            raise CommandError(f"Расходятся суммы заказов ({len(ids)}): {', '.join(map(str, ids[:100]))}")
+
+        with transaction.atomic():
+            refresh(ids)
+        self.stdout.write(f"Пересчитано заказов: {len(ids)}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.idempotency import get_store
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи Idempotency-Key и самые старые ключи сверх IDEMPOTENCY_MAX_KEYS"
+
+    def handle(self, *args, **options):
+        deleted = get_store().purge()
+        self.stdout.write(f"Удалено ключей: {deleted}")
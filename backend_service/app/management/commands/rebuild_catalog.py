@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.catalog import inconsistent_entries, rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересобирает каталог для чтения (CatalogEntry) по нормализованным таблицам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true", help="Только проверить каталог и вывести расхождения"
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            ids = list(inconsistent_entries())
+            if ids:
+                raise CommandError(f"Расходятся строки каталога ({len(ids)}): {', '.join(map(str, ids[:100]))}")
+            self.stdout.write("Каталог совпадает с нормализованными таблицами")
+            return
+
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write("Каталог пересобран")
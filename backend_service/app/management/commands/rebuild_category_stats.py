@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.cache import bump_shop
+from app.category_stats import inconsistent_stats, rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает статистику категорий (CategoryStats) по товарам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true", help="Только проверить статистику и вывести расхождения"
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            ids = list(inconsistent_stats())
+            if ids:
+                raise CommandError(f"Расходится статистика категорий ({len(ids)}): {', '.join(map(str, ids[:100]))}")
+            self.stdout.write("Статистика категорий совпадает с товарами")
+            return
+
+        with transaction.atomic():
+            rebuild()
+            # Список категорий кэшируется с версией товаров
+            bump_shop()
+        self.stdout.write("Статистика категорий пересчитана")
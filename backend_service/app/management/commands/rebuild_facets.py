@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.cache import bump_shop
+from app.facets import refresh_shop
+from app.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает фасеты параметров товаров по всем магазинам"
+
+    def handle(self, *args, **options):
+        for shop_id in Shop.objects.values_list("id", flat=True):
+            with transaction.atomic():
+                refresh_shop(shop_id)
+                bump_shop(shop_id)
+        self.stdout.write("Фасеты пересчитаны")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import ProductInfo
+from app.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс товаров (после миграции или при расхождениях)"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            get_search_backend().rebuild()
+        self.stdout.write(f"Проиндексировано товаров: {ProductInfo.objects.count()}")
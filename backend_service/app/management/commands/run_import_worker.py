@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.jobs import fail_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = "Пул процессов, выполняющих фоновые задачи импорта прайс-листов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить задачи из очереди в текущем процессе и завершиться"
+        )
+
+    def handle(self, *args, **options):
+        stale = fail_stale_jobs()
+        if stale:
+            self.stdout.write(f"Помечено зависших задач: {stale}")
+
+        if options["once"] or options["processes"] == 1:
+            work(options["poll_interval"], once=options["once"])
+            return
+
+        # Дочерние процессы не должны наследовать соединения родителя
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=work, args=(options["poll_interval"],), daemon=True)
+            for _ in range(options["processes"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Запущено воркеров импорта: {len(workers)}")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
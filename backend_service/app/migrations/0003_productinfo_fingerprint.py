@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_alter_confirmemailtoken_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='Отпечаток строки импорта'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='format',
+            field=models.CharField(default='json', max_length=10, verbose_name='Формат файла'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Таблица поискового индекса: tsvector с GIN-индексом в PostgreSQL, FTS5 в SQLite"""
+
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE product_info_search ("
+            "id bigint PRIMARY KEY REFERENCES app_productinfo (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "vector tsvector NOT NULL)"
+        )
+        schema_editor.execute("CREATE INDEX product_info_search_vector_idx ON product_info_search USING gin (vector)")
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE product_info_search USING fts5("
+            "name, category, parameters, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute("DROP TABLE product_info_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
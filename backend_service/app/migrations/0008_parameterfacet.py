@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facets(apps, schema_editor):
+    """Начальный подсчет фасетов по уже загруженным товарам"""
+
+    ProductParameter = apps.get_model("app", "ProductParameter")
+    ParameterFacet = apps.get_model("app", "ParameterFacet")
+    counts = ProductParameter.objects.values("product_info__shop_id", "parameter_id", "value").annotate(
+        count=Count("id")
+    ).order_by()
+    ParameterFacet.objects.bulk_create(
+        (
+            ParameterFacet(
+                shop_id=row["product_info__shop_id"], parameter_id=row["parameter_id"],
+                value=row["value"], count=row["count"]
+            )
+            for row in counts.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=40, verbose_name='Значение')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество товаров')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='app.parameter', verbose_name='Параметр')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='app.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Фасет параметра',
+                'verbose_name_plural': 'Список фасетов параметров',
+                'ordering': ('shop', 'parameter', 'value'),
+                'constraints': [models.UniqueConstraint(fields=('shop', 'parameter', 'value'), name='unique_parameter_facet')],
+            },
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
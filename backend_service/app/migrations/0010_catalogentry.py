@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='app.productinfo', verbose_name='Информация о продукте')),
+                ('shop_name', models.CharField(max_length=50, verbose_name='Название магазина')),
+                ('shop_state', models.BooleanField(verbose_name='Статус приема заказов')),
+                ('product_name', models.CharField(max_length=40, verbose_name='Название товара')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('document', models.JSONField(verbose_name='Карточка товара')),
+                ('shop_document', models.JSONField(verbose_name='Магазин')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='app.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Строка каталога',
+                'verbose_name_plural': 'Каталог для чтения',
+                'indexes': [models.Index(fields=['product_name', 'product_info'], name='catalog_product_name_idx'), models.Index(fields=['shop_name'], name='catalog_shop_name_idx')],
+            },
+        ),
+    ]
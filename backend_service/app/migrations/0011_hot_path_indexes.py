@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_catalogentry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='catalogentry',
+            name='catalog_product_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='catalogentry',
+            name='catalog_shop_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('shop_state', True)), fields=['product_name', 'product_info'], name='catalog_open_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('shop_state', True)), fields=['price', 'product_info'], name='catalog_open_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('shop_state', True)), fields=['shop_name', 'product_name', 'product_info'], name='catalog_open_shop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product_info', 'order'], name='order_item_product_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'price'], name='product_info_shop_price_idx'),
+        ),
+    ]
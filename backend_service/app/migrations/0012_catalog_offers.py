@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
+
+
+def fill_offers(apps, schema_editor):
+    """Товар, остаток и лучшие предложения для уже собранных строк каталога"""
+
+    CatalogEntry = apps.get_model("app", "CatalogEntry")
+    ProductInfo = apps.get_model("app", "ProductInfo")
+
+    product_info = ProductInfo.objects.filter(pk=OuterRef("product_info"))
+    CatalogEntry.objects.update(
+        product=Subquery(product_info.values("product")[:1]),
+        quantity=Subquery(product_info.values("quantity")[:1])
+    )
+    best = CatalogEntry.objects.filter(shop_state=True, quantity__gt=0).annotate(
+        offer_rank=Window(RowNumber(), partition_by=F("product"), order_by=[F("price").asc(), F("pk").asc()])
+    ).filter(offer_rank=1).values("pk")
+    CatalogEntry.objects.filter(pk__in=best).update(best=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogentry',
+            name='best',
+            field=models.BooleanField(default=False, verbose_name='Лучшее предложение'),
+        ),
+        migrations.AddField(
+            model_name='catalogentry',
+            name='product',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='app.product', verbose_name='Продукт'),
+        ),
+        migrations.AddField(
+            model_name='catalogentry',
+            name='quantity',
+            field=models.IntegerField(default=0, verbose_name='Количество'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_offers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='catalogentry',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='app.product', verbose_name='Продукт'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['product', 'price', 'product_info'], name='catalog_offer_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('best', True)), fields=['product_name', 'product_info'], name='catalog_best_name_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min
+
+
+def fill_stats(apps, schema_editor):
+    """Статистика всех существующих категорий"""
+
+    Category = apps.get_model("app", "Category")
+    CategoryStats = apps.get_model("app", "CategoryStats")
+    ProductInfo = apps.get_model("app", "ProductInfo")
+
+    rows = ProductInfo.objects.filter(shop__state=True, quantity__gt=0).values(
+        category=F("product__categories")
+    ).annotate(
+        product_count=Count("product", distinct=True),
+        shop_count=Count("shop", distinct=True),
+        price_min=Min("price"),
+        price_max=Max("price")
+    ).order_by()
+    values = {row.pop("category"): row for row in rows}
+    CategoryStats.objects.bulk_create(
+        [
+            CategoryStats(category_id=category_id, **values.get(category_id, {}))
+            for category_id in Category.objects.values_list("id", flat=True)
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_catalog_offers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.category', verbose_name='Категория')),
+                ('product_count', models.IntegerField(default=0, verbose_name='Количество товаров')),
+                ('shop_count', models.IntegerField(default=0, verbose_name='Количество магазинов')),
+                ('price_min', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Минимальная цена')),
+                ('price_max', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Максимальная цена')),
+            ],
+            options={
+                'verbose_name': 'Статистика категории',
+                'verbose_name_plural': 'Статистика категорий',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:59
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    """Сумма и число позиций всех существующих заказов"""
+
+    Order = apps.get_model("app", "Order")
+    OrderItem = apps.get_model("app", "OrderItem")
+
+    items = OrderItem.objects.filter(order=OuterRef("pk")).order_by().values("order")
+    Order.objects.update(
+        total_sum=Coalesce(
+            Subquery(items.annotate(total=Sum(F("quantity") * F("product_info__price"))).values("total")),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+        items_count=Coalesce(Subquery(items.annotate(count=Count("id")).values("count")), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_category_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.IntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='productinfo',
+            name='fingerprint',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:19
+
+import time
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    # Общие версии каталога создаются сразу, чтобы запрос с пустым кэшем не создавал их сам
+    CacheVersion = apps.get_model("app", "CacheVersion")
+    CacheVersion.objects.bulk_create([
+        CacheVersion(key=key, version=time.time_ns()) for key in ("catalog:version", "catalog:version:products")
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_remove_productinfo_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('version', models.BigIntegerField(verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия кэша',
+                'verbose_name_plural': 'Версии кэша',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -18,6 +18,17 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+# Допустимое количество товара в одной позиции заказа
+MIN_ITEM_QUANTITY = 1
+MAX_ITEM_QUANTITY = 100
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -161,6 +172,8 @@ class Shop(models.Model):
         verbose_name="Статус приема заказов",
         default=True
     )
+    # Меняется и при изменении товаров магазина: по нему проверяется актуальность каталога
+    updated_at = models.DateTimeField(verbose_name="Время изменения", auto_now=True)
 
     def __str__(self):
         return self.name
@@ -169,6 +182,8 @@ class Shop(models.Model):
         verbose_name = "Магазин"
         verbose_name_plural = "Список магазинов"
         ordering = ('name',)
+        # Порядок постраничного вывода по курсору
+        indexes = [models.Index(fields=["name", "id"], name="shop_name_id_idx")]
 
 
 class Category(models.Model):
@@ -186,6 +201,8 @@ class Category(models.Model):
         verbose_name = "Категория"
         verbose_name_plural = "Список категорий"
         ordering = ('name',)
+        # Порядок постраничного вывода по курсору
+        indexes = [models.Index(fields=["name", "id"], name="category_name_id_idx")]
 
 
 class Product(models.Model):
@@ -205,6 +222,8 @@ class Product(models.Model):
         verbose_name = "Продукт"
         verbose_name_plural = "Список продуктов"
         ordering = ('name',)
+        # Порядок постраничного вывода по курсору
+        indexes = [models.Index(fields=["name", "id"], name="product_name_id_idx")]
 
 
 class ProductInfo(models.Model):
@@ -231,6 +250,7 @@ class ProductInfo(models.Model):
         decimal_places=2
     )
     quantity = models.IntegerField(verbose_name="Количество")
+    updated_at = models.DateTimeField(verbose_name="Время изменения", auto_now=True)
 
     def __str__(self):
         return f'{self.product} {self.shop}'
@@ -245,6 +265,12 @@ class ProductInfo(models.Model):
                 name='unique_product_shop'
             )
         ]
+        indexes = [
+            # Время последнего изменения товаров магазина
+            models.Index(fields=["shop", "updated_at"], name="product_info_shop_updated_idx"),
+            # Товары партнера с фильтром по цене
+            models.Index(fields=["shop", "price"], name="product_info_shop_price_idx"),
+        ]
 
 
 class Parameter(models.Model):
@@ -289,6 +315,165 @@ class ProductParameter(models.Model):
         ]
 
 
+class ParameterFacet(models.Model):
+    """
+    Количество товаров магазина с данным значением параметра. Поддерживается
+    при импорте и изменении товаров, чтобы не считать фасеты каталога на каждый запрос.
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="parameter_facets",
+        on_delete=models.CASCADE
+    )
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name="Параметр",
+        related_name="facets",
+        on_delete=models.CASCADE
+    )
+    value = models.CharField(verbose_name="Значение", max_length=40)
+    count = models.IntegerField(verbose_name="Количество товаров", default=0)
+
+    def __str__(self):
+        return f'{self.shop} {self.parameter} {self.value}: {self.count}'
+
+    class Meta:
+        verbose_name = "Фасет параметра"
+        verbose_name_plural = "Список фасетов параметров"
+        ordering = ('shop', 'parameter', 'value')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shop', 'parameter', 'value'],
+                name='unique_parameter_facet'
+            )
+        ]
+
+
+class CacheVersion(models.Model):
+    """
+    Версия закэшированных ответов каталога. Версии хранятся в БД, а не в кэше:
+    изменение в любом процессе (запрос API, обработчик очереди импорта)
+    сбрасывает ответы, закэшированные во всех процессах.
+    """
+
+    key = models.CharField(verbose_name="Ключ", max_length=100, primary_key=True)
+    version = models.BigIntegerField(verbose_name="Версия")
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+    class Meta:
+        verbose_name = "Версия кэша"
+        verbose_name_plural = "Версии кэша"
+
+
+class CategoryStats(models.Model):
+    """
+    Количество товаров и магазинов и диапазон цен категории по предложениям открытых
+    магазинов в наличии. Поддерживается при импорте и изменении товаров, чтобы
+    список категорий не считал агрегаты на каждый запрос.
+    """
+
+    category = models.OneToOneField(
+        Category,
+        verbose_name="Категория",
+        related_name="stats",
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    product_count = models.IntegerField(verbose_name="Количество товаров", default=0)
+    shop_count = models.IntegerField(verbose_name="Количество магазинов", default=0)
+    price_min = models.DecimalField(
+        verbose_name="Минимальная цена", max_digits=10, decimal_places=2, blank=True, null=True
+    )
+    price_max = models.DecimalField(
+        verbose_name="Максимальная цена", max_digits=10, decimal_places=2, blank=True, null=True
+    )
+
+    def __str__(self):
+        return f'{self.category}: {self.product_count}'
+
+    class Meta:
+        verbose_name = "Статистика категории"
+        verbose_name_plural = "Статистика категорий"
+
+
+class CatalogEntry(models.Model):
+    """
+    Строка каталога для чтения: готовый JSON карточки товара (ProductInfoSerializer)
+    и колонки для фильтров и порядка. Обновляется при импорте, изменении товаров
+    и магазинов, полностью пересобирается командой rebuild_catalog.
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="catalog_entry",
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="catalog_entries",
+        on_delete=models.CASCADE
+    )
+    product = models.ForeignKey(
+        Product,
+        verbose_name="Продукт",
+        related_name="catalog_entries",
+        on_delete=models.CASCADE,
+        # Строки товара ищутся по индексу catalog_offer_price_idx
+        db_index=False
+    )
+    shop_name = models.CharField(verbose_name="Название магазина", max_length=50)
+    shop_state = models.BooleanField(verbose_name="Статус приема заказов")
+    product_name = models.CharField(verbose_name="Название товара", max_length=40)
+    price = models.DecimalField(verbose_name="Цена", max_digits=10, decimal_places=2)
+    quantity = models.IntegerField(verbose_name="Количество")
+    # Самое дешевое предложение товара среди открытых магазинов (catalog.refresh_best)
+    best = models.BooleanField(verbose_name="Лучшее предложение", default=False)
+    # Карточка без магазина: магазин хранится отдельно, чтобы его изменение было одним UPDATE
+    document = models.JSONField(verbose_name="Карточка товара")
+    shop_document = models.JSONField(verbose_name="Магазин")
+
+    def __str__(self):
+        return f'{self.product_name} {self.shop_name}'
+
+    def to_representation(self) -> dict:
+        return {**self.document, "shop": self.shop_document}
+
+    class Meta:
+        verbose_name = "Строка каталога"
+        verbose_name_plural = "Каталог для чтения"
+        # Список читает только строки открытых магазинов, поэтому индексы частичные:
+        # порядок вывода по курсору (и фильтр по товару), фильтр по цене, каталог магазина
+        indexes = [
+            models.Index(
+                fields=["product_name", "product_info"], condition=models.Q(shop_state=True),
+                name="catalog_open_name_idx"
+            ),
+            models.Index(
+                fields=["price", "product_info"], condition=models.Q(shop_state=True),
+                name="catalog_open_price_idx"
+            ),
+            models.Index(
+                fields=["shop_name", "product_name", "product_info"], condition=models.Q(shop_state=True),
+                name="catalog_open_shop_idx"
+            ),
+            # Предложения товара по цене и выбор лучшего из них. Индекс не частичный:
+            # при пересчете снимается отметка и с предложений закрытых магазинов
+            models.Index(fields=["product", "price", "product_info"], name="catalog_offer_price_idx"),
+            # Список лучших предложений в порядке вывода
+            models.Index(
+                fields=["product_name", "product_info"], condition=models.Q(best=True),
+                name="catalog_best_name_idx"
+            ),
+        ]
+
+
 class Contact(models.Model):
     user = models.ForeignKey(
         User,
@@ -302,6 +487,8 @@ class Contact(models.Model):
     building = models.CharField(verbose_name="Корпус", max_length=10, blank=True)
     apartment = models.CharField(verbose_name="Квартира", max_length=10, blank=True)
     phone = models.CharField(verbose_name="Телефон", max_length=20)
+    # Контакт выводится в заказах, поэтому его изменение входит в отметку изменений заказов
+    updated_at = models.DateTimeField(verbose_name="Время изменения", auto_now=True)
 
     def __str__(self):
         return f'{self.user} {self.city} {self.street} {self.house} {self.apartment} {self.phone}'
@@ -321,6 +508,7 @@ class Order(models.Model):
         on_delete=models.CASCADE
     )
     dt = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name="Время изменения", auto_now=True)
     state = models.CharField(
         verbose_name="Статус",
         choices=STATE_CHOICES,
@@ -334,6 +522,9 @@ class Order(models.Model):
         null=True,
         on_delete=models.CASCADE
     )
+    # Поддерживаются при изменении позиций и цен (app.order_totals), чтобы списки не агрегировали позиции
+    total_sum = models.DecimalField(verbose_name="Сумма", max_digits=14, decimal_places=2, default=0)
+    items_count = models.IntegerField(verbose_name="Количество позиций", default=0)
 
     def __str__(self):
         return f'{self.user} {self.dt} {self.state} {self.contact}'
@@ -342,6 +533,13 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
         ordering = ('user',)
+        indexes = [
+            # Порядок постраничного вывода по курсору: заказы пользователя и все заказы
+            models.Index(fields=["user", "dt", "id"], name="order_user_dt_id_idx"),
+            models.Index(fields=["dt", "id"], name="order_dt_id_idx"),
+            # Корзина пользователя
+            models.Index(fields=["user", "state"], name="order_user_state_idx"),
+        ]
 
 
 class OrderItem(models.Model):
@@ -358,6 +556,7 @@ class OrderItem(models.Model):
         on_delete=models.CASCADE
     )
     quantity = models.IntegerField(verbose_name="Количество")
+    updated_at = models.DateTimeField(verbose_name="Время изменения", auto_now=True)
 
     def __str__(self):
         return f'{self.order} {self.product_info} {self.quantity}'
@@ -372,6 +571,8 @@ class OrderItem(models.Model):
                 name='unique_order_product_info'
             )
         ]
+        # Заказы партнера: позиции по товарам магазина без чтения самой таблицы позиций
+        indexes = [models.Index(fields=["product_info", "order"], name="order_item_product_order_idx")]
 
 
 class ConfirmEmailToken(models.Model):
@@ -410,3 +611,84 @@ class ConfirmEmailToken(models.Model):
 
     def __str__(self):
         return f"Подтверждение Email для пользователя {self.user}"
+
+
+class ImportJob(models.Model):
+    """Задача фонового импорта прайс-листа"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        related_name="import_jobs",
+        on_delete=models.CASCADE
+    )
+    file = models.FileField(verbose_name="Файл", upload_to="imports/")
+    format = models.CharField(verbose_name="Формат файла", max_length=10, default="json")
+    state = models.CharField(
+        verbose_name="Статус",
+        choices=IMPORT_STATE_CHOICES,
+        max_length=15,
+        default="queued"
+    )
+    stats = models.JSONField(verbose_name="Статистика", default=dict, blank=True)
+    errors = models.JSONField(verbose_name="Ошибки", default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Обновляется воркером во время импорта; задача без отметок дольше IMPORT_JOB_TIMEOUT считается зависшей
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user} {self.state} {self.created_at}'
+
+    class Meta:
+        verbose_name = "Задача импорта"
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['state', 'created_at'], name='import_job_queue_idx'),
+        ]
+        constraints = [
+            # Импорты одного магазина выполняются строго по очереди
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(state='running'),
+                name='unique_running_import_per_user'
+            )
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key"""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        related_name="idempotency_keys",
+        on_delete=models.CASCADE
+    )
+    key = models.CharField(verbose_name="Ключ", max_length=255)
+    # Метод, путь и тело запроса: повтор ключа с другим запросом отклоняется
+    fingerprint = models.CharField(verbose_name="Отпечаток запроса", max_length=64)
+    # Пока запрос выполняется, ответа нет
+    status_code = models.IntegerField(verbose_name="Код ответа", null=True, blank=True)
+    content = models.BinaryField(verbose_name="Тело ответа", default=b"")
+    content_type = models.CharField(verbose_name="Тип ответа", max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(verbose_name="Срок хранения")
+
+    def __str__(self):
+        return f'{self.user} {self.key} {self.status_code}'
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Список ключей идемпотентности"
+        constraints = [
+            # Поиск ключа - одно чтение по этому индексу
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user')
+        ]
+        indexes = [
+            # Удаление просроченных ключей и вытеснение самых старых
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
@@ -0,0 +1,99 @@
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from app.models import Order, OrderItem
+
+
+TOTALS_BATCH_SIZE = 500
+TOTALS_FIELDS = ["total_sum", "items_count"]
+# Суммы завершенных заказов не следуют за ценами товаров и остаются такими, какими были при завершении
+FINAL_STATES = ("delivered", "canceled")
+
+
+def _sum(items) -> Coalesce:
+    """Выражение суммы позиций items, сгруппированных по заказу"""
+
+    return Coalesce(
+        Subquery(items.annotate(total=Sum(F("quantity") * F("product_info__price"))).values("total")),
+        Value(Decimal("0")),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _totals(order) -> dict:
+    """Выражения суммы и числа позиций заказа order (OuterRef или поле)"""
+
+    items = OrderItem.objects.filter(order=order).order_by().values("order")
+    return {
+        "total_sum": _sum(items),
+        "items_count": Coalesce(Subquery(items.annotate(count=Count("id")).values("count")), Value(0))
+    }
+
+
+def shop_sum(order, user_id: int) -> Coalesce:
+    """
+    Выражение суммы позиций заказа order из магазина пользователя user_id.
+    Не хранится: считается подзапросом только для заказов страницы партнера.
+    """
+
+    return _sum(OrderItem.objects.filter(order=order, product_info__shop__user_id=user_id).order_by().values("order"))
+
+
+def refresh(order_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает сумму и число позиций заказов одним UPDATE с подзапросами
+    по позициям. Вызывается в транзакции, изменившей позиции или цены.
+    """
+
+    ids = sorted(set(order_ids))
+    for start in range(0, len(ids), TOTALS_BATCH_SIZE):
+        Order.objects.filter(id__in=ids[start:start + TOTALS_BATCH_SIZE]).update(**_totals(OuterRef("pk")))
+
+
+def product_orders(product_info_ids: Iterable[int], active: bool = False) -> list[int]:
+    """id заказов (только незавершенных, если active), в которых есть указанные товары"""
+
+    items = OrderItem.objects.filter(product_info_id__in=list(product_info_ids))
+    if active:
+        items = items.exclude(order__state__in=FINAL_STATES)
+    return list(items.values_list("order_id", flat=True).distinct())
+
+
+def refresh_products(product_info_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает незавершенные заказы с товарами, цена которых изменилась.
+    История доставленных и отмененных заказов не перезаписывается при каждой смене цены.
+    """
+
+    refresh(product_orders(product_info_ids, active=True))
+
+
+def rebuild() -> None:
+    """Пересчитывает суммы всех заказов"""
+
+    refresh(Order.objects.values_list("id", flat=True))
+
+
+def inconsistent_totals() -> Iterator[int]:
+    """
+    id заказов, сумма или число позиций которых не совпадает с позициями.
+    У завершенных заказов сравнивается только число позиций: их сумма
+    посчитана по ценам на момент завершения.
+    """
+
+    ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), TOTALS_BATCH_SIZE):
+        rows = Order.objects.filter(id__in=ids[start:start + TOTALS_BATCH_SIZE]).annotate(**{
+            f"expected_{field}": expression for field, expression in _totals(OuterRef("pk")).items()
+        }).order_by("id").values_list(
+            "id", "state", *TOTALS_FIELDS, *(f"expected_{field}" for field in TOTALS_FIELDS)
+        )
+        for order_id, state, *values in rows:
+            stored, expected = values[:len(TOTALS_FIELDS)], values[len(TOTALS_FIELDS):]
+            if state in FINAL_STATES:
+                stored, expected = stored[1:], expected[1:]
+            if stored != expected:
+                yield order_id
@@ -0,0 +1,145 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по курсору (keyset).
+
+    Порядок задается атрибутом ordering (или методом get_ordering) представления, например
+    ("product__name", "id") или ("-dt", "-id"); последнее поле должно быть
+    уникальным. Курсор хранит значения полей последней строки страницы,
+    а следующая страница выбирается условием "после этих значений", поэтому
+    время ответа не зависит от глубины страницы (в отличие от OFFSET).
+    """
+
+    page_size = 50
+    max_page_size = 1000
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор"
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list:
+        self.request = request
+        self.ordering = list(view.get_ordering() if hasattr(view, "get_ordering") else view.ordering)
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        # Предыдущая страница выбирается в обратном порядке и затем разворачивается
+        ordering = [self._invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else values is not None
+        has_previous = has_more if reverse else values is not None
+        self.next_values = self._values(rows[-1]) if rows and has_next else None
+        self.previous_values = self._values(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data
+        })
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self) -> str | None:
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values, reverse=False)
+
+    def get_previous_link(self) -> str | None:
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, reverse=True)
+
+    def encode_cursor(self, values: list, reverse: bool) -> str:
+        token = self.make_cursor(values, reverse)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    @staticmethod
+    def make_cursor(values: list, reverse: bool = False) -> str:
+        """Курсор страницы после (или перед, reverse) строки со значениями полей порядка values"""
+
+        # str, а не DjangoJSONEncoder: тот обрезает микросекунды у дат
+        cursor = json.dumps([values, reverse], default=str, ensure_ascii=False)
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, request) -> tuple[list | None, bool]:
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            values, reverse = json.loads(base64.urlsafe_b64decode(token.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, bool(reverse)
+
+    def _values(self, obj) -> list:
+        """Значения полей порядка у объекта (включая поля связанных моделей) или у строки .values()"""
+
+        if isinstance(obj, dict):
+            return [obj[field.lstrip("-")] for field in self.ordering]
+        values = []
+        for field in self.ordering:
+            value = obj
+            for name in field.lstrip("-").split("__"):
+                value = getattr(value, name)
+            values.append(value)
+        return values
+
+    @staticmethod
+    def _invert(field: str) -> str:
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _after(ordering: list[str], values: list) -> Q:
+        """
+        Условие "строка после values" в порядке ordering:
+        a >= x AND (a > x OR (a = x AND b > y) OR ...).
+        Условие по первому полю позволяет начать просмотр индекса сразу с нужного места.
+        """
+
+        fields = [(field.lstrip("-"), "lt" if field.startswith("-") else "gt") for field in ordering]
+        conditions = []
+        for i, (field, lookup) in enumerate(fields):
+            equal = {name: value for (name, _), value in zip(fields[:i], values)}
+            conditions.append(Q(**equal, **{f"{field}__{lookup}": values[i]}))
+        first, lookup = fields[0]
+        return Q(**{f"{first}__{lookup}e": values[0]}) & reduce(or_, conditions)
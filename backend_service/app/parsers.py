@@ -0,0 +1,23 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from app import fast_json
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на fast_json.loads: тело запроса разбирается целиком из байтов"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if not self.strict:
+            # orjson не принимает NaN и Infinity
+            return super().parse(stream, media_type, parser_context)
+
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace("-", "") != "utf8":
+                data = data.decode(encoding)
+            return fast_json.loads(data)
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
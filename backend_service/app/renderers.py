@@ -1,9 +1,54 @@
-import json
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 
-from rest_framework.renderers import JSONRenderer
+from app import fast_json
 
 
-class UserJSONRenderer(JSONRenderer):
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на fast_json.dumps. Для вывода с отступами (browsable API,
+    Accept: application/json; indent=4) и нестандартных настроек JSON
+    используется обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как и JSONRenderer, экранируем U+2028 и U+2029 для совместимости с JavaScript
+        return fast_json.dumps(data, self.encoder_class).replace(
+            b"\xe2\x80\xa8", b"\\u2028"
+        ).replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Выгрузка в NDJSON. Тело выгрузки потоково формирует представление,
+    здесь выводятся только ответы с ошибками (одной строкой JSON).
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return fast_json.dumps(data) + b"\n"
+
+
+class CSVRenderer(NDJSONRenderer):
+    """Выгрузка в CSV, ошибки выводятся так же, как в NDJSONRenderer"""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+
+class UserJSONRenderer(FastJSONRenderer):
     charset = "utf-8"
 
     def render(self, data, media_type=None, renderer_context=None):
@@ -18,6 +63,6 @@ class UserJSONRenderer(JSONRenderer):
             # Декодирует token если он имеет тип bytes.
             data["token"] = token.decode("utf-8")
 
-        return json.dumps({
+        return super(UserJSONRenderer, self).render({
             "user": data
-        })
\ No newline at end of file
+        }, media_type, renderer_context)
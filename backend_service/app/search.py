@@ -0,0 +1,179 @@
+import re
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+
+from app.models import Category, Product, ProductInfo, ProductParameter
+
+
+SEARCH_TABLE = "product_info_search"
+SEARCH_BATCH_SIZE = 500
+WORD = re.compile(r"\w+")
+
+
+def search_words(query: str) -> list[str]:
+    """Слова поискового запроса без служебных символов синтаксиса поиска"""
+
+    return WORD.findall(query.lower())
+
+
+def _documents_sql(aggregate: str, where: str) -> str:
+    """
+    Строки поискового индекса: id ProductInfo, название товара, название
+    категории и значения параметров через пробел
+    """
+
+    return (
+        f"SELECT pi.id, p.name, c.name, "
+        f"(SELECT {aggregate} FROM {ProductParameter._meta.db_table} pp WHERE pp.product_info_id = pi.id) "
+        f"FROM {ProductInfo._meta.db_table} pi "
+        f"JOIN {Product._meta.db_table} p ON p.id = pi.product_id "
+        f"JOIN {Category._meta.db_table} c ON c.id = p.categories_id "
+        f"{where}"
+    )
+
+
+def _id_column(queryset: QuerySet) -> str:
+    """
+    Колонка id ProductInfo в выборке: поиск работает и по ProductInfo,
+    и по строкам каталога (CatalogEntry), первичный ключ которых - id ProductInfo
+    """
+
+    meta = queryset.model._meta
+    return f"{meta.db_table}.{meta.pk.column}"
+
+
+def _nothing(queryset: QuerySet) -> QuerySet:
+    """Пустой результат для запроса без слов, с полем rank для сортировки"""
+
+    return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+
+
+class PostgresSearch:
+    """
+    Поиск в PostgreSQL: tsvector хранится в таблице product_info_search
+    с GIN-индексом. Вес названия товара - A, категории - B, параметров - C.
+    """
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        words = search_words(query)
+        if not words:
+            return _nothing(queryset)
+        # Каждое слово ищется и как префикс: "смарт" найдет "смартфон"
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        params = [settings.SEARCH_CONFIG, tsquery]
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT id FROM {SEARCH_TABLE} WHERE vector @@ to_tsquery(%s, %s)", params)
+        # ts_rank возвращает real: без приведения к float8 значение в курсоре страницы
+        # не совпадает с вычисленным в запросе, и строки с равной релевантностью теряются
+        ).annotate(rank=RawSQL(
+            f"SELECT ts_rank(vector, to_tsquery(%s, %s))::float8 FROM {SEARCH_TABLE} "
+            f"WHERE id = {_id_column(queryset)}",
+            params,
+            output_field=FloatField()
+        ))
+
+    def reindex(self, product_info_ids: Iterable[int]) -> None:
+        ids = list(product_info_ids)
+        for start in range(0, len(ids), SEARCH_BATCH_SIZE):
+            self._index("WHERE pi.id = ANY(%s)", [ids[start:start + SEARCH_BATCH_SIZE]])
+
+    def rebuild(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+        self._index("", [])
+
+    @staticmethod
+    def _index(where: str, params: list) -> None:
+        config = settings.SEARCH_CONFIG
+        documents = _documents_sql("string_agg(pp.value, ' ')", where)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (id, vector) "
+                f"SELECT id, setweight(to_tsvector(%s, name), 'A') "
+                f"|| setweight(to_tsvector(%s, category), 'B') "
+                f"|| setweight(to_tsvector(%s, coalesce(parameters, '')), 'C') "
+                f"FROM ({documents}) AS documents (id, name, category, parameters) "
+                f"ON CONFLICT (id) DO UPDATE SET vector = EXCLUDED.vector",
+                [config, config, config, *params]
+            )
+
+
+class SqliteSearch:
+    """
+    Поиск в SQLite: виртуальная таблица FTS5 product_info_search
+    (rowid - id ProductInfo), релевантность - bm25 с весами колонок.
+    """
+
+    RANK = f"-bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0)"
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        words = search_words(query)
+        if not words:
+            return _nothing(queryset)
+        match = " ".join(f'"{word}"*' for word in words)
+        # bm25 вычисляется только в запросе с MATCH по самой таблице FTS5,
+        # поэтому она присоединяется к выборке, а не используется в подзапросе
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[f"{SEARCH_TABLE}.rowid = {_id_column(queryset)}", f"{SEARCH_TABLE} MATCH %s"],
+            params=[match]
+        ).annotate(rank=RawSQL(self.RANK, [], output_field=FloatField()))
+
+    def reindex(self, product_info_ids: Iterable[int]) -> None:
+        ids = list(product_info_ids)
+        for start in range(0, len(ids), SEARCH_BATCH_SIZE):
+            batch = ids[start:start + SEARCH_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+            self._index(f"WHERE pi.id IN ({placeholders})", batch)
+
+    def rebuild(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        self._index("", [])
+
+    @staticmethod
+    def _index(where: str, params: list) -> None:
+        documents = _documents_sql("group_concat(pp.value, ' ')", where)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, category, parameters) {documents}", params
+            )
+
+
+class SimpleSearch:
+    """Поиск подстрокой для остальных СУБД, без индекса и релевантности"""
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        words = search_words(query)
+        if not words:
+            return _nothing(queryset)
+        for word in words:
+            matching = ProductInfo.objects.filter(
+                Q(product__name__icontains=word)
+                | Q(product__categories__name__icontains=word)
+                | Q(product_parameters__value__icontains=word)
+            ).values("id")
+            queryset = queryset.filter(pk__in=matching)
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    def reindex(self, product_info_ids: Iterable[int]) -> None:
+        pass
+
+    def rebuild(self) -> None:
+        pass
+
+
+def get_search_backend():
+    """Полнотекстовый поиск по товарам для текущей СУБД"""
+
+    if connection.vendor == "postgresql":
+        return PostgresSearch()
+    if connection.vendor == "sqlite":
+        return SqliteSearch()
+    return SimpleSearch()
@@ -6,14 +6,18 @@ from django.contrib.auth import authenticate
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from django.utils import timezone
 
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from app import basket
+from app.sparse import project
 from app.models import (
     Contact, User, ConfirmEmailToken,
     Shop, Category, Product, ProductInfo,
-    ProductParameter, Order, OrderItem
+    ProductParameter, Order, OrderItem, ImportJob, CatalogEntry,
+    MAX_ITEM_QUANTITY, MIN_ITEM_QUANTITY
 )
 from app.permissions import (
     IsShopOwnerOrAdmin,
@@ -220,10 +224,20 @@ class ProductSerializer(serializers.ModelSerializer):
 
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer для категории"""
-    
+
+    # Заранее подсчитанная статистика (CategoryStats)
+    product_count = serializers.IntegerField(source="stats.product_count", read_only=True)
+    shop_count = serializers.IntegerField(source="stats.shop_count", read_only=True)
+    price_min = serializers.DecimalField(
+        source="stats.price_min", max_digits=10, decimal_places=2, read_only=True
+    )
+    price_max = serializers.DecimalField(
+        source="stats.price_max", max_digits=10, decimal_places=2, read_only=True
+    )
+
     class Meta:
         model = Category
-        fields = ["id", "name", "shops"]
+        fields = ["id", "name", "shops", "product_count", "shop_count", "price_min", "price_max"]
         read_only_fields = ("id",)
     
     def permission_classes(self):
@@ -259,6 +273,18 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
+class CatalogEntrySerializer(serializers.BaseSerializer):
+    """Serializer для строки каталога: готовая карточка в формате ProductInfoSerializer"""
+
+    def to_representation(self, instance: CatalogEntry) -> dict:
+        fields, expand = self.context.get("sparse_fields", (None, None))
+        if fields is None:
+            return instance.to_representation()
+        # Без раскрытия магазина выводится его id, а shop_document не загружается
+        shop = instance.shop_document if "shop" in expand else instance.shop_id
+        return project({**instance.document, "shop": shop}, fields, expand)
+
+
 class ProductInfoUpdateDestroySerializer(serializers.ModelSerializer):
     """Serializer для обновления и удаления информации о товаре"""
 
@@ -334,17 +360,46 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return [IsAuthenticated , IsOrderOwnerOrAdmin]
 
 
+ITEM_QUANTITY_ERRORS = {
+    "min_value": f"Количество товара должно быть не менее {MIN_ITEM_QUANTITY}",
+    "max_value": f"Количество товара должно быть не более {MAX_ITEM_QUANTITY}"
+}
+
+
+class BasketItemSerializer(serializers.Serializer):
+    """Позиция для добавления в корзину; товары проверяются одним запросом на весь список"""
+
+    product_info = serializers.IntegerField()
+    quantity = serializers.IntegerField(
+        min_value=MIN_ITEM_QUANTITY, max_value=MAX_ITEM_QUANTITY, error_messages=ITEM_QUANTITY_ERRORS
+    )
+
+
+class BasketItemUpdateSerializer(serializers.Serializer):
+    """Новое количество позиции корзины"""
+
+    id = serializers.IntegerField()
+    quantity = serializers.IntegerField(
+        min_value=MIN_ITEM_QUANTITY, max_value=MAX_ITEM_QUANTITY, error_messages=ITEM_QUANTITY_ERRORS
+    )
+
+
+class BasketItemDeleteSerializer(serializers.Serializer):
+    """Позиция корзины для удаления"""
+
+    id = serializers.IntegerField()
+
+
 class OrderSerializer(serializers.ModelSerializer):
     """Serializer для заказа"""
 
     order_items = OrderItemSerializer(read_only=True, many=True)
-    total_sum = serializers.IntegerField(read_only=True)
     contact = ContactSerializer(read_only=True)
     
     class Meta:
         model = Order
-        fields = ["id", "user", "state", "dt", "contact", "order_items", "total_sum"]
-        read_only_fields = ("id", "dt")
+        fields = ["id", "user", "state", "dt", "contact", "order_items", "total_sum", "items_count"]
+        read_only_fields = ("id", "dt", "total_sum", "items_count")
 
 
 class OrderUpdateDestroySerializer(serializers.ModelSerializer):
@@ -352,27 +407,39 @@ class OrderUpdateDestroySerializer(serializers.ModelSerializer):
 
     contact = ContactSerializer(read_only=True)
     order_items = OrderItemSerializer(many=True)
-    total_sum = serializers.IntegerField(read_only=True)
+    # Сумма только позиций магазина партнера (аннотация shop_total_sum представления)
+    total_sum = serializers.DecimalField(source="shop_total_sum", max_digits=14, decimal_places=2, read_only=True)
     
     class Meta:
         model = Order
-        fields = ["id", "user", "state", "dt", "contact", "order_items", "total_sum"]
-        read_only_fields = ("id", "user", "dt")
+        fields = ["id", "user", "state", "dt", "contact", "order_items", "total_sum", "items_count"]
+        read_only_fields = ("id", "user", "dt", "items_count")
+
+    def validate_state(self, value: str) -> str:
+        # Товары отмененного заказа уже вернулись на склад
+        if self.instance is not None and self.instance.state == "canceled" and value != "canceled":
+            raise serializers.ValidationError("Отмененный заказ нельзя вернуть в работу")
+        # Товары корзины не зарезервированы, повторное оформление списало бы их второй раз
+        if value == "basket":
+            raise serializers.ValidationError("Заказ нельзя вернуть в корзину")
+        return value
     
     def update(self, instance: Order, validated_data: dict):
         """Метод обновления экземпляра Order"""
 
-        if self.request.user.type != "shop":
+        if self.context["request"].user.type != "shop":
             raise PermissionDenied("Только для магазинов")
 
         contact_data = validated_data.pop("contact", None)
         order_items_data = validated_data.pop("order_items", None)
+        state = validated_data.pop("state", None)
         with transaction.atomic():
             if contact_data:
                 contact_instance = instance.contact
                 ContactSerializer(contact_instance).update(contact_instance, contact_data)
 
             if order_items_data:
+                quantities = {}
                 for data in order_items_data:
                     try:
                         order_item_instance = get_object_or_404(instance.order_items, id=data["id"])
@@ -382,11 +449,41 @@ class OrderUpdateDestroySerializer(serializers.ModelSerializer):
                     except Http404:
                         raise Http404(f"Элемент заказа c id={data["id"]} не найден")
                     else:
-                        OrderItemSerializer(order_item_instance).update(order_item_instance, data)
+                        quantities[order_item_instance.id] = data["quantity"]
+                # Резерв оформленного заказа меняется на разницу количеств
+                try:
+                    basket.change_quantities(instance.id, quantities)
+                except basket.OutOfStock as error:
+                    raise serializers.ValidationError({"quantity": (
+                        f"Недостаточно товара на складе: {', '.join(map(str, error.product_info_ids))}"
+                    )})
+
+            # Отмена после изменения позиций возвращает на склад именно зарезервированное
+            if state == "canceled":
+                basket.cancel(instance.id)
+            elif state is not None:
+                # update минует auto_now
+                Order.objects.filter(pk=instance.pk).update(state=state, updated_at=timezone.now())
+            instance.refresh_from_db()
 
-            for attr, value in validated_data.items():
-                setattr(instance, attr, value)
+        return instance
 
-            instance.save()
 
-        return instance
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Serializer для задачи импорта"""
+
+    timings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ["id", "state", "stats", "errors", "created_at", "started_at", "finished_at", "timings"]
+        read_only_fields = fields
+
+    def get_timings(self, obj: ImportJob) -> dict:
+        """Время ожидания в очереди и выполнения в секундах"""
+
+        now = timezone.now()
+        return {
+            "queued": ((obj.started_at or now) - obj.created_at).total_seconds(),
+            "running": ((obj.finished_at or now) - obj.started_at).total_seconds() if obj.started_at else None,
+        }
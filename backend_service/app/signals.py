@@ -1,9 +1,16 @@
 from typing import Type
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver, Signal
-from app.models import ConfirmEmailToken, User, Order
+from django.utils import timezone
+from app import cache, catalog, category_stats, order_totals
+from app.basket import stock_changed
+from app.models import (
+    Category, CategoryStats, ConfirmEmailToken, User, Order, OrderItem, Product, ProductInfo, ProductParameter,
+    Shop
+)
 
 
 new_order = Signal()
@@ -56,3 +63,248 @@ def new_order_signal(sender: Type[Order], user_id, **kwargs):
         to=[user.email]
     )
     msg.send()
+
+
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=Category)
+@receiver(m2m_changed, sender=Category.shops.through)
+def catalog_changed_signal(sender, **kwargs):
+    """
+    Сброс кэша каталога при изменении магазинов и категорий
+    """
+    cache.bump_global()
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_changed_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Сброс кэша товаров магазина
+    """
+    cache.bump_shop(instance.shop_id)
+
+
+@receiver(post_delete, sender=ProductInfo)
+def product_info_deleted_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Удаленный товар не меняет время изменения других товаров, поэтому отмечается изменение магазина
+    """
+    Shop.objects.filter(id=instance.shop_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def product_changed_signal(sender: Type[Product], instance: Product, **kwargs):
+    """
+    Название товара общее для всех магазинов: изменяются все его предложения
+    """
+    shop_ids = list(instance.product_infos.values_list("shop_id", flat=True))
+    instance.product_infos.update(updated_at=timezone.now())
+    for shop_id in shop_ids:
+        cache.bump_shop(shop_id)
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_changed_signal(sender: Type[ProductParameter], instance: ProductParameter, **kwargs):
+    """
+    Сброс кэша товаров магазина, к товару которого относится параметр
+    """
+    if ProductParameter.product_info.is_cached(instance):
+        shop_id = instance.product_info.shop_id
+    else:
+        shop_id = ProductInfo.objects.filter(id=instance.product_info_id).values_list("shop_id", flat=True).first()
+    ProductInfo.objects.filter(id=instance.product_info_id).update(updated_at=timezone.now())
+    cache.bump_shop(shop_id)
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_catalog_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Обновление строки каталога для чтения
+    """
+    catalog.refresh([instance.id])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def product_info_deleted_catalog_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Строка каталога удаляется каскадно, лучшим становится следующее предложение товара
+    """
+    origin = kwargs.get("origin")
+    if origin is not None and getattr(origin, "model", type(origin)) is Product:
+        # Товар удаляется вместе со всеми предложениями
+        return
+    catalog.refresh_best([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_catalog_signal(sender: Type[ProductParameter], instance: ProductParameter, **kwargs):
+    """
+    Обновление строки каталога товара, к которому относится параметр
+    """
+    origin = kwargs.get("origin")
+    if origin is not None and getattr(origin, "model", type(origin)) is not ProductParameter:
+        # Параметр удаляется вместе с товаром или магазином, строка каталога удалится каскадно
+        return
+    catalog.refresh([instance.product_info_id])
+
+
+@receiver(post_save, sender=Product)
+def product_catalog_signal(sender: Type[Product], instance: Product, **kwargs):
+    """
+    Обновление строк каталога всех предложений товара
+    """
+    catalog.refresh(instance.product_infos.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Shop)
+def shop_catalog_signal(sender: Type[Shop], instance: Shop, **kwargs):
+    """
+    Перенос названия и статуса магазина в его строки каталога
+    """
+    catalog.refresh_shop(instance)
+
+
+@receiver(post_save, sender=Category)
+def category_stats_created_signal(sender: Type[Category], instance: Category, created: bool, **kwargs):
+    """
+    Пустая статистика новой категории
+    """
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_delete, sender=ProductInfo)
+def product_info_category_stats_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Пересчет статистики категории товара после фиксации транзакции, если изменились
+    поля, от которых она зависит
+    """
+    origin = kwargs.get("origin")
+    if origin is not None and getattr(origin, "model", type(origin)) is not ProductInfo:
+        # Предложение удаляется вместе с товаром или магазином, их сигналы пересчитают статистику
+        return
+    previous = getattr(instance, "_previous_stats_key", None)
+    if kwargs["signal"] is post_save and previous == category_stats.stats_key(
+        instance.product_id, instance.shop_id, instance.quantity, instance.price
+    ):
+        # Например, остаток изменился, но товар по-прежнему в наличии
+        return
+    product_ids = {instance.product_id, previous[0] if previous else None} - {None}
+    transaction.on_commit(lambda: category_stats.refresh_products(product_ids))
+
+
+@receiver(pre_save, sender=Product)
+def product_category_remember_signal(sender: Type[Product], instance: Product, **kwargs):
+    """
+    Запоминает прежнюю категорию товара: при ее смене пересчитываются обе категории
+    """
+    instance._previous_category_id = Product.objects.filter(pk=instance.pk).values_list(
+        "categories_id", flat=True
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def product_category_stats_signal(sender: Type[Product], instance: Product, **kwargs):
+    """
+    Пересчет статистики категорий товара
+    """
+    category_stats.refresh([instance.categories_id, getattr(instance, "_previous_category_id", None)])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted_category_stats_signal(sender: Type[Product], instance: Product, **kwargs):
+    """
+    Пересчет статистики категории удаленного товара
+    """
+    origin = kwargs.get("origin")
+    if isinstance(origin, Category) or getattr(origin, "model", None) is Category:
+        # Товар удаляется вместе с категорией: статистика удаленной категории не нужна
+        return
+    category_stats.refresh([instance.categories_id])
+
+
+@receiver(post_save, sender=Shop)
+def shop_category_stats_signal(sender: Type[Shop], instance: Shop, **kwargs):
+    """
+    Статус магазина влияет на статистику всех его категорий
+    """
+    category_stats.refresh_shop(instance.id)
+
+
+@receiver(pre_delete, sender=Shop)
+def shop_categories_remember_signal(sender: Type[Shop], instance: Shop, **kwargs):
+    """
+    Запоминает категории магазина до каскадного удаления его товаров
+    """
+    instance._category_ids = category_stats.shop_categories(instance.id)
+
+
+@receiver(post_delete, sender=Shop)
+def shop_deleted_category_stats_signal(sender: Type[Shop], instance: Shop, **kwargs):
+    """
+    Пересчет статистики категорий удаленного магазина
+    """
+    category_stats.refresh(getattr(instance, "_category_ids", ()))
+
+
+@receiver(pre_save, sender=ProductInfo)
+def product_info_price_remember_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Запоминает прежние цену и наличие товара: суммы заказов и статистика категорий
+    пересчитываются только при их изменении
+    """
+    previous = ProductInfo.objects.filter(pk=instance.pk).values_list(
+        "price", "product_id", "shop_id", "quantity"
+    ).first() if instance.pk else None
+    instance._previous_price = previous[0] if previous else None
+    instance._previous_stats_key = category_stats.stats_key(*previous[1:], previous[0]) if previous else None
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_order_totals_signal(sender: Type[ProductInfo], instance: ProductInfo, created: bool, **kwargs):
+    """
+    Пересчет сумм незавершенных заказов с товаром, цена которого изменилась
+    """
+    if not created and getattr(instance, "_previous_price", None) != instance.price:
+        order_totals.refresh_products([instance.id])
+
+
+@receiver(pre_delete, sender=ProductInfo)
+def product_info_orders_remember_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Запоминает заказы с товаром до каскадного удаления их позиций
+    """
+    instance._order_ids = order_totals.product_orders([instance.id])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def product_info_deleted_order_totals_signal(sender: Type[ProductInfo], instance: ProductInfo, **kwargs):
+    """
+    Пересчет сумм заказов, из которых удалены позиции товара
+    """
+    order_totals.refresh(getattr(instance, "_order_ids", ()))
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_order_totals_signal(sender: Type[OrderItem], instance: OrderItem, **kwargs):
+    """
+    Пересчет суммы заказа при изменении позиции через ORM (пакетные изменения корзины пересчитывают ее сами)
+    """
+    origin = kwargs.get("origin")
+    if origin is not None and getattr(origin, "model", type(origin)) is not OrderItem:
+        # Позиции удаляются вместе с заказом или товаром, их сигналы пересчитают суммы
+        return
+    order_totals.refresh([instance.order_id])
+
+
+@receiver(stock_changed)
+def stock_changed_signal(sender, product_info_ids: list[int], **kwargs):
+    """
+    Каталог, статистика категорий и кэш после списания или возврата товаров на склад
+    """
+    with transaction.atomic():
+        catalog.refresh(product_info_ids)
+        rows = ProductInfo.objects.filter(id__in=product_info_ids).values_list("product_id", "shop_id")
+        category_stats.refresh_products({product_id for product_id, _ in rows})
+        for shop_id in {shop_id for _, shop_id in rows}:
+            cache.bump_shop(shop_id)
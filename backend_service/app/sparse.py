@@ -0,0 +1,117 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from app.fast_serializers import FastSerializer
+
+
+@lru_cache(maxsize=None)
+def _field_names(serializer_class) -> tuple[tuple[str, ...], frozenset]:
+    """Поля ответа сериализатора и вложенные объекты среди них"""
+
+    fields = {name: field for name, field in serializer_class().fields.items() if not field.write_only}
+    relations = frozenset(
+        name for name, field in fields.items() if isinstance(field, serializers.BaseSerializer)
+    )
+    return tuple(fields), relations
+
+
+def _names(request: Request, parameter: str) -> list[str] | None:
+    value = request.query_params.get(parameter)
+    if value is None:
+        return None
+    return [name for name in (part.strip() for part in value.split(",")) if name]
+
+
+def get_sparse_fields(request: Request, serializer_class) -> tuple[frozenset | None, frozenset | None]:
+    """
+    Поля ответа по параметрам fields и expand строки запроса.
+
+    Без параметров возвращает (None, None) - полный ответ со всеми вложенными объектами.
+    Иначе выводятся только поля fields (все поля, если fields не указан) и связи
+    из expand, а остальные вложенные объекты заменяются на id.
+    """
+
+    fields, expand = _names(request, "fields"), _names(request, "expand")
+    if fields is None and expand is None:
+        return None, None
+
+    names, relations = _field_names(serializer_class)
+    errors = {}
+    unknown = set(fields or ()) - set(names)
+    if unknown:
+        errors["fields"] = f"Неизвестные поля: {', '.join(sorted(unknown))}"
+    unknown = set(expand or ()) - relations
+    if unknown:
+        errors["expand"] = f"Нельзя раскрыть поля: {', '.join(sorted(unknown))}"
+    if errors:
+        raise ValidationError(errors)
+
+    expand = frozenset(expand or ())
+    return (frozenset(names) if fields is None else frozenset(fields) | expand), expand
+
+
+@lru_cache(maxsize=256)
+def fast_serializer(serializer_class, fields: frozenset | None = None, expand: frozenset | None = None):
+    """FastSerializer для набора полей; разбор сериализатора выполняется один раз на набор"""
+
+    return FastSerializer(serializer_class, fields=fields, expand=expand)
+
+
+def project(data: dict, fields: frozenset | None, expand: frozenset | None) -> dict:
+    """
+    Сокращает готовое представление до полей fields: вложенные объекты
+    вне expand заменяются на id, списки объектов - на списки id
+    """
+
+    if fields is None:
+        return data
+    item = {}
+    for name, value in data.items():
+        if name not in fields:
+            continue
+        if name not in expand:
+            if isinstance(value, dict):
+                value = value["id"]
+            elif isinstance(value, list):
+                value = [child["id"] for child in value]
+        item[name] = value
+    return item
+
+
+class SparseFieldsMixin:
+    """
+    Параметры fields и expand для представлений. Поля описывает
+    sparse_serializer_class (по умолчанию сериализатор представления).
+    """
+
+    sparse_serializer_class = None
+
+    def get_sparse_fields(self) -> tuple[frozenset | None, frozenset | None]:
+        if not hasattr(self, "_sparse_fields"):
+            self._sparse_fields = get_sparse_fields(
+                self.request, self.sparse_serializer_class or self.get_serializer_class()
+            )
+        return self._sparse_fields
+
+    def includes(self, name: str) -> bool:
+        """Выводится ли поле в ответе"""
+
+        fields, _ = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def expands(self, name: str) -> bool:
+        """Выводится ли связь вложенным объектом"""
+
+        fields, expand = self.get_sparse_fields()
+        return fields is None or name in expand
+
+    def get_fast_serializer(self) -> FastSerializer:
+        return fast_serializer(
+            self.sparse_serializer_class or self.get_serializer_class(), *self.get_sparse_fields()
+        )
+
+    def get_serializer_context(self) -> dict:
+        return {**super().get_serializer_context(), "sparse_fields": self.get_sparse_fields()}
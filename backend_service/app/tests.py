@@ -1,3 +1,2146 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import JsonResponse as DjangoJsonResponse
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from app import basket, catalog, category_stats, export, facets, fast_json, order_totals
+from app.cache import GLOBAL_VERSION, bump_global, get_stats, reset_stats
+from app.fast_serializers import FastSerializer
+from app import formats
+from app.formats import detect_format, get_parser, parse_csv
+from app.idempotency import DatabaseStore
+from app.generators import write_price_list
+from app.importer import READ_SIZE, PriceListError, PriceListImporter, PriceListParser
+from app.jobs import claim_next_job, fail_stale_jobs, run_job, work
+from app.parsers import FastJSONParser
+from app.renderers import FastJSONRenderer
+from app.search import PostgresSearch
+from app.views import (
+    OrderView, PartnerOrderView, PartnerProductInfoViewSet, ProductInfoListView, ProductOffersView
+)
+from app.serializers import (
+    CategorySerializer, OrderSerializer, ProductInfoSerializer, ProductInfoUpdateDestroySerializer
+)
+from app.models import (
+    User,
+    CacheVersion,
+    CatalogEntry,
+    CategoryStats,
+    Contact,
+    ParameterFacet,
+    Shop,
+    Category,
+    Product,
+    ProductInfo,
+    Parameter,
+    ProductParameter,
+    Order,
+    OrderItem,
+    IdempotencyKey,
+    ImportJob,
+)
+
+
+def create_catalog(rows: int, shop: Shop, category: Category, parameters: list[Parameter]) -> list[ProductInfo]:
+    """Создает rows товаров магазина с параметрами"""
+
+    products = Product.objects.bulk_create(
+        [Product(name=f"{shop.name} {i}", categories=category) for i in range(rows)]
+    )
+    product_infos = ProductInfo.objects.bulk_create([
+        ProductInfo(product=product, shop=shop, price=Decimal("100.00"), price_rrc=Decimal("120.00"), quantity=5)
+        for product in products
+    ])
+    ProductParameter.objects.bulk_create([
+        ProductParameter(product_info=product_info, parameter=parameter, value=f"{parameter.name} {i}")
+        for i, product_info in enumerate(product_infos)
+        for parameter in parameters
+    ])
+    # bulk_create минует сигналы, поэтому каталог для чтения обновляется явно
+    catalog.refresh(product_info.id for product_info in product_infos)
+    return product_infos
+
+
+class ProductCatalogQueryTests(TestCase):
+    """Число запросов каталога товаров не зависит от количества строк"""
+
+    # Отметка изменений для ETag, версии кэша, готовые карточки из каталога для чтения и фасеты списка
+    LIST_QUERY_BUDGET = 4
+    DETAIL_QUERY_BUDGET = 1
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="Password-123", is_active=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Магазин", user=owner)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.parameters = Parameter.objects.bulk_create([Parameter(name="Цвет"), Parameter(name="Память")])
+
+        # Товары выключенного магазина в каталог не попадают
+        closed_owner = User.objects.create_user(
+            username="closed", email="closed@example.com", type="shop", is_active=True
+        )
+        closed_shop = Shop.objects.create(name="Закрыт", user=closed_owner, state=False)
+        create_catalog(3, closed_shop, self.category, self.parameters)
+
+    def test_list_query_budget(self):
+        for rows in (10, 100, 1000):
+            with self.subTest(rows=rows):
+                ProductInfo.objects.filter(shop=self.shop).delete()
+                Product.objects.filter(product_infos__isnull=True).delete()
+                create_catalog(rows, self.shop, self.category, self.parameters)
+
+                with self.assertNumQueries(self.LIST_QUERY_BUDGET):
+                    response = self.client.get(reverse("products"), {"limit": rows})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), rows)
+                item = response.data["results"][0]
+                self.assertEqual(item["shop"]["name"], "Магазин")
+                self.assertEqual(item["product"]["categories"], self.category.id)
+                self.assertEqual(len(item["product_parameters"]), 2)
+
+    def test_detail_query_budget(self):
+        product_info = create_catalog(1, self.shop, self.category, self.parameters)[0]
+
+        with self.assertNumQueries(self.DETAIL_QUERY_BUDGET):
+            response = self.client.get(reverse("product", args=[product_info.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["product"]["name"], "Магазин 0")
+        self.assertEqual(
+            sorted(parameter["value"] for parameter in response.data["product_parameters"]),
+            ["Память 0", "Цвет 0"]
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    """Постраничный вывод каталога по курсору"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Магазин", user=owner)
+        category = Category.objects.create(name="Смартфоны")
+        create_catalog(25, self.shop, category, [])
+        # Одинаковые названия товаров различаются по id
+        duplicates = Product.objects.bulk_create([Product(name="Магазин 1", categories=category) for _ in range(3)])
+        catalog.refresh(product_info.id for product_info in ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=self.shop, price=Decimal("5.00"), price_rrc=Decimal("5.00"), quantity=1)
+            for product in duplicates
+        ]))
+
+    def walk(self, url: str, params: dict | None = None) -> list[dict]:
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            if response.data["next"] is None:
+                return pages
+            response = self.client.get(response.data["next"])
+
+    def test_pages_cover_catalog_in_order(self):
+        pages = self.walk(reverse("products"), {"limit": 4})
+
+        ids = [item["id"] for page in pages for item in page["results"]]
+        expected = list(ProductInfo.objects.order_by("product__name", "id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 7)
+        self.assertIsNone(pages[0]["previous"])
+
+    def test_previous_page(self):
+        first = self.client.get(reverse("products"), {"limit": 5}).data
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+
+        self.assertEqual(back["results"], first["results"])
+        self.assertIsNone(back["previous"])
+        self.assertIsNotNone(back["next"])
+
+    def test_with_filter(self):
+        pages = self.walk(reverse("products"), {"limit": 2, "price_min": 10})
+
+        ids = {item["id"] for page in pages for item in page["results"]}
+        self.assertEqual(ids, set(ProductInfo.objects.filter(price__gte=10).values_list("id", flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("products"), {"cursor": "bad"})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTests(TestCase):
+    """Полнотекстовый поиск по каталогу (в тестах - FTS5 SQLite)"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.owner = User.objects.create_user(
+            username="shop", email="shop@example.com", type="shop", is_active=True
+        )
+        self.phones = Category.objects.create(name="Телефоны")
+        self.accessories = Category.objects.create(name="Аксессуары")
+        # Каталог загружается импортом, который обновляет поисковый индекс
+        PriceListImporter(self.owner).run([
+            ("shop", "Связной"),
+            ("categories", [{"name": "Телефоны"}, {"name": "Аксессуары"}]),
+            ("items", [
+                {"name": "Смартфон Apple iPhone", "category": self.phones.id, "price": 100000,
+                 "price_rrc": 110000, "quantity": 5, "parameters": [{"Цвет": "черный"}]},
+                {"name": "Чехол кожаный", "category": self.accessories.id, "price": 1000,
+                 "price_rrc": 1200, "quantity": 50, "parameters": [{"Совместимость": "для смартфона"}]},
+                {"name": "Ноутбук", "category": self.accessories.id, "price": 50000,
+                 "price_rrc": 55000, "quantity": 1, "parameters": [{"Цвет": "серый"}]},
+            ])
+        ])
+
+    def search(self, query: str) -> list[str]:
+        response = self.client.get(reverse("products"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [item["product"]["name"] for item in response.data["results"]]
+
+    def test_ranked_by_relevance(self):
+        # Совпадение в названии важнее совпадения в параметрах
+        self.assertEqual(self.search("смартфон"), ["Смартфон Apple iPhone", "Чехол кожаный"])
+
+    def test_pages_by_relevance(self):
+        first = self.client.get(reverse("products"), {"q": "смартфон", "limit": 1}).data
+        second = self.client.get(first["next"]).data
+
+        self.assertEqual(first["results"][0]["product"]["name"], "Смартфон Apple iPhone")
+        self.assertEqual(second["results"][0]["product"]["name"], "Чехол кожаный")
+        self.assertIsNone(second["next"])
+
+    def test_pages_with_equal_rank(self):
+        # Одинаковые товары разных магазинов: релевантность равна, порядок задает id
+        for i in range(7):
+            owner = User.objects.create_user(
+                username=f"shop{i}", email=f"shop{i}@example.com", type="shop", is_active=True
+            )
+            PriceListImporter(owner).run([
+                ("shop", f"Магазин {i}"),
+                ("categories", [{"name": "Аксессуары"}]),
+                ("items", [
+                    {"name": "Бампер силиконовый", "category": self.accessories.id, "price": 1000,
+                     "price_rrc": 1200, "quantity": 5, "parameters": [{"Цвет": "черный"}]},
+                ])
+            ])
+        expected = list(ProductInfo.objects.filter(product__name="Бампер силиконовый").values_list("id", flat=True))
+
+        ids, page = [], self.client.get(reverse("products"), {"q": "бампер", "limit": 3}).data
+        while True:
+            ids.extend(item["id"] for item in page["results"])
+            if page["next"] is None:
+                break
+            page = self.client.get(page["next"]).data
+        self.assertEqual(ids, sorted(expected))
+
+    def test_postgres_rank_is_double(self):
+        # Значение float4 при чтении в Python не равно самому себе, расширенному до float8 в условии курсора
+        sql = str(PostgresSearch().search(CatalogEntry.objects.all(), "чехол").query)
+        self.assertIn("::float8", sql)
+
+    def test_category_and_parameter_values(self):
+        self.assertEqual(self.search("телефоны"), ["Смартфон Apple iPhone"])
+        self.assertEqual(self.search("серый"), ["Ноутбук"])
+        self.assertEqual(self.search("черный apple"), ["Смартфон Apple iPhone"])
+        self.assertEqual(self.search("?!"), [])
+
+    def test_reindex_on_import(self):
+        PriceListImporter(self.owner).run([
+            ("shop", "Связной"),
+            ("categories", [{"name": "Аксессуары"}]),
+            ("items", [
+                {"name": "Ноутбук", "category": self.accessories.id, "price": 50000,
+                 "price_rrc": 55000, "quantity": 1, "parameters": [{"Цвет": "золотой"}]},
+            ])
+        ])
+
+        self.assertEqual(self.search("золотой"), ["Ноутбук"])
+        self.assertEqual(self.search("серый"), [])
+
+
+class PriceListImportTests(TestCase):
+    """Импорт прайс-листа: повторная загрузка как дельта"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def load(self, items: list[tuple[str, int, str]]) -> dict:
+        return PriceListImporter(self.owner).run([
+            ("shop", "Связной"),
+            ("categories", [{"name": "Смартфоны"}]),
+            ("items", [
+                {"name": name, "category": self.category.id, "price": price, "price_rrc": 120, "quantity": 5,
+                 "parameters": [{"Цвет": color}]}
+                for name, price, color in items
+            ])
+        ])
+
+    def test_query_count_independent_of_rows(self):
+        categories = {self.category.id: self.category.name, Category.objects.create(name="Планшеты").id: "Планшеты"}
+        counts = []
+        # bulk_create в SQLite делит строки на пакеты по 999 параметров, поэтому оба файла меньше одного пакета
+        for size in (10, 80):
+            text = io.StringIO()
+            write_price_list(text, size, categories, shop="Связной")
+            data = text.getvalue().encode()
+            # Каждый размер загружается в пустую базу: товары и параметры создаются заново
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as first:
+                    stats = PriceListImporter(self.owner).run(PriceListParser(io.BytesIO(data)))
+                self.assertEqual(stats["inserted"], size)
+                with CaptureQueriesContext(connection) as second:
+                    stats = PriceListImporter(self.owner).run(PriceListParser(io.BytesIO(data)))
+                self.assertEqual(stats["unchanged"], size)
+                transaction.set_rollback(True)
+            counts.append((len(first), len(second)))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_reimport_restores_changes_made_outside_import(self):
+        items = [("A", 100, "черный"), ("B", 100, "белый"), ("C", 100, "белый")]
+        self.load(items)
+        a, b, c = ProductInfo.objects.order_by("product__name")
+
+        response = self.client.patch(f"/api/v1/products/partner/{a.id}/", {"price": 50}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        ProductParameter.objects.filter(product_info=b).update(value="красный")
+        ProductInfo.objects.filter(pk=c.pk).update(quantity=2)
+
+        stats = self.load(items)
+        self.assertEqual((stats["updated"], stats["unchanged"]), (3, 0))
+        self.assertEqual(
+            list(ProductInfo.objects.order_by("product__name").values_list("price", "quantity")),
+            [(Decimal("100.00"), 5)] * 3
+        )
+        self.assertEqual(ProductParameter.objects.get(product_info=b).value, "белый")
+        self.assertEqual(self.load(items)["unchanged"], 3)
+
+    def test_reimport_delta_counters(self):
+        stats = self.load([("A", 100, "черный"), ("B", 100, "белый"), ("C", 100, "белый")])
+        self.assertEqual(
+            (stats["inserted"], stats["updated"], stats["unchanged"], stats["removed"]), (3, 0, 0, 0)
+        )
+
+        # A без изменений, у B новая цена, у C новый параметр, D новый, а E нет в файле
+        self.load([("A", 100, "черный"), ("B", 100, "белый"), ("C", 100, "белый"), ("E", 100, "черный")])
+        stats = self.load([("A", 100, "черный"), ("B", 90, "белый"), ("C", 100, "синий"), ("D", 100, "черный")])
+        self.assertEqual(
+            (stats["items"], stats["inserted"], stats["updated"], stats["unchanged"], stats["removed"]),
+            (4, 1, 2, 1, 1)
+        )
+        removed = ProductInfo.objects.get(product__name="E")
+        # Отсутствующий в файле товар снимается с продажи, а не удаляется: на него могут ссылаться заказы
+        self.assertEqual(removed.quantity, 0)
+        self.assertFalse(CatalogEntry.objects.filter(product_info=removed, quantity__gt=0).exists())
+        self.assertEqual(ProductInfo.objects.get(product__name="B").price, Decimal("90.00"))
+        self.assertEqual(ProductParameter.objects.get(product_info__product__name="C").value, "синий")
+
+        # Снятый с продажи товар не считается повторно и возвращается в продажу следующим файлом
+        stats = self.load([("A", 100, "черный"), ("B", 90, "белый"), ("C", 100, "синий"), ("D", 100, "черный")])
+        self.assertEqual((stats["unchanged"], stats["removed"]), (4, 0))
+        stats = self.load([("A", 100, "черный"), ("B", 90, "белый"), ("C", 100, "синий"), ("E", 100, "черный")])
+        self.assertEqual(
+            (stats["inserted"], stats["updated"], stats["unchanged"], stats["removed"]), (0, 1, 3, 1)
+        )
+        self.assertEqual(ProductInfo.objects.get(product__name="E").quantity, 5)
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.owner).count(), 5)
+
+
+class PriceListParserTests(TestCase):
+    """Потоковый разбор прайс-листа и ошибки в содержимом файла"""
+
+    DOCUMENT = {
+        "shop": "Связной «Юг»",
+        "categories": [{"id": 1, "name": "Смартфоны"}],
+        "items": [
+            {"name": "Телефон \"X\" — 😀", "category": 1, "price": 12345.5, "price_rrc": 1e3, "quantity": 0,
+             "parameters": [{"Цвет": "черный", "Память": 128}]},
+            {"name": "Чехол", "category": 1, "price": -1, "price_rrc": 0.25, "quantity": 100000, "parameters": []},
+        ],
+        "empty": [],
+        "meta": {"version": 2, "tags": ["a", "b"]},
+        "draft": None,
+    }
+
+    @staticmethod
+    def parse(data: bytes, read_size: int = READ_SIZE) -> dict:
+        return {
+            key: list(value) if isinstance(value, Iterator) else value
+            for key, value in PriceListParser(io.BytesIO(data), read_size)
+        }
+
+    def test_chunk_boundaries(self):
+        # Блок файла обрывается внутри строк, чисел, экранирования и многобайтовых символов
+        data = json.dumps(self.DOCUMENT, ensure_ascii=False, indent=1).encode()
+        for read_size in (*range(1, 40), 4096):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(self.parse(data, read_size), self.DOCUMENT)
+                self.assertEqual(self.parse(b"\xef\xbb\xbf" + data, read_size), self.DOCUMENT)
+
+    def test_truncated(self):
+        data = json.dumps(self.DOCUMENT, ensure_ascii=False).encode()
+        for end in range(len(data)):
+            with self.subTest(end=end), self.assertRaises(PriceListError):
+                self.parse(data[:end], read_size=7)
+
+    def test_malformed(self):
+        for data in (
+            b"[]", b'{"shop" "x"}', b'{"shop": "x",}', b'{1: 2}', b'{"items": [1 2]}', b'{"items": [1,]}',
+            b'{"shop": "x"} {}', b'{"shop": "\xff"}', b'{"items": [' + b"[" * 100000 + b"]" * 100000 + b"]}",
+        ):
+            with self.subTest(data=data[:30]), self.assertRaises(PriceListError):
+                self.parse(data)
+
+    def test_unknown_keys(self):
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        category = Category.objects.create(name="Смартфоны")
+        document = {**self.DOCUMENT, "categories": [{"name": "Смартфоны"}]}
+        document["items"] = [{**item, "category": category.id} for item in document["items"]]
+        # Неизвестные разделы пропускаются, где бы они ни стояли
+        data = json.dumps({"version": 1, "extra": [{"items": []}], **document, "tail": {"a": 1}}).encode()
+
+        stats = PriceListImporter(owner).run(PriceListParser(io.BytesIO(data), read_size=16))
+        self.assertEqual((stats["items"], stats["inserted"]), (2, 2))
+        self.assertEqual(ProductInfo.objects.get(product__name="Чехол").quantity, 100000)
+
+    def test_errors_reported_by_job(self):
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        client = APIClient()
+        client.force_authenticate(owner)
+        document = json.dumps(self.DOCUMENT, ensure_ascii=False).encode()
+        # Ошибка в содержимом файла - задача failed с описанием ошибки, а не внутренняя ошибка
+        for name, content in (
+            ("price.json", document[:len(document) // 2]),
+            ("price.json", b'{"shop": "x", "categories": 5, "items": []}'),
+            ("price.json", b'{"shop": "x", "categories": [], "items": 5}'),
+            ("price.json", b'{"shop": ["x"], "categories": [], "items": []}'),
+            ("price.json", b'{"shop": "x", "categories": [], "items": [{"name": "a", "parameters": "b"}]}'),
+            ("price.yaml", b"shop: x\ncategories: [{name: a\n"),
+            ("price.yaml", b"shop: x\nitems:\n  - {name: a, price: 1\n"),
+            ("price.yaml", b"- shop\n- items\n"),
+            ("price.yaml", b"shop: x\ncategories: []\nitems:\n  - name: a\n    price:"),
+        ):
+            with self.subTest(name=name, content=content[:40]):
+                with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                    response = client.post(
+                        reverse("import-item"), {"file": SimpleUploadedFile(name, content)}, format="multipart"
+                    )
+                    self.assertEqual(response.status_code, 202, response.content)
+                    work(0, once=True)
+                job = client.get(reverse("import-job", args=[response.json()["job_id"]])).json()
+                self.assertEqual(job["state"], "failed")
+                self.assertNotIn("Внутренняя ошибка импорта", job["errors"])
+
+    def test_memory_does_not_grow(self):
+        def peak(func) -> int:
+            tracemalloc.start()
+            try:
+                func()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        peaks = []
+        for size in (2000, 20000):
+            text = io.StringIO()
+            write_price_list(text, size, {1: "Смартфоны"})
+            data = text.getvalue().encode()
+            peaks.append((
+                peak(lambda: json.loads(data)),
+                peak(lambda: [None for _ in PriceListParser(io.BytesIO(data))])
+            ))
+        (load_small, parse_small), (load_large, parse_large) = peaks
+        # Файлы отличаются в 10 раз: память json.loads растет вместе с ними, а память разбора - нет
+        self.assertGreater(load_large, 5 * load_small)
+        self.assertLess(parse_large, 1.5 * parse_small)
+        self.assertLess(parse_large, load_small)
+
+
+class ImportJobTests(TestCase):
+    """Очередь импорта: статус задачи, порядок задач магазина и зависшие задачи"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.other = User.objects.create_user(username="other", email="other@example.com", type="shop", is_active=True)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def queue(self, *users: User) -> list[ImportJob]:
+        jobs = [ImportJob.objects.create(user=user, file=f"imports/{i}.json") for i, user in enumerate(users)]
+        # Порядок очереди задается явно: время создания соседних задач может совпасть
+        for i, job in enumerate(jobs):
+            ImportJob.objects.filter(pk=job.pk).update(created_at=datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i))
+        return jobs
+
+    def test_status_flow(self):
+        document = json.dumps({
+            "shop": "Связной",
+            "categories": [{"name": "Смартфоны"}],
+            "items": [{"name": "A", "category": self.category.id, "price": 100, "price_rrc": 120, "quantity": 5,
+                       "parameters": [{"Цвет": "черный"}]}]
+        }).encode()
+        for content, state in ((document, "done"), (b'{"shop": "x", "items": 5}', "failed")):
+            with self.subTest(state=state):
+                with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                    response = self.client.post(
+                        reverse("import-item"), {"file": SimpleUploadedFile("price.json", content)}, format="multipart"
+                    )
+                    self.assertEqual(response.status_code, 202, response.content)
+                    self.assertEqual(response.json()["state"], "queued")
+                    url = reverse("import-job", args=[response.json()["job_id"]])
+                    job = self.client.get(url).json()
+                    self.assertEqual((job["state"], job["started_at"]), ("queued", None))
+
+                    work(0, once=True)
+                    # Загруженный файл удаляется после импорта
+                    self.assertEqual([files for _, _, files in os.walk(media) if files], [])
+                job = self.client.get(url).json()
+                self.assertEqual(job["state"], state, job["errors"])
+                self.assertIsNotNone(job["finished_at"])
+                if state == "done":
+                    self.assertEqual((job["stats"]["items"], job["stats"]["inserted"], job["errors"]), (1, 1, []))
+                else:
+                    self.assertTrue(job["errors"])
+
+        # Статус задачи виден только ее автору
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get(url).status_code, 404)
+
+    def test_one_running_job_per_shop(self):
+        first, second, other = self.queue(self.owner, self.owner, self.other)
+
+        self.assertEqual(claim_next_job().pk, first.pk)
+        # Вторая задача магазина ждет первую, задача другого магазина выполняется параллельно
+        self.assertEqual(claim_next_job().pk, other.pk)
+        self.assertIsNone(claim_next_job())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ImportJob.objects.filter(pk=second.pk).update(state="running")
+
+        ImportJob.objects.filter(pk=first.pk).update(state="done")
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(IMPORT_JOB_TIMEOUT=60)
+    def test_stale_job_reaped_on_claim(self):
+        first, second = self.queue(self.owner, self.owner)
+        self.assertEqual(claim_next_job().pk, first.pk)
+        self.assertIsNone(claim_next_job())
+
+        # Отметка воркера свежая, хотя задача запущена давно
+        ImportJob.objects.filter(pk=first.pk).update(
+            started_at=F("started_at") - timedelta(hours=1), heartbeat_at=datetime.now(timezone.utc)
+        )
+        self.assertIsNone(claim_next_job())
+
+        ImportJob.objects.filter(pk=first.pk).update(heartbeat_at=F("heartbeat_at") - timedelta(minutes=2))
+        self.assertEqual(claim_next_job().pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual((first.state, first.errors), ("failed", ["Превышено время выполнения импорта"]))
+        self.assertIsNotNone(first.finished_at)
+
+    def test_reaped_job_result_dropped(self):
+        document = json.dumps({
+            "shop": "Связной",
+            "categories": [{"name": "Смартфоны"}],
+            "items": [{"name": "A", "category": self.category.id, "price": 100, "price_rrc": 120, "quantity": 5,
+                       "parameters": [{"Цвет": "черный"}]}]
+        }).encode()
+        for content in (document, b'{"shop": "x", "items": 5}'):
+            with self.subTest(content=content[:20]), tempfile.TemporaryDirectory() as media, \
+                    override_settings(MEDIA_ROOT=media):
+                response = self.client.post(
+                    reverse("import-item"), {"file": SimpleUploadedFile("price.json", content)}, format="multipart"
+                )
+                job = claim_next_job()
+                self.assertEqual(str(job.pk), response.json()["job_id"])
+                # Задачу пометили зависшей, пока воркер еще выполнял импорт
+                ImportJob.objects.filter(pk=job.pk).update(state="failed", errors=["Превышено время выполнения импорта"])
+
+                with self.assertLogs("app.jobs", "WARNING"):
+                    run_job(job)
+                job.refresh_from_db()
+                self.assertEqual((job.state, job.errors), ("failed", ["Превышено время выполнения импорта"]))
+                self.assertFalse(ProductInfo.objects.exists())
+                self.assertEqual([files for _, _, files in os.walk(media) if files], [])
+
+    @override_settings(IMPORT_JOB_TIMEOUT=60)
+    def test_reaper_deletes_files(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            self.client.post(reverse("import-item"), {"file": SimpleUploadedFile("price.json", b"{}")}, format="multipart")
+            job = claim_next_job()
+            ImportJob.objects.filter(pk=job.pk).update(heartbeat_at=F("heartbeat_at") - timedelta(minutes=2))
+            self.assertEqual(fail_stale_jobs(), 1)
+            self.assertEqual([files for _, _, files in os.walk(media) if files], [])
+        self.assertEqual(ImportJob.objects.get(pk=job.pk).file.name, "")
+
+
+class ImportFormatsTests(TestCase):
+    """Реестр форматов прайс-листа: определение формата и одинаковый результат импорта"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.category = Category.objects.create(name="Смартфоны")
+
+    def documents(self) -> dict[str, bytes]:
+        category = self.category.id
+        items = [
+            {"name": "Телефон", "category": category, "price": 100.5, "price_rrc": 120, "quantity": 5,
+             "parameters": [{"Цвет": "черный"}, {"Память": 128}]},
+            {"name": "Чехол", "category": category, "price": 10, "price_rrc": 0, "quantity": 0,
+             "parameters": [{"Цвет": "белый"}]},
+        ]
+        header = {"shop": "Связной", "categories": [{"name": "Смартфоны"}]}
+        return {
+            "json": json.dumps({**header, "items": items}, ensure_ascii=False).encode(),
+            "ndjson": "\n".join(json.dumps(line, ensure_ascii=False) for line in (header, *items)).encode(),
+            "yaml": (
+                "items:\n"
+                f"  - {{name: Телефон, category: {category}, price: 100.5, price_rrc: 120, quantity: 5,\n"
+                "     parameters: {Цвет: черный, Память: 128}}\n"
+                f"  - {{name: Чехол, category: {category}, price: 10, price_rrc: 0, quantity: 0,\n"
+                "     parameters: [{Цвет: белый}]}\n"
+                "shop: Связной\n"
+                "categories: [{name: Смартфоны}]\n"
+            ).encode(),
+            "csv": (
+                "\ufeffshop,category_name,name,category,price,price_rrc,quantity,Цвет,Память\r\n"
+                f"Связной,Смартфоны,Телефон,{category},100.5,120,5,черный,128\r\n"
+                f"Связной,Смартфоны,Чехол,{category},10,0,0,белый,\r\n"
+            ).encode(),
+        }
+
+    def test_detect_format(self):
+        for content_type, filename, expected in (
+            (None, "price.JSON", "json"),
+            (None, "price.jsonl", "ndjson"),
+            (None, "price.yml", "yaml"),
+            (None, "price.csv", "csv"),
+            ("text/csv; charset=utf-8", None, "csv"),
+            ("Application/X-YAML", "price", "yaml"),
+            ("application/octet-stream", "price.ndjson", "ndjson"),
+            # Расширение важнее типа содержимого, который браузеры часто указывают неверно
+            ("application/json", "price.csv", "csv"),
+            ("text/plain", "price.txt", None),
+            (None, None, None),
+        ):
+            with self.subTest(content_type=content_type, filename=filename):
+                self.assertEqual(detect_format(content_type, filename), expected)
+
+    def test_registry(self):
+        self.assertEqual(set(formats.PARSERS), {"json", "ndjson", "yaml", "csv"})
+        with self.assertRaises(PriceListError):
+            get_parser("xml")
+
+        with mock.patch.dict(formats.PARSERS), mock.patch.dict(formats.EXTENSIONS), \
+                mock.patch.dict(formats.CONTENT_TYPES):
+            parser = formats.register("xml", content_types=("application/xml",), extensions=(".xml",))(
+                lambda file: iter(())
+            )
+            self.assertIs(get_parser("xml"), parser)
+            self.assertEqual(detect_format("application/xml", "price.XML"), "xml")
+        self.assertIsNone(detect_format("application/xml", "price.xml"))
+
+    def test_same_result_for_all_formats(self):
+        results = {}
+        for name, data in self.documents().items():
+            with self.subTest(format=name), transaction.atomic():
+                stats = PriceListImporter(self.owner).run(get_parser(name)(io.BytesIO(data)))
+                self.assertEqual((stats["items"], stats["inserted"]), (2, 2))
+                results[name] = sorted(
+                    (
+                        product_info.shop.name, product_info.product.name, product_info.product.categories_id,
+                        product_info.price, product_info.price_rrc, product_info.quantity,
+                        sorted((p.parameter.name, p.value) for p in product_info.product_parameters.all())
+                    )
+                    for product_info in ProductInfo.objects.select_related("shop", "product").prefetch_related(
+                        "product_parameters__parameter"
+                    )
+                )
+                transaction.set_rollback(True)
+        self.assertEqual(results["json"][0][5:], (5, [("Память", "128"), ("Цвет", "черный")]))
+        for name in ("ndjson", "yaml", "csv"):
+            self.assertEqual(results[name], results["json"], name)
+
+    def test_upload_format(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        documents = self.documents()
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            for filename, content, data, expected in (
+                ("price.yml", documents["yaml"], {}, "yaml"),
+                ("price.txt", documents["csv"], {"format": "csv"}, "csv"),
+            ):
+                response = client.post(reverse("import-item"), {
+                    "file": SimpleUploadedFile(filename, content), **data
+                }, format="multipart")
+                self.assertEqual(response.status_code, 202, response.content)
+                self.assertEqual(ImportJob.objects.get(pk=response.json()["job_id"]).format, expected)
+
+            for data in ({}, {"format": "xml"}):
+                response = client.post(reverse("import-item"), {
+                    "file": SimpleUploadedFile("price.txt", documents["json"], "text/plain"), **data
+                }, format="multipart")
+                self.assertEqual(response.status_code, 400)
+
+
+class ParameterFacetTests(TestCase):
+    """Фильтры по параметрам и фасеты каталога"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.owner = User.objects.create_user(
+            username="shop", email="shop@example.com", type="shop", is_active=True
+        )
+        self.category = Category.objects.create(name="Смартфоны")
+        self.load([("A", "черный", "128"), ("B", "черный", "256"), ("C", "белый", "128")])
+
+    def load(self, items: list[tuple[str, str, str]]) -> None:
+        PriceListImporter(self.owner).run([
+            ("shop", "Связной"),
+            ("categories", [{"name": "Смартфоны"}]),
+            ("items", [
+                {"name": name, "category": self.category.id, "price": 100, "price_rrc": 120, "quantity": 1,
+                 "parameters": [{"Цвет": color}, {"Память": memory}]}
+                for name, color, memory in items
+            ])
+        ])
+
+    def stored_facets(self) -> dict:
+        return {
+            (facet.parameter.name, facet.value): facet.count
+            for facet in ParameterFacet.objects.select_related("parameter")
+        }
+
+    def test_facets_from_aggregate(self):
+        response = self.client.get(reverse("products"))
+
+        self.assertEqual(response.data["facets"], {
+            "Память": [{"value": "128", "count": 2}, {"value": "256", "count": 1}],
+            "Цвет": [{"value": "черный", "count": 2}, {"value": "белый", "count": 1}],
+        })
+
+    def test_parameter_filter(self):
+        response = self.client.get(reverse("products"), {"param[Цвет]": "черный", "param[Память]": ["128", "64"]})
+
+        self.assertEqual([item["product"]["name"] for item in response.data["results"]], ["A"])
+        self.assertEqual(response.data["facets"], {
+            "Память": [{"value": "128", "count": 1}],
+            "Цвет": [{"value": "черный", "count": 1}],
+        })
+
+    def test_narrowed_facets_cached(self):
+        params = {"param[Цвет]": "черный", "limit": 1}
+        first = self.client.get(reverse("products"), params)
+        self.assertEqual(first.data["facets"]["Память"], [{"value": "128", "count": 1}, {"value": "256", "count": 1}])
+
+        # Следующая страница и другие поля ответа не пересчитывают фасеты
+        for url, query in ((first.data["next"], {}), (reverse("products"), {**params, "fields": "id"})):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, query)
+            self.assertEqual(response.data["facets"], first.data["facets"])
+            self.assertFalse([query["sql"] for query in context.captured_queries if "GROUP BY" in query["sql"]])
+
+        # Изменение каталога сбрасывает закэшированные фасеты
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load([("A", "черный", "128"), ("B", "черный", "128"), ("C", "белый", "128")])
+        response = self.client.get(first.data["next"])
+        self.assertEqual(response.data["facets"]["Память"], [{"value": "128", "count": 2}])
+
+    def test_facets_follow_import_and_partner_delete(self):
+        self.load([("A", "белый", "128"), ("B", "черный", "512"), ("C", "белый", "128")])
+        self.assertEqual(self.stored_facets(), {
+            ("Цвет", "белый"): 2, ("Цвет", "черный"): 1, ("Память", "128"): 2, ("Память", "512"): 1,
+        })
+
+        self.client.force_authenticate(self.owner)
+        product_info = ProductInfo.objects.get(product__name="B")
+        response = self.client.delete(f"/api/v1/products/partner/{product_info.id}/")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.stored_facets(), {("Цвет", "белый"): 2, ("Память", "128"): 2})
+
+
+class CatalogCacheTests(TestCase):
+    """Кэш ответов каталога и его сброс по версиям"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.category = Category.objects.create(name="Смартфоны")
+        parameters = [Parameter.objects.create(name="Цвет")]
+        self.shops = {}
+        for name in ("Связной", "Евросеть"):
+            owner = User.objects.create_user(username=name, email=f"{name}@example.com", type="shop", is_active=True)
+            self.shops[name] = Shop.objects.create(name=name, user=owner)
+            create_catalog(3, self.shops[name], self.category, parameters)
+
+    def test_hit_and_invalidation(self):
+        url = reverse("products")
+        self.assertEqual(self.client.get(url, {"limit": 2, "shop": "Связной"})["X-Cache"], "MISS")
+
+        # Порядок параметров запроса на ключ не влияет, при попадании выполняются только
+        # запрос отметки для ETag и запросы версий (глобальной и версии магазина)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{url}?shop=Связной&limit=2")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.data["results"]), 2)
+
+        product_info = ProductInfo.objects.filter(shop=self.shops["Связной"]).order_by("product__name").first()
+        product_info.price = Decimal("1.00")
+        # Версии увеличиваются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            product_info.save()
+
+        response = self.client.get(url, {"limit": 2, "shop": "Связной"})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["price"], "1.00")
+
+    def test_shop_versions(self):
+        url = reverse("products")
+        self.client.get(url, {"shop": "Связной"})
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductParameter.objects.filter(product_info__shop=self.shops["Евросеть"]).first().save()
+
+        # Изменение товаров одного магазина не сбрасывает каталог другого
+        self.assertEqual(self.client.get(url, {"shop": "Связной"})["X-Cache"], "HIT")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+    def test_import_and_category_invalidation(self):
+        self.client.get(reverse("categories"))
+        self.client.get(reverse("products"), {"shop": "Связной"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter(self.shops["Связной"].user).run([
+                ("shop", "Связной"),
+                ("categories", [{"name": "Смартфоны"}]),
+                ("items", [{"name": "Новый", "category": self.category.id, "price": 1, "price_rrc": 1, "quantity": 1,
+                            "parameters": [{"Цвет": "черный"}]}])
+            ])
+
+        self.assertEqual(self.client.get(reverse("categories"))["X-Cache"], "MISS")
+        response = self.client.get(reverse("products"), {"shop": "Связной"})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("Новый", [item["product"]["name"] for item in response.data["results"]])
+
+    def test_versions_shared_between_processes(self):
+        url = reverse("categories")
+        self.client.get(url)
+
+        # Версия увеличивается только после фиксации транзакции
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_global()
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+        callbacks[0]()
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+        # Изменение в другом процессе (обработчик импорта) видно через таблицу версий
+        CacheVersion.objects.filter(key=GLOBAL_VERSION).update(version=F("version") + 1)
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+    def test_stats(self):
+        reset_stats()
+        for _ in range(3):
+            self.client.get(reverse("shops"))
+
+        self.assertEqual(get_stats()["shops"], {"hits": 2, "misses": 1})
+
+
+class ConditionalGetTests(TestCase):
+    """ETag и Last-Modified каталога, корзины и заказов"""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Магазин", user=owner)
+        self.product_infos = create_catalog(3, self.shop, Category.objects.create(name="Смартфоны"), [])
+
+    def assertNotModified(self, url: str, response, queries: int) -> None:
+        with self.assertNumQueries(queries):
+            repeated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated["ETag"], response["ETag"])
+
+    def test_products(self):
+        url = reverse("products")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        # Только запрос отметки изменений: без выборки товаров и сериализации
+        self.assertNotModified(url, response, 1)
+        self.assertNotEqual(self.client.get(url, {"limit": 1})["ETag"], response["ETag"])
+
+        product_info = self.product_infos[0]
+        product_info.price = Decimal("1.00")
+        product_info.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+        # Удаление товара меняет отметку магазина
+        self.product_infos[1].delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse("products")
+        response = self.client.get(url)
+
+        repeated = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_basket_and_orders(self):
+        basket = Order.objects.create(user=self.user, state="basket")
+        item = OrderItem.objects.create(order=basket, product_info=self.product_infos[0], quantity=1)
+        response = self.client.get(reverse("basket"))
+        self.assertNotModified(reverse("basket"), response, 1)
+
+        item.quantity = 2
+        item.save()
+        changed = self.client.get(reverse("basket"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+        # Цена товара в корзине тоже входит в отметку
+        self.product_infos[0].price = Decimal("1.00")
+        self.product_infos[0].save()
+        self.assertEqual(self.client.get(reverse("basket"), HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 200)
+
+        orders = self.client.get(reverse("orders"))
+        self.assertNotModified(reverse("orders"), orders, 1)
+        Order.objects.create(user=self.user, state="new")
+        self.assertEqual(self.client.get(reverse("orders"), HTTP_IF_NONE_MATCH=orders["ETag"]).status_code, 200)
+
+    def test_orders_contact(self):
+        contact = Contact.objects.create(
+            user=self.user, city="Москва", street="Ленина", house="1", building="2", apartment="3",
+            phone="+79990000000"
+        )
+        Order.objects.create(user=self.user, state="new", contact=contact)
+        orders = self.client.get(reverse("orders"))
+        self.assertNotModified(reverse("orders"), orders, 1)
+
+        # Контакт выводится в заказе, поэтому его изменение меняет отметку
+        contact.city = "Казань"
+        contact.save()
+        changed = self.client.get(reverse("orders"), HTTP_IF_NONE_MATCH=orders["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["results"][0]["contact"]["city"], "Казань")
+
+
+class CatalogEntryTests(TestCase):
+    """Каталог для чтения совпадает с нормализованными таблицами"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.load(["A", "B", "C"])
+
+    def load(self, names: list[str]) -> None:
+        PriceListImporter(self.owner).run([
+            ("shop", "Связной"),
+            ("categories", [{"name": "Смартфоны"}]),
+            ("items", [
+                {"name": name, "category": self.category.id, "price": 100, "price_rrc": 120, "quantity": 1,
+                 "parameters": [{"Цвет": "черный"}]}
+                for name in names
+            ])
+        ])
+
+    def assertConsistent(self) -> None:
+        self.assertEqual(list(catalog.inconsistent_entries()), [])
+        self.assertEqual(CatalogEntry.objects.count(), ProductInfo.objects.count())
+
+    def test_incremental_updates(self):
+        self.assertConsistent()
+
+        # Повторный импорт: C снимается с продажи, D добавляется
+        self.load(["A", "B", "D"])
+        self.assertConsistent()
+
+        # Изменения партнера: цена, значение параметра, название товара и удаление
+        self.client.force_authenticate(self.owner)
+        product_info = ProductInfo.objects.get(product__name="A")
+        parameter = product_info.product_parameters.get()
+        response = self.client.patch(f"/api/v1/products/partner/{product_info.id}/", {
+            "price": "77.00",
+            "product": {"name": "A2"},
+            "product_parameters": [{"id": parameter.id, "value": "белый"}]
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.delete(f"/api/v1/products/partner/{ProductInfo.objects.get(product__name='B').id}/")
+        self.assertConsistent()
+
+        response = self.client.get(reverse("product", args=[product_info.id]))
+        self.assertEqual(response.data, ProductInfoSerializer(ProductInfo.objects.get(id=product_info.id)).data)
+        self.assertEqual(response.data["price"], "77.00")
+        self.assertEqual(response.data["product_parameters"][0]["value"], "белый")
+
+    def test_shop_state(self):
+        shop = Shop.objects.get(name="Связной")
+        shop.state = False
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertConsistent()
+        self.assertEqual(self.client.get(reverse("products")).data["results"], [])
+
+        shop.state = True
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(len(self.client.get(reverse("products")).data["results"]), 3)
+
+    def test_rebuild(self):
+        CatalogEntry.objects.filter(product_info__product__name="A").update(price=Decimal("1.00"))
+        CatalogEntry.objects.filter(product_info__product__name="B").delete()
+        self.assertEqual(len(list(catalog.inconsistent_entries())), 2)
+
+        catalog.rebuild()
+        self.assertConsistent()
+
+
+class ProductOffersTests(TestCase):
+    """Предложения товара и лучшее предложение каждого товара"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        category = Category.objects.create(name="Смартфоны")
+        self.product = Product.objects.create(name="Телефон", categories=category)
+        other = Product.objects.create(name="Чехол", categories=category)
+        self.shops = []
+        # Цена, остаток и статус магазина: закрытый магазин и нулевой остаток не участвуют
+        for i, (price, quantity, state) in enumerate([(100, 5, True), (90, 5, True), (50, 5, False), (40, 0, True)]):
+            owner = User.objects.create_user(
+                username=f"shop{i}", email=f"shop{i}@example.com", type="shop", is_active=True
+            )
+            shop = Shop.objects.create(name=f"Магазин {i}", user=owner, state=state)
+            self.shops.append(shop)
+            ProductInfo.objects.create(
+                product=self.product, shop=shop, price=Decimal(price), price_rrc=Decimal(price), quantity=quantity
+            )
+        self.other = ProductInfo.objects.create(
+            product=other, shop=self.shops[0], price=Decimal(10), price_rrc=Decimal(10), quantity=1
+        )
+
+    def offer(self, shop_index: int) -> int:
+        return ProductInfo.objects.get(product=self.product, shop=self.shops[shop_index]).id
+
+    def offers(self) -> list[int]:
+        response = self.client.get(reverse("product-offers", args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data]
+
+    def best(self, **params) -> list[int]:
+        return [item["id"] for item in self.client.get(reverse("products"), {"best": "true", **params}).data["results"]]
+
+    def assertBest(self, shop_index: int) -> None:
+        self.assertEqual(self.offers()[0], self.offer(shop_index))
+        self.assertEqual(self.best(), [self.offer(shop_index), self.other.id])
+        self.assertEqual(list(catalog.inconsistent_entries()), [])
+
+    def test_offers(self):
+        self.assertEqual(self.offers(), [self.offer(1), self.offer(0)])
+        self.assertEqual(
+            self.client.get(reverse("product-offers", args=[self.product.id]))["X-Cache"], "HIT"
+        )
+        self.assertEqual(self.client.get(reverse("product-offers", args=[0])).data, [])
+        self.assertBest(1)
+
+    def test_price_change(self):
+        self.assertBest(1)
+        product_info = ProductInfo.objects.get(id=self.offer(0))
+        product_info.price = Decimal(80)
+        with self.captureOnCommitCallbacks(execute=True):
+            product_info.save()
+        self.assertEqual(self.offers(), [self.offer(0), self.offer(1)])
+        self.assertBest(0)
+        # Лучшее предложение магазина зависит от цен в других магазинах
+        self.assertEqual(self.best(shop="Магазин 1"), [])
+
+    def test_shop_state(self):
+        self.shops[1].state = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shops[1].save()
+        self.assertBest(0)
+
+        self.shops[2].state = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shops[2].save()
+        self.assertBest(2)
+
+    def test_delete(self):
+        ProductInfo.objects.get(id=self.offer(1)).delete()
+        self.assertBest(0)
+
+    def test_rebuild(self):
+        CatalogEntry.objects.update(best=False)
+        self.assertEqual(len(list(catalog.inconsistent_entries())), 2)
+        catalog.rebuild()
+        self.assertBest(1)
+
+
+class CategoryStatsTests(TestCase):
+    """Заранее подсчитанная статистика категорий"""
+
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.category = Category.objects.create(name="Смартфоны")
+        self.owners = [
+            User.objects.create_user(username=f"shop{i}", email=f"shop{i}@example.com", type="shop", is_active=True)
+            for i in range(2)
+        ]
+        self.load(self.owners[0], "Связной", {"A": 100, "B": 200, "C": 300})
+
+    def load(self, owner: User, shop: str, prices: dict[str, int]) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter(owner).run([
+                ("shop", shop),
+                ("categories", [{"name": "Смартфоны"}]),
+                ("items", [
+                    {"name": name, "category": self.category.id, "price": price, "price_rrc": price, "quantity": 1,
+                     "parameters": [{"Цвет": "черный"}]}
+                    for name, price in prices.items()
+                ])
+            ])
+
+    def stats(self, category: Category | None = None) -> dict:
+        category = category or self.category
+        item, = [item for item in self.client.get(reverse("categories")).data["results"] if item["id"] == category.id]
+        self.assertEqual(list(category_stats.inconsistent_stats()), [])
+        return {field: item[field] for field in ("product_count", "shop_count", "price_min", "price_max")}
+
+    def test_import(self):
+        self.assertEqual(
+            self.stats(), {"product_count": 3, "shop_count": 1, "price_min": "100.00", "price_max": "300.00"}
+        )
+        # Тот же товар во втором магазине и снятый с продажи C
+        self.load(self.owners[1], "Эльдорадо", {"A": 50})
+        self.load(self.owners[0], "Связной", {"A": 100, "B": 200})
+        self.assertEqual(
+            self.stats(), {"product_count": 2, "shop_count": 2, "price_min": "50.00", "price_max": "200.00"}
+        )
+
+    def test_partner_changes(self):
+        self.client.force_authenticate(self.owners[0])
+        product_info = ProductInfo.objects.get(product__name="C")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/v1/products/partner/{product_info.id}/", {"price": "500.00"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.stats()["price_max"], "500.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/v1/products/partner/{ProductInfo.objects.get(product__name='A').id}/")
+        self.assertEqual(
+            self.stats(), {"product_count": 2, "shop_count": 1, "price_min": "200.00", "price_max": "500.00"}
+        )
+
+    def test_refreshed_on_commit(self):
+        def stats_queries(callbacks) -> list[str]:
+            with CaptureQueriesContext(connection) as queries:
+                for callback in callbacks:
+                    callback()
+            return [query["sql"] for query in queries if CategoryStats._meta.db_table in query["sql"]]
+
+        product_info = ProductInfo.objects.get(product__name="C")
+        product_info.price = Decimal("500.00")
+        with self.captureOnCommitCallbacks() as callbacks:
+            product_info.save()
+        # Агрегат категории считается после фиксации транзакции, а не под блокировкой строки товара
+        self.assertEqual(CategoryStats.objects.get(category=self.category).price_max, Decimal("300.00"))
+        self.assertTrue(stats_queries(callbacks))
+        self.assertEqual(self.stats()["price_max"], "500.00")
+
+        # Изменения, не влияющие на статистику, не пересчитывают ее
+        product_info.quantity = 10
+        product_info.price_rrc = Decimal("1.00")
+        with self.captureOnCommitCallbacks() as callbacks:
+            product_info.save()
+        self.assertEqual(stats_queries(callbacks), [])
+
+        product_info.quantity = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            product_info.save()
+        self.assertEqual(self.stats()["product_count"], 2)
+
+    def test_shop_and_product_changes(self):
+        shop = Shop.objects.get(name="Связной")
+        shop.state = False
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+        self.assertEqual(self.stats(), {"product_count": 0, "shop_count": 0, "price_min": None, "price_max": None})
+        shop.state = True
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.save()
+
+        # Смена категории товара меняет статистику обеих категорий
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Category.objects.create(name="Планшеты")
+            product = Product.objects.get(name="C")
+            product.categories = other
+            product.save()
+        self.assertEqual(self.stats()["price_max"], "200.00")
+        self.assertEqual(self.stats(other)["product_count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.delete()
+        self.assertEqual(self.stats()["product_count"], 0)
+        self.assertEqual(self.stats(other)["product_count"], 0)
+
+    def test_rebuild(self):
+        CategoryStats.objects.update(product_count=0)
+        self.assertEqual(list(category_stats.inconsistent_stats()), [self.category.id])
+        category_stats.rebuild()
+        self.assertEqual(list(category_stats.inconsistent_stats()), [])
+
+    def test_delete_category(self):
+        # Удаление товаров категории не создает заново статистику удаляемой категории
+        self.category.delete()
+        self.assertFalse(CategoryStats.objects.exists())
+
+    def test_list_queries(self):
+        # Версии кэша, страница категорий и магазины всех категорий страницы, без запроса на каждую категорию
+        for i in range(10):
+            category = Category.objects.create(name=f"Категория {i}")
+            category.shops.add(Shop.objects.get())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("categories"))
+        self.assertEqual(len(response.data["results"]), 11)
+        self.assertEqual(len(queries), 3, [query["sql"] for query in queries])
+
+
+class BasketLinesTests(TestCase):
+    """Позиции корзины: добавление, изменение и удаление пакетом с постоянным числом запросов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Связной", user=owner)
+        self.product_infos = create_catalog(100, self.shop, Category.objects.create(name="Смартфоны"), [])
+
+    def add(self, items: list[dict]):
+        return self.client.post(reverse("basket"), {"items": items}, format="json")
+
+    def basket(self) -> dict[int, int]:
+        return dict(OrderItem.objects.filter(order__user=self.user, order__state="basket").values_list(
+            "product_info_id", "quantity"
+        ))
+
+    def test_constant_queries(self):
+        Order.objects.create(user=self.user, state="basket")
+        counts = []
+        for product_infos in (self.product_infos[:10], self.product_infos[10:]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.add([{"product_info": product_info.id, "quantity": 2} for product_info in product_infos])
+            self.assertEqual(response.status_code, 200, response.json())
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.basket(), {product_info.id: 2 for product_info in self.product_infos})
+
+    def test_merge_quantity(self):
+        first, second = self.product_infos[:2]
+        self.add([{"product_info": first.id, "quantity": 5}])
+        # Повтор товара в запросе и товар, уже лежащий в корзине, складываются
+        response = self.add([
+            {"product_info": first.id, "quantity": 3},
+            {"product_info": second.id, "quantity": 1},
+            {"product_info": first.id, "quantity": 2},
+        ])
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(self.basket(), {first.id: 10, second.id: 1})
+
+    def test_limits(self):
+        first, second = self.product_infos[:2]
+        self.add([{"product_info": first.id, "quantity": 60}])
+        # Превышение лимита после сложения откатывает весь запрос
+        response = self.add([{"product_info": second.id, "quantity": 1}, {"product_info": first.id, "quantity": 41}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("quantity", response.json()["Errors"])
+        self.assertEqual(self.basket(), {first.id: 60})
+
+        for quantity in (0, 101):
+            response = self.add([{"product_info": second.id, "quantity": quantity}])
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.basket(), {first.id: 60})
+
+        # Повторы товара в одном запросе складываются до проверки лимита, в том числе для нового товара
+        response = self.add([{"product_info": second.id, "quantity": 60}, {"product_info": second.id, "quantity": 60}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(second.id), response.json()["Errors"]["quantity"])
+        self.assertEqual(self.basket(), {first.id: 60})
+
+    def lines(self, count: int) -> list[int]:
+        self.add([{"product_info": product_info.id, "quantity": 1} for product_info in self.product_infos[:count]])
+        return list(OrderItem.objects.filter(order__user=self.user).order_by("id").values_list("id", flat=True))
+
+    def test_update(self):
+        lines = self.lines(50)
+        other = User.objects.create_user(username="other", email="other@example.com", is_active=True)
+        foreign = OrderItem.objects.create(
+            order=Order.objects.create(user=other, state="basket"), product_info=self.product_infos[0], quantity=1
+        )
+        counts = []
+        for batch in (lines[:5], lines[5:]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(
+                    reverse("basket"), {"items": [{"id": line_id, "quantity": 7} for line_id in [*batch, foreign.id, 0]]},
+                    format="json"
+                )
+            self.assertEqual(response.status_code, 200, response.json())
+            self.assertEqual(response.json()["Обновлены"], batch)
+            self.assertEqual(response.json()["Отклонены"], [0, foreign.id])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(set(self.basket().values()), {7})
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.quantity, 1)
+
+        response = self.client.patch(reverse("basket"), {"items": [{"id": lines[0], "quantity": 101}]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete(self):
+        lines = self.lines(10)
+        response = self.client.delete(
+            reverse("basket"), {"items": [{"id": line_id} for line_id in [*lines[:3], 0]]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()["Удалены"], lines[:3])
+        self.assertEqual(response.json()["Отклонены"], [0])
+        self.assertEqual(len(self.basket()), 7)
+
+        # Без списка позиций удаляется вся корзина
+        self.assertEqual(self.client.delete(reverse("basket")).status_code, 200)
+        self.assertEqual(self.basket(), {})
+        self.assertEqual(self.client.delete(reverse("basket")).status_code, 404)
+
+    def test_place_order(self):
+        self.lines(1)
+        basket = Order.objects.get(user=self.user, state="basket")
+        contact = Contact.objects.create(user=self.user, city="Москва", street="Тверская", phone="+79990000000")
+        response = self.client.post(reverse("orders"), {"basket_id": basket.id, "contact_id": contact.id}, format="json")
+        self.assertEqual(response.status_code, 200, response.json())
+        basket.refresh_from_db()
+        self.assertEqual((basket.state, basket.contact_id), ("new", contact.id))
+        response = self.client.post(reverse("orders"), {"basket_id": basket.id, "contact_id": contact.id}, format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_unavailable(self):
+        response = self.add([{"product_info": 0, "quantity": 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("product_info", response.json()["Errors"])
+
+        self.shop.state = False
+        self.shop.save()
+        response = self.add([{"product_info": self.product_infos[0].id, "quantity": 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.basket(), {})
+
+
+class StockReservationTests(TestCase):
+    """Оформление заказа списывает товары со склада, отмена возвращает"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Связной", user=self.owner)
+        self.product_infos = create_catalog(2, shop, Category.objects.create(name="Смартфоны"), [])
+        self.contact = Contact.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1", building="2", apartment="3",
+            phone="+79990000000"
+        )
+
+    def place(self, quantities: list[int]):
+        order = Order.objects.create(user=self.user, state="basket")
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info=product_info, quantity=quantity)
+            for product_info, quantity in zip(self.product_infos, quantities)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("orders"), {"basket_id": order.id, "contact_id": self.contact.id}, format="json"
+            )
+        return order, response
+
+    def stock(self) -> list[int]:
+        return [
+            ProductInfo.objects.get(id=product_info.id).quantity for product_info in self.product_infos
+        ]
+
+    def test_reserve(self):
+        order, response = self.place([3, 2])
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(self.stock(), [2, 3])
+        # Каталог для чтения видит новый остаток
+        self.assertEqual(
+            list(CatalogEntry.objects.order_by("product_info").values_list("quantity", flat=True)), [2, 3]
+        )
+
+    def test_side_effects_on_commit(self):
+        order = Order.objects.create(user=self.user, state="basket")
+        OrderItem.objects.create(order=order, product_info=self.product_infos[0], quantity=1)
+        # Каталог и статистика обновляются после фиксации, а не под блокировками строк товаров
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(basket.checkout(self.user.id, order.id, self.contact.id))
+            self.assertEqual(CatalogEntry.objects.get(product_info=self.product_infos[0]).quantity, 5)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(CatalogEntry.objects.get(product_info=self.product_infos[0]).quantity, 4)
+
+    def test_out_of_stock(self):
+        order, response = self.place([3, 6])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["Errors"]["product_info"], [self.product_infos[1].id])
+        # Списание первого товара откатывается вместе с заказом
+        self.assertEqual(self.stock(), [5, 5])
+        order.refresh_from_db()
+        self.assertEqual(order.state, "basket")
+
+    def test_no_oversell(self):
+        self.assertEqual(self.place([3, 3])[1].status_code, 200)
+        self.assertEqual(self.place([3, 3])[1].status_code, 409)
+        self.assertEqual(self.place([2, 2])[1].status_code, 200)
+        self.assertEqual(self.stock(), [0, 0])
+
+    def test_cancel(self):
+        order, _ = self.place([3, 2])
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = reverse("partner-order", args=[order.id])
+        for _ in range(2):
+            response = client.patch(url, {"state": "canceled"}, format="json")
+            self.assertEqual(response.status_code, 200, response.json())
+            # Повторная отмена не возвращает товары второй раз
+            self.assertEqual(self.stock(), [5, 5])
+        response = client.patch(url, {"state": "new"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(basket.cancel(order.id))
+
+    def test_partner_edits(self):
+        order, _ = self.place([3, 2])
+        first, second = OrderItem.objects.filter(order=order).order_by("product_info_id")
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = reverse("partner-order", args=[order.id])
+
+        def patch(data: dict):
+            with self.captureOnCommitCallbacks(execute=True):
+                return client.patch(url, data, format="json")
+
+        # Резерв меняется на разницу количеств
+        response = patch({"order_items": [{"id": first.id, "quantity": 5}, {"id": second.id, "quantity": 1}]})
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(self.stock(), [0, 4])
+        self.assertEqual(CatalogEntry.objects.get(product_info=self.product_infos[1]).quantity, 4)
+
+        response = patch({"order_items": [{"id": first.id, "quantity": 6}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), [0, 4])
+
+        # Позиции меняются до отмены, поэтому на склад возвращается ровно зарезервированное
+        response = patch({"state": "canceled", "order_items": [{"id": first.id, "quantity": 1}]})
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(self.stock(), [5, 5])
+        self.assertEqual(patch({"state": "basket"}).status_code, 400)
+
+
+class OrderTotalsTests(TestCase):
+    """Сумма и число позиций хранятся в заказе и обновляются при изменении позиций и цен"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Связной", user=self.owner)
+        self.product_infos = create_catalog(3, shop, Category.objects.create(name="Смартфоны"), [])
+        ProductInfo.objects.filter(id=self.product_infos[0].id).update(price=Decimal("10.55"))
+
+    def totals(self) -> tuple[Decimal, int]:
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(list(order_totals.inconsistent_totals()), [])
+        return order.total_sum, order.items_count
+
+    def test_basket(self):
+        first, second, _ = self.product_infos
+        self.client.post(reverse("basket"), {"items": [
+            {"product_info": first.id, "quantity": 2}, {"product_info": second.id, "quantity": 1}
+        ]}, format="json")
+        self.assertEqual(self.totals(), (Decimal("121.10"), 2))
+
+        line = OrderItem.objects.get(product_info=second)
+        self.client.patch(reverse("basket"), {"items": [{"id": line.id, "quantity": 3}]}, format="json")
+        self.assertEqual(self.totals(), (Decimal("321.10"), 2))
+
+        self.client.delete(reverse("basket"), {"items": [{"id": line.id}]}, format="json")
+        self.assertEqual(self.totals(), (Decimal("21.10"), 1))
+
+        # Список читает сохраненную сумму без соединения с позициями
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("basket"), {"fields": "id,total_sum,items_count"})
+        self.assertEqual(response.json()[0]["total_sum"], "21.10")
+        self.assertNotIn("app_orderitem", queries[-1]["sql"])
+
+    def test_price_and_partner_changes(self):
+        first, second, third = self.product_infos
+        order = Order.objects.create(user=self.user, state="new")
+        item = OrderItem.objects.create(order=order, product_info=first, quantity=2)
+        OrderItem.objects.create(order=order, product_info=second, quantity=1)
+        self.assertEqual(self.totals(), (Decimal("121.10"), 2))
+
+        first.refresh_from_db()
+        first.price = Decimal("20.00")
+        first.save()
+        self.assertEqual(self.totals(), (Decimal("140.00"), 2))
+
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.patch(
+            reverse("partner-order", args=[order.id]), {"order_items": [{"id": item.id, "quantity": 5}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()["total_sum"], "200.00")
+        self.assertEqual(self.totals(), (Decimal("200.00"), 2))
+
+        second.delete()
+        self.assertEqual(self.totals(), (Decimal("100.00"), 1))
+
+    def test_final_orders_not_repriced(self):
+        first = self.product_infos[1]
+        orders = {state: Order.objects.create(user=self.user, state=state) for state in ("new", "delivered", "canceled")}
+        for order in orders.values():
+            OrderItem.objects.create(order=order, product_info=first, quantity=2)
+
+        first.price = Decimal("30.00")
+        first.save()
+        self.assertEqual(
+            dict(Order.objects.values_list("state", "total_sum")),
+            {"new": Decimal("60.00"), "delivered": Decimal("200.00"), "canceled": Decimal("200.00")}
+        )
+        # Сумма завершенного заказа по старым ценам не считается расхождением
+        self.assertEqual(list(order_totals.inconsistent_totals()), [])
+        Order.objects.filter(id=orders["delivered"].id).update(items_count=0)
+        self.assertEqual(list(order_totals.inconsistent_totals()), [orders["delivered"].id])
+
+    def test_partner_shop_sum(self):
+        other_owner = User.objects.create_user(username="other", email="other@example.com", type="shop", is_active=True)
+        other = create_catalog(1, Shop.objects.create(name="Другой", user=other_owner), Category.objects.get(), [])[0]
+        order = Order.objects.create(user=self.user, state="new")
+        OrderItem.objects.create(order=order, product_info=self.product_infos[1], quantity=2)
+        OrderItem.objects.create(order=order, product_info=other, quantity=1)
+        self.assertEqual(self.totals(), (Decimal("300.00"), 2))
+
+        # Партнер видит сумму только своих позиций
+        for owner, expected in ((self.owner, "200.00"), (other_owner, "100.00")):
+            client = APIClient()
+            client.force_authenticate(owner)
+            self.assertEqual(client.get(reverse("partner-orders")).json()["results"][0]["total_sum"], expected)
+
+    def test_import_refreshes_repriced_orders_only(self):
+        order = Order.objects.create(user=self.user, state="new")
+        OrderItem.objects.create(order=order, product_info=self.product_infos[0], quantity=1)
+        items = [
+            {"name": product_info.product.name, "category": product_info.product.categories_id,
+             "price": product_info.price, "price_rrc": product_info.price_rrc, "quantity": 1, "parameters": []}
+            for product_info in ProductInfo.objects.select_related("product").order_by("id")
+        ]
+        items[1]["price"] = Decimal("30.00")
+        with mock.patch.object(order_totals, "refresh_products") as refresh_products:
+            PriceListImporter(self.owner).run([
+                ("shop", self.product_infos[0].shop.name), ("categories", []), ("items", items)
+            ])
+        # Количество изменилось у всех товаров, цена - только у второго
+        self.assertEqual([list(call.args[0]) for call in refresh_products.call_args_list], [[self.product_infos[1].id]])
+
+    def test_check_command(self):
+        order = Order.objects.create(user=self.user, state="new")
+        OrderItem.objects.create(order=order, product_info=self.product_infos[1], quantity=1)
+        Order.objects.filter(id=order.id).update(total_sum=0, items_count=0)
+        with self.assertRaises(CommandError):
+            call_command("check_order_totals", stdout=io.StringIO())
+        call_command("check_order_totals", "--fix", stdout=io.StringIO())
+        self.assertEqual(self.totals(), (Decimal("100.00"), 1))
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """
+    Параллельное оформление заказов с общими товарами не продает больше остатка.
+    На SQLite блокировок строк нет, и остаток защищает только условие UPDATE.
+    """
+
+    THREADS = 8
+    ORDERS = 40
+    STOCK = 25
+
+    def test_hot_products(self):
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Связной", user=owner)
+        hot = create_catalog(2, shop, Category.objects.create(name="Смартфоны"), [])
+        ProductInfo.objects.filter(id__in=[product_info.id for product_info in hot]).update(quantity=self.STOCK)
+        baskets = []
+        for i in range(self.ORDERS):
+            user = User.objects.create_user(username=f"buyer{i}", email=f"buyer{i}@example.com", is_active=True)
+            contact = Contact.objects.create(user=user, city="Москва", street="Тверская", phone="+79990000000")
+            order = Order.objects.create(user=user, state="basket")
+            # Позиции добавлены в разном порядке, блокировки все равно берутся по id
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_info=product_info, quantity=1)
+                for product_info in (hot if i % 2 else hot[::-1])
+            ])
+            baskets.append((user.id, order.id, contact.id))
+
+        def place(arguments: tuple[int, int, int]) -> None:
+            try:
+                # SQLite вместо ожидания отвечает ошибкой блокировки базы, такое оформление повторяется
+                for _ in range(500):
+                    try:
+                        basket.checkout(*arguments)
+                        return
+                    except OperationalError:
+                        time.sleep(0.005)
+                raise AssertionError(f"Корзина {arguments[1]} не оформлена")
+            except basket.OutOfStock:
+                return
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            list(executor.map(place, baskets))
+
+        self.assertEqual(
+            list(ProductInfo.objects.filter(id__in=[product_info.id for product_info in hot]).values_list(
+                "quantity", flat=True
+            )),
+            [0, 0]
+        )
+        self.assertEqual(Order.objects.filter(state="new").count(), self.STOCK)
+
+
+class IdempotencyTests(TestCase):
+    """Повтор изменяющего запроса с тем же Idempotency-Key получает сохраненный ответ"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Связной", user=self.owner)
+        self.product_infos = create_catalog(2, shop, Category.objects.create(name="Смартфоны"), [])
+
+    def add(self, key: str, quantity: int = 1):
+        return self.client.post(
+            reverse("basket"), {"items": [{"product_info": self.product_infos[0].id, "quantity": quantity}]},
+            format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replay(self):
+        for store in ("db", "cache"):
+            with self.subTest(store=store), override_settings(IDEMPOTENCY_STORE=store):
+                OrderItem.objects.all().delete()
+                first = self.add(f"{store}-1")
+                # Повтор - одно чтение ключа по индексу, без выполнения запроса
+                with self.assertNumQueries(1 if store == "db" else 0):
+                    repeated = self.add(f"{store}-1")
+                self.assertEqual(repeated.status_code, first.status_code)
+                self.assertEqual(repeated.content, first.content)
+                self.assertEqual(repeated["Idempotent-Replayed"], "true")
+                self.assertNotIn("Idempotent-Replayed", first)
+                # Товар добавлен один раз
+                self.assertEqual(OrderItem.objects.get().quantity, 1)
+                self.assertEqual(self.add(f"{store}-1", 2).status_code, 422)
+                self.add(f"{store}-2")
+                self.assertEqual(OrderItem.objects.get().quantity, 2)
+
+    def test_checkout(self):
+        self.add("basket")
+        basket = Order.objects.get(user=self.user)
+        contact = Contact.objects.create(user=self.user, city="Москва", street="Тверская", phone="+79990000000")
+        sent = len(mail.outbox)
+        responses = [
+            self.client.post(
+                reverse("orders"), {"basket_id": basket.id, "contact_id": contact.id},
+                format="json", HTTP_IDEMPOTENCY_KEY="checkout"
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(len(mail.outbox), sent + 1)
+        self.assertEqual(ProductInfo.objects.get(id=self.product_infos[0].id).quantity, 4)
+
+    def test_in_flight(self):
+        with mock.patch("app.idempotency.fingerprint", return_value="request"):
+            self.assertIsNone(DatabaseStore().begin(self.user.id, "key", "request"))
+            self.assertEqual(self.add("key").status_code, 409)
+            # Брошенный запрос перестает блокировать ключ по истечении IDEMPOTENCY_LOCK_TIMEOUT
+            IdempotencyKey.objects.update(expires_at=datetime.now(timezone.utc))
+            self.assertEqual(self.add("key").status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+    def test_generic_views(self):
+        # Ключи разных пользователей не пересекаются; вложенный вызов update не считается повтором
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = f"/api/v1/products/partner/{self.product_infos[0].id}/"
+        responses = [
+            client.patch(url, {"quantity": 7}, format="json", HTTP_IDEMPOTENCY_KEY="basket") for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(responses[1]["Idempotent-Replayed"], "true")
+
+    def test_purge(self):
+        for i in range(5):
+            self.add(f"key-{i}")
+        IdempotencyKey.objects.filter(key="key-0").update(expires_at=datetime.now(timezone.utc))
+        with override_settings(IDEMPOTENCY_MAX_KEYS=3):
+            call_command("purge_idempotency_keys", stdout=io.StringIO())
+        self.assertEqual(sorted(IdempotencyKey.objects.values_list("key", flat=True)), ["key-2", "key-3", "key-4"])
+
+
+class FastSerializerTests(TestCase):
+    """Быстрая сериализация совпадает с сериализаторами DRF"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        shop = Shop.objects.create(name="Магазин", user=owner)
+        parameters = [Parameter.objects.create(name="Цвет"), Parameter.objects.create(name="Память")]
+        self.product_infos = create_catalog(5, shop, Category.objects.create(name="Смартфоны"), parameters)
+        # Товар без параметров
+        self.product_infos[-1].product_parameters.all().delete()
+
+        contact = Contact.objects.create(
+            user=self.user, city="Москва", street="Ленина", house="1", building="2", apartment="3",
+            phone="+79990000000"
+        )
+        for state, order_contact in [("new", contact), ("confirmed", None), ("basket", None)]:
+            order = Order.objects.create(user=self.user, state=state, contact=order_contact)
+            for quantity, product_info in enumerate(self.product_infos[:3], start=1):
+                OrderItem.objects.create(order=order, product_info=product_info, quantity=quantity)
+        # Заказ без позиций
+        Order.objects.create(user=self.user, state="new")
+
+    def test_product_info(self):
+        queryset = catalog.product_info_queryset().order_by("id")
+        with self.assertNumQueries(2):
+            fast = FastSerializer(ProductInfoSerializer).serialize(queryset)
+        self.assertEqual(fast, ProductInfoSerializer(queryset, many=True).data)
+
+    def test_orders(self):
+        queryset = Order.objects.filter(user=self.user).select_related("contact").order_by("id")
+        self.assertEqual(
+            FastSerializer(OrderSerializer).serialize(queryset), OrderSerializer(queryset, many=True).data
+        )
+
+        response = self.client.get(reverse("orders"))
+        expected = OrderSerializer(queryset.exclude(state="basket").order_by("-dt", "-id"), many=True).data
+        self.assertEqual(response.json()["results"], expected)
+
+        response = self.client.get(reverse("basket"))
+        self.assertEqual(response.json(), OrderSerializer(queryset.filter(state="basket"), many=True).data)
+
+    def test_unsupported_fields(self):
+        # Связь многие-ко-многим (shops) не выражается одной колонкой .values()
+        with self.assertRaises(TypeError):
+            FastSerializer(CategorySerializer)
+
+
+class FastJSONTests(TestCase):
+    """Рендерер и парсер на orjson дают тот же JSON, что и стандартные"""
+
+    data = {
+        "price": Decimal("100.50"),
+        "dt": datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "name": "Смартфон\u2028",
+        1: [None, True, 1.5],
+    }
+
+    def test_renderer(self):
+        for orjson in (fast_json.orjson, None):
+            with self.subTest(orjson=orjson is not None), mock.patch.object(fast_json, "orjson", orjson):
+                rendered = FastJSONRenderer().render(self.data)
+                self.assertEqual(rendered, JSONRenderer().render(self.data))
+                # С отступами - обычный JSONRenderer
+                indented = FastJSONRenderer().render(self.data, "application/json; indent=4")
+                self.assertEqual(indented, JSONRenderer().render(self.data, "application/json; indent=4"))
+
+    def test_json_response(self):
+        for orjson in (fast_json.orjson, None):
+            with self.subTest(orjson=orjson is not None), mock.patch.object(fast_json, "orjson", orjson):
+                response = fast_json.JsonResponse(self.data)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(json.loads(response.content), json.loads(DjangoJsonResponse(self.data).content))
+        with self.assertRaises(TypeError):
+            fast_json.JsonResponse([1])
+
+    def test_parser(self):
+        body = json.dumps({"items": [{"name": "Смартфон", "price": 1.5, "quantity": 2}]}).encode()
+        for orjson in (fast_json.orjson, None):
+            with self.subTest(orjson=orjson is not None), mock.patch.object(fast_json, "orjson", orjson):
+                self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), json.loads(body))
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(io.BytesIO(b'{"items": NaN}'))
+
+        user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse("basket"), b"{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class PartnerExportTests(TestCase):
+    """Потоковая выгрузка товаров партнера"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Магазин", user=self.owner)
+        parameters = [Parameter.objects.create(name="Цвет"), Parameter.objects.create(name="Память")]
+        self.product_infos = create_catalog(5, self.shop, Category.objects.create(name="Смартфоны"), parameters)
+        self.product_infos[0].product_parameters.filter(parameter=parameters[1]).delete()
+        facets.refresh_shop(self.shop.id)
+
+        other = User.objects.create_user(username="other", email="other@example.com", type="shop", is_active=True)
+        create_catalog(2, Shop.objects.create(name="Другой", user=other), Category.objects.create(name="Чехлы"), [])
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_ndjson(self):
+        # Товары читаются пачками: запрос товаров и по запросу параметров на каждую пачку
+        # (плюс точка сохранения транзакции выгрузки)
+        with mock.patch.object(export, "EXPORT_CHUNK_SIZE", 2), self.assertNumQueries(1 + 3 + 2):
+            response = self.client.get("/api/v1/products/partner/export/")
+            content = b"".join(response.streaming_content)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(rows, self.client.get("/api/v1/products/partner/").json())
+        self.assertEqual([row["id"] for row in rows], [product_info.id for product_info in self.product_infos])
+
+        # Фильтры списка применяются и к выгрузке
+        response = self.client.get("/api/v1/products/partner/export/", {"product": self.product_infos[1].product.name})
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+
+    def test_csv(self):
+        response = self.client.get("/api/v1/products/partner/export/", {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+
+        # Выгрузка в формате импорта CSV
+        sections = dict(parse_csv(io.BytesIO(b"".join(response.streaming_content))))
+        self.assertEqual(sections["shop"], "Магазин")
+        self.assertEqual(sections["categories"], [{"name": "Смартфоны"}])
+        items = list(sections["items"])
+        self.assertEqual(len(items), 5)
+        self.assertEqual(items[0]["name"], self.product_infos[0].product.name)
+        self.assertEqual(items[0]["price"], "100.00")
+        self.assertEqual(items[0]["parameters"], [{"Цвет": "Цвет 0"}])
+        self.assertEqual(items[1]["parameters"], [{"Цвет": "Цвет 1"}, {"Память": "Память 1"}])
+
+    def test_unsupported_format(self):
+        self.assertEqual(self.client.get("/api/v1/products/partner/export/", {"format": "xml"}).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/v1/products/partner/export/").status_code, 403)
+
+
+class SparseFieldsTests(TestCase):
+    """Параметры fields и expand: форма ответа и запросы только к нужным таблицам"""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.owner = User.objects.create_user(username="shop", email="shop@example.com", type="shop", is_active=True)
+        self.shop = Shop.objects.create(name="Магазин", user=self.owner)
+        parameters = [Parameter.objects.create(name="Цвет"), Parameter.objects.create(name="Память")]
+        self.product_infos = create_catalog(3, self.shop, Category.objects.create(name="Смартфоны"), parameters)
+
+        contact = Contact.objects.create(
+            user=self.user, city="Москва", street="Ленина", house="1", building="2", apartment="3",
+            phone="+79990000000"
+        )
+        for state in ("new", "basket"):
+            order = Order.objects.create(user=self.user, state=state, contact=contact)
+            for product_info in self.product_infos[:2]:
+                OrderItem.objects.create(order=order, product_info=product_info, quantity=2)
+
+    def get(self, url: str, params: dict, queries: int | None = None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        if queries is not None:
+            self.assertEqual(len(context.captured_queries), queries)
+        return response, " ".join(query["sql"] for query in context.captured_queries)
+
+    def test_products(self):
+        response, sql = self.get(reverse("products"), {"fields": "id,price"})
+        self.assertEqual(response.data["results"][0], {
+            "id": self.product_infos[0].id, "price": "100.00"
+        })
+        # Документ магазина не выбирается, если магазин не раскрыт
+        self.assertNotIn("shop_document", sql)
+
+        response, _ = self.get(reverse("products"), {"expand": "shop"})
+        item = response.data["results"][0]
+        self.assertEqual(item["shop"]["name"], "Магазин")
+        self.assertEqual(item["product"], self.product_infos[0].product_id)
+        self.assertEqual(
+            item["product_parameters"],
+            list(self.product_infos[0].product_parameters.order_by("id").values_list("id", flat=True))
+        )
+
+        response, _ = self.get(reverse("product", args=[self.product_infos[0].id]), {"fields": "id,shop"}, 1)
+        self.assertEqual(response.data, {"id": self.product_infos[0].id, "shop": self.shop.id})
+
+    def test_orders(self):
+        # Отметка изменений и заказы, без позиций, контактов и суммы
+        response, sql = self.get(reverse("orders"), {"fields": "id,state"}, 2)
+        self.assertEqual(list(response.json()["results"][0]), ["id", "state"])
+        self.assertNotIn("app_orderitem", sql.split("FROM", 2)[-1])
+
+        response, _ = self.get(reverse("orders"), {"fields": "id,order_items,total_sum", "expand": "contact"}, 3)
+        order = response.json()["results"][0]
+        self.assertEqual(list(order), ["id", "contact", "order_items", "total_sum"])
+        self.assertEqual(order["contact"]["city"], "Москва")
+        self.assertEqual(len(order["order_items"]), 2)
+        self.assertIsInstance(order["order_items"][0], int)
+        self.assertEqual(order["total_sum"], "400.00")
+
+        response, _ = self.get(reverse("basket"), {"fields": "id,contact"}, 2)
+        self.assertEqual(response.json(), [{"id": Order.objects.get(state="basket").id, "contact": order["contact"]["id"]}])
+
+    def test_orders_cursor_without_ordering_fields(self):
+        # Поля порядка (dt, id) выбираются для курсора, но не выводятся
+        Order.objects.create(user=self.user, state="new")
+        response, _ = self.get(reverse("orders"), {"fields": "state", "limit": 1})
+        data = response.json()
+        self.assertEqual(data["results"], [{"state": "new"}])
+        response = self.client.get(data["next"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [{"state": "new"}])
+        self.assertIsNone(response.json()["next"])
+
+    def test_partner(self):
+        self.client.force_authenticate(self.owner)
+        response, _ = self.get("/api/v1/products/partner/", {}, 2)
+        expected = ProductInfoUpdateDestroySerializer(catalog.product_info_queryset().order_by("id"), many=True).data
+        self.assertEqual(response.json(), expected)
+
+        response, sql = self.get("/api/v1/products/partner/", {"fields": "id,quantity"}, 1)
+        self.assertEqual(response.json()[0], {"id": self.product_infos[0].id, "quantity": 5})
+        # Товар соединяется только для порядка списка, его колонки не выбираются
+        self.assertNotIn('"app_product"."name" AS "', sql)
+
+        response, _ = self.get(
+            f"/api/v1/products/partner/{self.product_infos[0].id}/", {"fields": "price", "expand": "product"}
+        )
+        self.assertEqual(response.json(), {
+            "product": {"id": self.product_infos[0].product_id, "name": "Магазин 0",
+                        "categories": self.product_infos[0].product.categories_id},
+            "price": "100.00"
+        })
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse("products"), {"fields": "id,secret", "expand": "price"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"]), {"fields", "expand"})
+        self.assertEqual(self.client.get(reverse("orders"), {"fields": "password"}).status_code, 400)
+
+
+def full_scans(queryset, tables: list[str]) -> list[str]:
+    """
+    Строки плана запроса с полным просмотром таблиц: SCAN без индекса
+    в SQLite, Seq Scan в PostgreSQL
+    """
+
+    pattern = re.compile(
+        rf"(?:\bSCAN ({'|'.join(tables)})(?: AS \w+)?(?! USING)\b)|(?:Seq Scan on ({'|'.join(tables)})\b)"
+    )
+    return [line for line in queryset.explain().splitlines() if pattern.search(line)]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Планы горячих запросов на большом наборе данных: фильтры списков
+    должны идти по индексам, а не полным просмотром таблиц
+    """
+
+    SHOPS = 10
+    PRODUCTS_PER_SHOP = 1000
+    BUYERS = 100
+    ORDERS_PER_BUYER = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        category = Category.objects.create(name="Смартфоны")
+        parameter = Parameter.objects.create(name="Цвет")
+        cls.owners = User.objects.bulk_create([
+            User(username=f"shop{i}", email=f"shop{i}@example.com", type="shop", is_active=True)
+            for i in range(cls.SHOPS)
+        ])
+        # Последний магазин закрыт
+        shops = Shop.objects.bulk_create([
+            Shop(name=f"Магазин {i}", user=owner, state=i < cls.SHOPS - 1) for i, owner in enumerate(cls.owners)
+        ])
+        product_infos = []
+        for shop in shops:
+            products = Product.objects.bulk_create([
+                Product(name=f"{shop.name} товар {i}", categories=category) for i in range(cls.PRODUCTS_PER_SHOP)
+            ])
+            product_infos += ProductInfo.objects.bulk_create([
+                ProductInfo(
+                    product=product, shop=shop, price=Decimal(rng.randrange(100, 100000)),
+                    price_rrc=Decimal("0"), quantity=1
+                )
+                for product in products
+            ])
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info=product_info, parameter=parameter, value=rng.choice(["черный", "белый"]))
+            for product_info in product_infos
+        ])
+        catalog.rebuild()
+
+        cls.buyers = User.objects.bulk_create([
+            User(username=f"buyer{i}", email=f"buyer{i}@example.com", is_active=True) for i in range(cls.BUYERS)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(user=buyer, state="basket" if i == 0 else "new")
+            for buyer in cls.buyers
+            for i in range(cls.ORDERS_PER_BUYER)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info=product_info, quantity=1)
+            for order in orders
+            for product_info in rng.sample(product_infos, 3)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def view_queryset(self, view_class, user: User, params: dict | None = None, kwargs: dict | None = None,
+                      **initkwargs):
+        """Выборка представления с фильтрами, порядком и размером страницы, как при запросе"""
+
+        request = Request(APIRequestFactory().get("/", params or {}))
+        request.user = user
+        view = view_class(request=request, args=(), kwargs=kwargs or {}, format_kwarg=None, **initkwargs)
+        queryset = view.filter_queryset(view.get_queryset())
+        ordering = view.get_ordering() if hasattr(view, "get_ordering") else getattr(view, "ordering", None)
+        if ordering:
+            queryset = queryset.order_by(*ordering)[:50]
+        return queryset
+
+    def assertNoFullScan(self, queryset, *tables: str) -> None:
+        self.assertEqual(full_scans(queryset, list(tables)), [], queryset.explain())
+
+    def test_catalog(self):
+        buyer = self.buyers[0]
+        for params in (
+            {},
+            {"shop": "Магазин 3"},
+            {"product": "Магазин 3 товар 7"},
+            {"price_min": "1000", "price_max": "1500"},
+            {"best": "true"},
+        ):
+            with self.subTest(params=params):
+                self.assertNoFullScan(self.view_queryset(ProductInfoListView, buyer, params), "app_catalogentry")
+
+    def test_offers(self):
+        product_info = ProductInfo.objects.order_by("id").first()
+        queryset = self.view_queryset(
+            ProductOffersView, self.buyers[0], kwargs={"product_id": product_info.product_id}
+        )
+        self.assertNoFullScan(queryset, "app_catalogentry")
+        self.assertIn("catalog_offer_price_idx", queryset.explain())
+
+    def test_partner_products(self):
+        queryset = self.view_queryset(
+            PartnerProductInfoViewSet, self.owners[0], {"price_min": "1000", "price_max": "1500"}, action="list"
+        )
+        self.assertNoFullScan(queryset, "app_productinfo", "app_shop")
+        self.assertIn("product_info_shop_price_idx", queryset.explain())
+
+    def test_orders(self):
+        buyer = self.buyers[0]
+        self.assertNoFullScan(Order.objects.filter(user_id=buyer.id, state="basket"), "app_order")
+        self.assertNoFullScan(self.view_queryset(OrderView, buyer), "app_order", "app_orderitem")
+
+    def test_partner_orders(self):
+        self.assertNoFullScan(
+            self.view_queryset(PartnerOrderView, self.owners[0]), "app_order", "app_orderitem", "app_productinfo"
+        )
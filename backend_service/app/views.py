@@ -1,19 +1,21 @@
-import json
+from collections import Counter
 
 from django.contrib.auth.password_validation import validate_password
-from django.http import JsonResponse, Http404
+from django.http import StreamingHttpResponse
 from django.core.exceptions import ValidationError
-from django.db.models import Q, Sum, F
-from django.db import transaction, IntegrityError
+from django.db.models import OuterRef, Prefetch, Q
+from django.db import transaction
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.request import Request
+from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import ValidationError
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.generics import (
     CreateAPIView,
     RetrieveUpdateDestroyAPIView,
@@ -31,20 +33,36 @@ from app.permissions import (
     IsProductInfoOwnerOrAdmin,
     IsContactOwnerOrAdmin,
 )
-from app.renderers import UserJSONRenderer
+from app.basket import OutOfStock, add_items, checkout, delete_items, update_items
+from app.cache import (
+    CachedListMixin, GLOBAL_VERSION, PRODUCTS_VERSION, get_or_set, get_versions, normalized_query, shop_ids,
+    shop_version
+)
+from app.catalog import product_info_queryset
+from app.conditional import ConditionalGetMixin, catalog_watermark, conditional_get, orders_watermark
+from app.export import export_csv, export_ndjson, export_parameters
+from app.fast_json import JsonResponse
+from app.idempotency import IdempotentMixin, idempotent
+from app.pagination import KeysetPagination
+from app.renderers import CSVRenderer, NDJSONRenderer, UserJSONRenderer
+from app.search import get_search_backend
 from app.signals import new_order
-from app.filters import ProductInfoFilter
+from app.sparse import SparseFieldsMixin
+from app import facets, order_totals
+from app.filters import CatalogEntryFilter, ProductInfoFilter
+from app.formats import PARSERS, detect_format
+from app.jobs import enqueue_import
 from app.models import (
     Shop,
     Category,
-    Product,
     ProductInfo,
-    Parameter,
-    ProductParameter,
+    CatalogEntry,
     User,
     Order,
     OrderItem,
     Contact,
+    ImportJob,
+    MAX_ITEM_QUANTITY,
 )
 from app.serializers import (
     LoginSerializer,
@@ -53,12 +71,16 @@ from app.serializers import (
     UserSerializer,
     ShopSerializer,
     CategorySerializer,
+    CatalogEntrySerializer,
     ProductInfoSerializer,
     ProductInfoUpdateDestroySerializer,
     OrderSerializer,
     OrderUpdateDestroySerializer,
-    OrderItemSerializer,
+    BasketItemSerializer,
+    BasketItemUpdateSerializer,
+    BasketItemDeleteSerializer,
     ContactSerializer,
+    ImportJobSerializer,
 )
 
 
@@ -74,70 +96,38 @@ class ImportItemView(APIView):
 
     permission_classes = (IsAuthenticated,)
 
+    @idempotent
     def post(self, request: Request):
         if request.user.type != "shop":
             return JsonResponse({'Error': "Импорт доступен только для магазинов"}, status=403)
 
-        json_file = request.FILES.get("file")
-        if json_file:
-            try:
-                data = json.load(json_file)
-            except Exception:
-                return JsonResponse({"Error": "Неверный формат файла"}, status=400)
-            
-            with transaction.atomic():
-                try:
-                    shop, _ = Shop.objects.get_or_create(name=data["shop"], user_id=request.user.id)
-                except IntegrityError:
-                    return JsonResponse({"Error": "У пользователя уже есть магазин"}, status=400)
-
-                categories = data.get("categories")
-                if categories is None:
-                    return JsonResponse({"Error": "Отсутствуют категории"}, status=400)
-                for category in categories:
-                    category, _ = Category.objects.get_or_create(name=category["name"])
-                    category.shops.add(shop.id)
-                    category.save()
-            
-                items = data.get("items")
-                if items is None:
-                    return JsonResponse({"Error": "Отсутствуют товары"}, status=400)
-                product_infos = []
-                product_parameters = []
-                for item in items:
-                    product, _ = Product.objects.get_or_create(name=item["name"], categories_id=item["category"])
-                    product_info = ProductInfo(
-                        product=product,
-                        shop=shop,
-                        price=item["price"],
-                        price_rrc=item["price_rrc"],
-                        quantity=item["quantity"]
-                    )
-                    product_infos.append(product_info)
-
-                    # Обработка параметров
-                    parameters = item.get("parameters")
-                    if parameters is None:
-                        return JsonResponse({"Error": "Отсутствуют параметры"}, status=400)
-                    
-                    for parameter in parameters:
-                        for name, value in parameter.items():
-                            parameter, _ = Parameter.objects.get_or_create(name=name)
-                            product_parameters.append(ProductParameter(
-                                product_info=product_info,
-                                parameter=parameter,
-                                value=value
-                            ))
-
-                # Пакетное создание объектов
-                ProductInfo.objects.bulk_create(product_infos)
-                ProductParameter.objects.bulk_create(product_parameters)
-
-            return JsonResponse({"message": "Успешно"}, status=200)
+        file = request.FILES.get("file")
+        if file:
+            # Формат можно указать явно, иначе он определяется по имени и типу файла
+            file_format = request.data.get("format") or detect_format(file.content_type, file.name)
+            if file_format not in PARSERS:
+                return JsonResponse({"Error": "Неподдерживаемый формат файла"}, status=400)
+
+            # Файл сохраняется, а импорт выполняет воркер (run_import_worker)
+            job = enqueue_import(request.user, file, file_format)
+            return JsonResponse({"job_id": job.id, "state": job.state}, status=202)
         else:
             return JsonResponse({"Error": "Файл не загружен"}, status=400)
 
 
+class ImportJobView(RetrieveAPIView):
+    """Класс для получения статуса задачи импорта"""
+
+    serializer_class = ImportJobSerializer
+    permission_classes = (IsAuthenticated,)
+    lookup_url_kwarg = "job_id"
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return ImportJob.objects.all()
+        return ImportJob.objects.filter(user=self.request.user)
+
+
 class RegisterView(CreateAPIView):
     """Класс для регистрации пользователя"""
 
@@ -200,6 +190,8 @@ class UserListView(ListAPIView):
 
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ("email", "id")
 
     def get_queryset(self):
         # Если пользователь администратор, возвращаем всех пользователей
@@ -218,12 +210,15 @@ class UserDetailView(RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, IsSelfUserOrAdmin)
 
 
-class ShopListView(ListAPIView):
+class ShopListView(CachedListMixin, ListAPIView):
     """Класс для получения списка магазинов"""
     
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ("name", "id")
+    cache_name = "shops"
 
 
 class ShopDetailView(UpdateAPIView, DestroyAPIView):
@@ -234,12 +229,22 @@ class ShopDetailView(UpdateAPIView, DestroyAPIView):
     permission_classes = (IsAuthenticated, IsShopOwnerOrAdmin)
 
 
-class CategoryListView(ListAPIView):
+class CategoryListView(CachedListMixin, ListAPIView):
     """Класс для получения списка категорий"""
     
-    queryset = Category.objects.all()
+    # Статистика - одним соединением, магазины - одним запросом на страницу
+    queryset = Category.objects.select_related("stats").prefetch_related(
+        Prefetch("shops", queryset=Shop.objects.only("id"))
+    )
     serializer_class = CategorySerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ("name", "id")
+    cache_name = "categories"
+
+    def get_cache_versions(self, request: Request) -> list[str]:
+        # Количество товаров и цены меняются вместе с товарами
+        return [GLOBAL_VERSION, PRODUCTS_VERSION]
 
 
 class CategoryDetailView(UpdateAPIView, DestroyAPIView):
@@ -249,117 +254,276 @@ class CategoryDetailView(UpdateAPIView, DestroyAPIView):
     serializer_class = CategorySerializer
     permission_classes = (IsAuthenticated, IsCategoryOwnerOrAdmin)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # Название категории входит в поисковый индекс товаров
+        get_search_backend().reindex(
+            ProductInfo.objects.filter(product__categories=serializer.instance).values_list("id", flat=True)
+        )
 
-class ProductInfoListView(ListAPIView):
+
+class CatalogEntrySparseFieldsMixin(SparseFieldsMixin):
+    """fields и expand для карточек каталога в формате ProductInfoSerializer"""
+
+    sparse_serializer_class = ProductInfoSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.expands("shop"):
+            return queryset.defer("shop_document")
+        return queryset
+
+
+class ProductInfoListView(CatalogEntrySparseFieldsMixin, ConditionalGetMixin, CachedListMixin, ListAPIView):
     """Класс для получения полного списка товаров со всеми параметрами"""
     
-    queryset = ProductInfo.objects.filter(Q(shop__state=True))
-    serializer_class = ProductInfoSerializer
+    # Карточки читаются из каталога для чтения, без соединений и вложенных сериализаторов
+    queryset = CatalogEntry.objects.filter(shop_state=True)
+    serializer_class = CatalogEntrySerializer
     permission_classes = (IsAuthenticated,)
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = ProductInfoFilter
-
-
-class ProductInfoView(RetrieveAPIView):
+    filterset_class = CatalogEntryFilter
+    pagination_class = KeysetPagination
+    ordering = ("product_name", "pk")
+    cache_name = "products"
+
+    def get_watermark(self, request: Request):
+        # Лучшие предложения магазина зависят от цен в других магазинах
+        if CatalogEntryFilter.best_requested(request.query_params):
+            return catalog_watermark()
+        return catalog_watermark(request.query_params.get("shop"))
+
+    def get_cache_versions(self, request: Request) -> list[str]:
+        # Список товаров одного магазина не сбрасывается изменениями в других магазинах
+        shop = request.query_params.get("shop")
+        if not shop or CatalogEntryFilter.best_requested(request.query_params):
+            return [GLOBAL_VERSION, PRODUCTS_VERSION]
+        global_version, = get_versions([GLOBAL_VERSION])
+        return [GLOBAL_VERSION, *(shop_version(shop_id) for shop_id in shop_ids(shop, global_version))]
+
+    def get_ordering(self):
+        # Результаты поиска выводятся по релевантности
+        if self.request.query_params.get("q"):
+            return ("-rank", "pk")
+        return self.ordering
+
+    def list(self, request: Request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        if not CatalogEntryFilter.narrows_shop_catalog(request.query_params):
+            response.data["facets"] = facets.get_facets(queryset, shop=request.query_params.get("shop"))
+            return response
+
+        # Фасеты отфильтрованной выборки считаются группировкой по ее товарам. Они одинаковы
+        # для всех страниц и полей ответа, поэтому кэшируются по фильтрам под версиями каталога
+        query = normalized_query(request, exclude=(
+            self.paginator.cursor_query_param, self.paginator.page_size_query_param, "fields", "expand"
+        ))
+        response.data["facets"] = get_or_set("facets", query, self.cache_versions, lambda: facets.get_facets(
+            queryset, narrowed=True, parameters="product_info__product_parameters"
+        ))
+        return response
+
+
+class ProductInfoView(CatalogEntrySparseFieldsMixin, RetrieveAPIView):
     """Класс для получения полной информации о товаре"""
     
-    queryset = ProductInfo.objects.filter(Q(shop__state=True))
-    serializer_class = ProductInfoSerializer
+    queryset = CatalogEntry.objects.filter(shop_state=True)
+    serializer_class = CatalogEntrySerializer
     permission_classes = (IsAuthenticated,)
 
 
-class PartnerProductInfoViewSet(ModelViewSet):
+class ProductOffersView(CatalogEntrySparseFieldsMixin, ConditionalGetMixin, CachedListMixin, ListAPIView):
+    """Класс для получения предложений товара во всех открытых магазинах, от самого дешевого"""
+
+    # Порядок совпадает с индексом catalog_offer_price_idx, первое предложение - лучшее
+    queryset = CatalogEntry.objects.filter(shop_state=True, quantity__gt=0).order_by("price", "pk")
+    serializer_class = CatalogEntrySerializer
+    permission_classes = (IsAuthenticated,)
+    # Предложений товара не больше, чем магазинов
+    pagination_class = None
+    cache_name = "offers"
+
+    def get_queryset(self):
+        return super().get_queryset().filter(product_id=self.kwargs["product_id"])
+
+    def get_watermark(self, request: Request):
+        return catalog_watermark()
+
+    def get_cache_versions(self, request: Request) -> list[str]:
+        return [GLOBAL_VERSION, PRODUCTS_VERSION]
+
+
+class PartnerProductInfoViewSet(IdempotentMixin, SparseFieldsMixin, ModelViewSet):
     """Класс для получения, обновления и удаления товаров для партнера"""
     
     def get_queryset(self):
-        return ProductInfo.objects.filter(Q(shop__user=self.request.user))
+        if self.action == "retrieve":
+            # Карточка строится из .values(), магазин с владельцем нужен для проверки прав
+            return ProductInfo.objects.filter(shop__user=self.request.user).select_related("shop__user")
+        return product_info_queryset().filter(Q(shop__user=self.request.user))
 
     serializer_class = ProductInfoUpdateDestroySerializer
     permission_classes = (IsAuthenticated, IsProductInfoOwnerOrAdmin)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ProductInfoFilter
 
+    # Чтение через быструю сериализацию: выбираются только колонки и связи запрошенных полей
+    def list(self, request: Request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        return Response(serializer.render(list(serializer.values(self.filter_queryset(self.get_queryset())))))
+
+    def retrieve(self, request: Request, *args, **kwargs):
+        instance = self.get_object()
+        return Response(self.get_fast_serializer().serialize(ProductInfo.objects.filter(pk=instance.pk))[0])
+
+    # Поисковый индекс и фасеты обновляются в одной транзакции с товаром
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        get_search_backend().reindex([serializer.instance.id])
+        facets.apply_delta(facets.parameter_values([serializer.instance.id]))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        before = facets.parameter_values([serializer.instance.id])
+        super().perform_update(serializer)
+        # Название товара общее для всех магазинов, поэтому переиндексируются все его предложения
+        get_search_backend().reindex(
+            ProductInfo.objects.filter(product_id=serializer.instance.product_id).values_list("id", flat=True)
+        )
+        delta = facets.parameter_values([serializer.instance.id])
+        delta.subtract(before)
+        facets.apply_delta(delta)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        product_info_id = instance.id
+        delta = Counter()
+        delta.subtract(facets.parameter_values([product_info_id]))
+        super().perform_destroy(instance)
+        get_search_backend().reindex([product_info_id])
+        facets.apply_delta(delta)
+
+    @action(detail=False, methods=["get"], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request: Request):
+        """
+        Потоковая выгрузка всех товаров партнера: ?format=ndjson (по умолчанию) или ?format=csv.
+        Фильтры те же, что и у списка.
+        """
+
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        if renderer.format == "csv":
+            content = export_csv(queryset, export_parameters(request.user))
+        else:
+            content = export_ndjson(queryset)
+        content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="products.{renderer.format}"'
+        return response
+
 
-class BasketListView(APIView):
+class BasketListView(SparseFieldsMixin, APIView):
     """Класс для получения, обновления, удаления товаров из корзины"""
 
     permission_classes = (IsAuthenticated,)
+    sparse_serializer_class = OrderSerializer
+
+    def get_watermark(self, request: Request):
+        return orders_watermark(Order.objects.filter(user_id=request.user.id, state="basket"))
 
+    @conditional_get
     def get(self, request: Request):
         """Метод для получения списка товаров в корзине"""
         
-        # Получение корзины пользователя
-        basket = Order.objects.filter(
-            user_id=request.user.id, state="basket").prefetch_related(
-            "order_items__product_info__product__categories",
-            "order_items__product_info__product_parameters__parameter").annotate(
-            total_sum=Sum(
-                F("order_items__quantity") * F("order_items__product_info__price"))
-            ).distinct()
-        
-        serializer = OrderSerializer(basket, many=True)
-        return JsonResponse(serializer.data, status=200, safe=False)
+        # Получение корзины пользователя; сумма хранится в заказе
+        basket = Order.objects.filter(user_id=request.user.id, state="basket")
+        return JsonResponse(self.get_fast_serializer().serialize(basket), status=200, safe=False)
     
+    @idempotent
     def post(self, request: Request):
         """Метод для добавления товара в корзину"""
         
         items_basket = request.data.get("items")
         if items_basket:
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state="basket")
-            order_items = []
+            serializer = BasketItemSerializer(data=items_basket, many=True)
+            if not serializer.is_valid():
+                return JsonResponse({"Errors": serializer.errors}, status=400)
+
+            # Повторы одного товара в запросе складываются
+            quantities = Counter()
+            for item in serializer.validated_data:
+                quantities[item["product_info"]] += item["quantity"]
+
+            # Все товары и статус их магазинов проверяются одним запросом
+            available = set(ProductInfo.objects.filter(id__in=quantities, shop__state=True).values_list(
+                "id", flat=True
+            ))
+            unavailable = sorted(quantities.keys() - available)
+            if unavailable:
+                return JsonResponse({"Errors": {
+                    "product_info": f"Товары не найдены или магазин не принимает заказы: "
+                                    f"{', '.join(map(str, unavailable))}"
+                }}, status=400)
+
             # Вызываем конекстный менеджер для атомарности операции
             with transaction.atomic():
-                for item in items_basket:
-                    item.update({"order": basket.id})
-                    serializer = OrderItemSerializer(data=item)
-                    if serializer.is_valid():
-                        order_items.append(serializer.validated_data)
-                    else:
-                        return JsonResponse({"Errors": serializer.errors}, status=400)
-                OrderItem.objects.bulk_create([OrderItem(**data) for data in order_items])
-
-            return JsonResponse({"Message": "Успешно", "Создано объектов": len(order_items)}, status=200)
+                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state="basket")
+                rejected = sorted(add_items(basket.id, quantities))
+                if rejected:
+                    transaction.set_rollback(True)
+                    return JsonResponse({"Errors": {
+                        "quantity": f"Количество товара должно быть не более {MAX_ITEM_QUANTITY}: "
+                                    f"{', '.join(map(str, rejected))}"
+                    }}, status=400)
+
+            return JsonResponse({"Message": "Успешно", "Создано объектов": len(quantities)}, status=200)
         return JsonResponse({"Errors": "Не указаны все необходимые аргументы"}, status=400)
     
+    @idempotent
     def patch(self, request: Request):
         """Метод для обновления количества товара в корзине"""
         
         items_basket = request.data.get("items")
         if items_basket:
-            try:
-                basket = Order.objects.get_object_or_404(user_id=request.user.id, state="basket")
-            except Http404:
-                return JsonResponse({"Errors": "Корзина не найдена"}, status=404)
-            update_items = 0
+            serializer = BasketItemUpdateSerializer(data=items_basket, many=True)
+            if not serializer.is_valid():
+                return JsonResponse({"Errors": serializer.errors}, status=400)
+
+            # При повторе позиции в запросе побеждает последнее количество
+            quantities = {item["id"]: item["quantity"] for item in serializer.validated_data}
             # Вызываем конекстный менеджер для атомарности операции
             with transaction.atomic():
-                for item in items_basket:
-                    serializer = OrderItemSerializer(data=item)
-                    if serializer.is_valid():
-                        try:
-                            order_item = OrderItem.objects.get_object_or_404(order_id=basket.id, id=item["id"])
-                        except Http404:
-                            return JsonResponse({"Errors": "Элемент корзины не найден"}, status=404)
-                        else:
-                            order_item.quantity = item["quantity"]
-                            order_item.save()
-                            update_items += 1
-                    else:
-                        return JsonResponse({"Errors": serializer.errors}, status=400)
-
-            return JsonResponse({"Message": "Успешно", "Обновлено объектов": update_items}, status=200)
+                updated, rejected = update_items(request.user.id, quantities)
+
+            return JsonResponse({
+                "Message": "Успешно", "Обновлено объектов": len(updated), "Обновлены": updated, "Отклонены": rejected
+            }, status=200)
         return JsonResponse({"Errors": "Не указаны все необходимые аргументы"}, status=400)
     
+    @idempotent
     def delete(self, request: Request):
-        """Метод для удаления товаров из корзины"""
+        """Метод для удаления товаров из корзины (без списка items - всей корзины)"""
         
-        try:
-            basket = Order.objects.get_object_or_404(user_id=request.user.id, state="basket")
-        except Http404:
+        items_basket = request.data.get("items")
+        if items_basket:
+            serializer = BasketItemDeleteSerializer(data=items_basket, many=True)
+            if not serializer.is_valid():
+                return JsonResponse({"Errors": serializer.errors}, status=400)
+
+            with transaction.atomic():
+                deleted, rejected = delete_items(request.user.id, {item["id"] for item in serializer.validated_data})
+
+            return JsonResponse({
+                "Message": "Успешно", "Удалено объектов": len(deleted), "Удалены": deleted, "Отклонены": rejected
+            }, status=200)
+
+        deleted, _ = Order.objects.filter(user_id=request.user.id, state="basket").delete()
+        if not deleted:
             return JsonResponse({"Errors": "Корзина не найдена"}, status=404)
-        else:
-            basket.delete()
-            return JsonResponse({"Message": "Успешно"}, status=200)
+        return JsonResponse({"Message": "Успешно"}, status=200)
 
 
 class ContactViewSet(ModelViewSet):
@@ -379,23 +543,31 @@ class ContactViewSet(ModelViewSet):
 
 
 
-class OrderView(ListCreateAPIView):
+class OrderView(SparseFieldsMixin, ConditionalGetMixin, ListCreateAPIView):
     """Класс для получения, размещения заказов пользователя"""
     
     def get_queryset(self):
-        return Order.objects.filter(
-            user_id=self.request.user.id).exclude(state="basket").prefetch_related(
-            "order_items__product_info__product__categories",
-            "order_items__product_info__product_parameters__parameter"
-            ).select_related("contact").annotate(
-            total_sum=Sum(
-                F("order_items__quantity") *
-                F("order_items__product_info__price")
-            )).distinct()
+        # Заказы читаются через .values(): соединения добавляют только запрошенные поля
+        return Order.objects.filter(user_id=self.request.user.id).exclude(state="basket")
     
     serializer_class = OrderSerializer
     permission_classes = (IsAuthenticated,)
-
+    pagination_class = KeysetPagination
+    ordering = ("-dt", "-id")
+
+    def get_watermark(self, request: Request):
+        return orders_watermark(Order.objects.filter(user_id=request.user.id).exclude(state="basket"))
+
+    def list(self, request: Request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        # Колонки порядка нужны курсору, даже если fields их не включает
+        queryset = serializer.values(
+            self.filter_queryset(self.get_queryset()), *(field.lstrip("-") for field in self.ordering)
+        )
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(serializer.render(page))
+
+    @idempotent
     def post(self, request: Request):
         """Метод для размещения заказа"""
         
@@ -411,26 +583,35 @@ class OrderView(ListCreateAPIView):
             return JsonResponse({"Errors": "Контакт не найден"}, status=400)
         
         try:
-            basket = Order.objects.get_object_or_404(user_id=self.request.user.id, state="basket", id=basket_id)
-        except Http404:
+            placed = checkout(self.request.user.id, basket_id, contact_id)
+        except OutOfStock as error:
+            return JsonResponse(
+                {"Errors": {"quantity": "Недостаточно товара на складе", "product_info": error.product_info_ids}},
+                status=409
+            )
+        if not placed:
             return JsonResponse({"Errors": "Корзина не найдена"}, status=404)
-        else:
-            basket.update(state="new", contact_id=contact_id)
-            new_order.send(sender=Order, user_id=self.request.user.id)
-            return JsonResponse({"Message": "Заказ успешно размещен"}, status=200)
+        new_order.send(sender=Order, user_id=self.request.user.id)
+        return JsonResponse({"Message": "Заказ успешно размещен"}, status=200)
 
 
-class PartnerOrderView(ListAPIView, UpdateAPIView):
+class PartnerOrderView(IdempotentMixin, ListAPIView, UpdateAPIView):
     """Класс для получения и обновления заказов партнером"""
 
     permission_classes = (IsAuthenticated,)
     serializer_class = OrderUpdateDestroySerializer
+    pagination_class = KeysetPagination
+    ordering = ("-dt", "-id")
     
     def get_queryset(self):
-        return Order.objects.filter(
-            order_items__product_info__shop__user_id=self.request.user.id
-            ).exclude(state='basket').annotate(
-            total_sum=Sum(
-                F("order_items__quantity") *
-                F("order_items__product_info__price")
-            )).distinct()
+        # Подзапрос вместо соединения с позициями: заказ не повторяется и не требует distinct
+        return Order.objects.filter(id__in=OrderItem.objects.filter(
+            product_info__shop__user_id=self.request.user.id
+        ).values("order_id")).exclude(state='basket').annotate(
+            shop_total_sum=order_totals.shop_sum(OuterRef("pk"), self.request.user.id)
+        )
+
+    def perform_update(self, serializer):
+        serializer.save()
+        # Сумма позиций магазина после изменения
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
@@ -68,6 +68,16 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    # JSON через orjson (если установлен), см. app/fast_json.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'app.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 WSGI_APPLICATION = 'backend_service.wsgi.application'
@@ -126,6 +136,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files (price lists waiting for import)
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -140,4 +155,37 @@ EMAIL_USE_SSL = False
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
+# Import settings
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_JOB_TIMEOUT = int(os.getenv('IMPORT_JOB_TIMEOUT', 3600))
+IMPORT_USE_COPY = os.getenv('IMPORT_USE_COPY', 'true').lower() == 'true'
 
+# Cache settings
+# Без CACHE_LOCATION используется кэш в памяти процесса, иначе - файловый кэш в этом каталоге
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    } if os.getenv('CACHE_LOCATION') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+# Кэш ответов каталога (товары, категории, магазины) и время жизни ответа, с
+CATALOG_CACHE = os.getenv('CATALOG_CACHE', 'default')
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Idempotency settings
+# Хранилище ответов на запросы с Idempotency-Key: db (таблица IdempotencyKey) или cache (IDEMPOTENCY_CACHE)
+IDEMPOTENCY_STORE = os.getenv('IDEMPOTENCY_STORE', 'db')
+IDEMPOTENCY_CACHE = os.getenv('IDEMPOTENCY_CACHE', 'default')
+# Время хранения ответа и время, через которое незавершенный запрос перестает блокировать ключ, с
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+# Наибольшее число ключей в таблице: лишние самые старые удаляет purge_idempotency_keys
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', 1000000))
+
+# Search settings
+# Конфигурация полнотекстового поиска PostgreSQL (словарь и стемминг)
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
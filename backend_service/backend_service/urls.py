@@ -18,11 +18,11 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from app.views import (
-    ImportItemView, RegisterView, LoginView, ConfirmEmailView,
+    ImportItemView, ImportJobView, RegisterView, LoginView, ConfirmEmailView,
     UserDetailView, UserListView,
     CategoryListView, CategoryDetailView,
     ShopListView, ShopDetailView,
-    PartnerProductInfoViewSet, ProductInfoListView, ProductInfoView,
+    PartnerProductInfoViewSet, ProductInfoListView, ProductInfoView, ProductOffersView,
     BasketListView,
     ContactViewSet,
     OrderView,
@@ -36,6 +36,7 @@ router.register("products/partner", PartnerProductInfoViewSet, basename="product
 urlpatterns = [
     path("api/v1/admin/", admin.site.urls),
     path("api/v1/import/", ImportItemView.as_view(), name="import-item"),
+    path("api/v1/import/<uuid:job_id>/", ImportJobView.as_view(), name="import-job"),
 
     path("api/v1/users/", UserListView.as_view(), name="users"),
     path("api/v1/users/register/", RegisterView.as_view(), name="register"),
@@ -51,6 +52,7 @@ urlpatterns = [
 
     path("api/v1/products/", ProductInfoListView.as_view(), name="products"),
     path("api/v1/products/<int:pk>", ProductInfoView.as_view(), name="product"),
+    path("api/v1/products/<int:product_id>/offers", ProductOffersView.as_view(), name="product-offers"),
 
     path("api/v1/basket/", BasketListView.as_view(), name="basket"),
 